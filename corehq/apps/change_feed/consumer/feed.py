@@ -16,6 +16,9 @@ from corehq.apps.change_feed.exceptions import UnknownDocumentStore
 from corehq.apps.change_feed.topics import validate_offsets
 
 MIN_TIMEOUT = 500
+# when iterating forever, yield None after this long without a change (in milliseconds)
+# so that the pillow can process changes it has queued even if the feed is idle
+IDLE_HEARTBEAT_TIMEOUT = 1000
 
 
 class KafkaChangeFeed(ChangeFeed):
@@ -54,7 +57,7 @@ class KafkaChangeFeed(ChangeFeed):
         """
         Since must be a dictionary of topic partition offsets.
         """
-        timeout = float('inf') if forever else MIN_TIMEOUT
+        timeout = IDLE_HEARTBEAT_TIMEOUT if forever else MIN_TIMEOUT
         start_from_latest = since is None
         reset = 'largest' if start_from_latest else 'smallest'
         self._init_consumer(timeout, auto_offset_reset=reset)
@@ -79,20 +82,28 @@ class KafkaChangeFeed(ChangeFeed):
             for topic_partition, offset in since.items():
                 self.consumer.seek(TopicPartition(topic_partition[0], topic_partition[1]), int(offset))
 
-        try:
+        while True:
+            # the consumer stops iterating once it has waited ``timeout`` for a message
             for message in self.consumer:
                 self._processed_topic_offsets[(message.topic, message.partition)] = message.offset
                 yield change_from_kafka_message(message)
-        except StopIteration:
-            assert not forever, 'Kafka pillow should not timeout when waiting forever!'
-            # no need to do anything since this is just telling us we've reached the end of the feed
+            if not forever:
+                # we've reached the end of the feed
+                break
+            yield None
 
-    def get_current_checkpoint_offsets(self):
+    def get_current_checkpoint_offsets(self, processed_offsets=None):
+        """
+        :param processed_offsets: offsets to checkpoint from, if not the offsets of the
+        last change read from the feed
+        """
         # the way kafka works, the checkpoint should increment by 1 because
         # querying the feed is inclusive of the value passed in.
         latest_offsets = self.get_latest_offsets()
+        if processed_offsets is None:
+            processed_offsets = self.get_processed_offsets()
         ret = {}
-        for topic_partition, sequence in self.get_processed_offsets().items():
+        for topic_partition, sequence in processed_offsets.items():
             if sequence == latest_offsets[topic_partition]:
                 # this topic and partition is totally up to date and if we add 1
                 # then kafka will give us an offset out of range error.
@@ -172,8 +183,9 @@ class KafkaCheckpointEventHandler(PillowCheckpointEventHandler):
         assert isinstance(change_feed, KafkaChangeFeed)
         self.change_feed = change_feed
 
-    def get_new_seq(self, change):
-        return self.change_feed.get_current_checkpoint_offsets()
+    def get_new_seq(self, change, context=None):
+        processed_offsets = getattr(context, 'processed_offsets', None)
+        return self.change_feed.get_current_checkpoint_offsets(processed_offsets)
 
 
 def change_from_kafka_message(message):
@@ -110,8 +110,10 @@ from corehq.elastic import (
     SIZE_LIMIT,
     ESError,
     ScanResult,
+    iter_in_parallel,
     run_query,
     scroll_query,
+    scroll_query_partitions,
 )
 
 from . import aggregations, filters, queries
@@ -241,6 +243,38 @@ class ESQuery(object):
             (ESQuerySet.normalize_result(query, r) for r in result)
         )
 
+    def scroll_partitions(self, num_partitions):
+        """
+        Run the query against the scroll api in up to ``num_partitions``
+        independent partitions of the index's shards. Returns a list of
+        iterators, one for each partition, that can be consumed concurrently.
+        """
+        query = deepcopy(self)
+        if query._size is None:
+            query._size = SCROLL_PAGE_SIZE_LIMIT
+        partitions = scroll_query_partitions(
+            query.index, query.raw_query, num_partitions, es_instance_alias=self.es_instance_alias
+        )
+        return [
+            ScanResult(
+                result.count,
+                (ESQuerySet.normalize_result(query, r) for r in result)
+            )
+            for result in partitions
+        ]
+
+    def parallel_scroll(self, num_partitions):
+        """
+        Like ``scroll``, but scrolls up to ``num_partitions`` partitions of the
+        index's shards concurrently. Documents are yielded in the order their
+        partitions return them.
+        """
+        partitions = self.scroll_partitions(num_partitions)
+        return ScanResult(
+            sum(partition.count or 0 for partition in partitions),
+            iter_in_parallel(partitions)
+        )
+
     @property
     def _filters(self):
         return self.es_query['query']['filtered']['filter']['and']
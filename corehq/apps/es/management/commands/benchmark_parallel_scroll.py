@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from corehq.apps.es import CaseES, FormES
+
+QUERIES = {
+    'forms': FormES,
+    'cases': CaseES,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the docs / second of scrolling a domain's forms or cases with a single scroll, "
+        "and with concurrent scrolls over partitions of the index's shards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('--index', choices=list(QUERIES), default='forms')
+        parser.add_argument('--partitions', type=int, nargs='+', default=[2, 4, 8])
+        parser.add_argument('--ids-only', action='store_true', help="Only scroll the ids of the documents")
+
+    def handle(self, domain, **options):
+        query = QUERIES[options['index']]().domain(domain)
+        if options['ids_only']:
+            query = query.exclude_source().size(5000)
+
+        results = [('single scroll', _time_scroll(query.scroll()))]
+        for num_partitions in options['partitions']:
+            results.append((
+                '{} partitions'.format(num_partitions),
+                _time_scroll(query.parallel_scroll(num_partitions)),
+            ))
+
+        single_seconds = results[0][1][1]
+        for name, (num_docs, seconds) in results:
+            print("{:<15} {:>8} docs {:>10.0f} docs / second {:>6.2f}x".format(
+                name, num_docs, num_docs / seconds, single_seconds / seconds
+            ))
+
+
+def _time_scroll(scan_result):
+    num_docs = 0
+    start = time.perf_counter()
+    for _ in scan_result:
+        num_docs += 1
+    return num_docs, time.perf_counter() - start
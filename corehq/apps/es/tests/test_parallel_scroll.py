@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase
+
+from mock import Mock, patch
+
+from corehq.elastic import (
+    ScanResult,
+    _partition_shard_ids,
+    iter_in_parallel,
+    scroll_query_partitions,
+)
+
+
+class IterInParallelTest(SimpleTestCase):
+
+    def test_all_items(self):
+        iterables = [range(0, 2500), range(2500, 3000), range(3000, 3000)]
+        self.assertEqual(sorted(iter_in_parallel(iterables)), list(range(3000)))
+
+    def test_items_of_each_iterable_in_order(self):
+        items = list(iter_in_parallel([range(0, 5000), range(5000, 10000)], chunk_size=10))
+        self.assertEqual([item for item in items if item < 5000], list(range(0, 5000)))
+        self.assertEqual([item for item in items if item >= 5000], list(range(5000, 10000)))
+
+    def test_error(self):
+        def failing():
+            yield 1
+            raise ValueError('scroll failed')
+
+        items = []
+        with self.assertRaises(ValueError):
+            for item in iter_in_parallel([failing(), range(2, 4)], chunk_size=1):
+                items.append(item)
+        self.assertIn(1, items)
+
+    def test_stop_early(self):
+        items = iter_in_parallel([range(100000), range(100000)], chunk_size=10)
+        self.assertEqual(len([next(items) for _ in range(5)]), 5)
+        items.close()
+
+
+class ScrollQueryPartitionsTest(SimpleTestCase):
+
+    def test_partition_shard_ids(self):
+        self.assertEqual(_partition_shard_ids([0, 1, 2, 3, 4], 2), [[0, 2, 4], [1, 3]])
+        self.assertEqual(_partition_shard_ids([0, 1], 4), [[0], [1]])
+        self.assertEqual(_partition_shard_ids([0, 1], 0), [[0, 1]])
+
+    def test_scroll_query_partitions(self):
+        client = Mock()
+        client.search_shards.return_value = {'shards': [
+            [{'shard': shard_id, 'primary': primary} for primary in (True, False)]
+            for shard_id in range(3)
+        ]}
+        with patch('corehq.elastic.get_es_instance', return_value=client), \
+                patch('corehq.elastic.scan', return_value=ScanResult(1, iter([]))) as scan:
+            partitions = scroll_query_partitions('forms', {'query': {}}, 2)
+        self.assertEqual(len(partitions), 2)
+        self.assertEqual(
+            [call[1]['preference'] for call in scan.call_args_list],
+            ['_shards:0,2', '_shards:1'],
+        )
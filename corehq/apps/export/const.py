@@ -92,6 +92,15 @@ SMS_EXPORT = 'sms'
 MAX_EXPORTABLE_ROWS = 100000
 CASE_SCROLL_SIZE = 10000
 
+# Single exports of at least this many documents have their rows generated in parallel
+PARALLEL_EXPORT_MIN_DOCS = 50000
+# Number of documents in each page of a parallel export
+PARALLEL_EXPORT_PAGE_SIZE = 10000
+PARALLEL_EXPORT_MAX_PROCESSES = 4
+PARALLEL_EXPORT_RETRIES_PER_PAGE = 2
+# Number of partitions of the index's shards scrolled concurrently for the ids of an export's documents
+EXPORT_SCROLL_PARTITIONS = 4
+
 # When a question is missing completely from a form/case this should be the value
 MISSING_VALUE = '---'
 # When a question has been answered, but is blank, this should be the value
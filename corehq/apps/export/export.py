@@ -11,7 +11,7 @@ from couchexport.models import Format
 from dimagi.utils.logging import notify_exception
 from soil import DownloadBase
 
-from corehq.apps.export.const import MAX_EXPORTABLE_ROWS
+from corehq.apps.export.const import EXPORT_SCROLL_PARTITIONS, MAX_EXPORTABLE_ROWS
 from corehq.apps.export.dbaccessors import get_properly_wrapped_export_instance
 from corehq.apps.export.esaccessors import (
     get_case_export_base_query,
@@ -281,7 +281,7 @@ def get_export_writer(export_instances, temp_path, allow_pagination=True):
             and EXCEL_EXPORT_DATA_TYPING.enabled(export_instances[0].domain)
         )
 
-    legacy_writer = get_writer(format, use_formatted_cells=format_data_in_excel)
+    legacy_writer = get_writer(format, use_formatted_cells=format_data_in_excel, streaming=True)
 
     if allow_pagination and PAGINATED_EXPORTS.enabled(export_instances[0].domain):
         writer = _PaginatedExportWriter(legacy_writer, temp_path)
@@ -310,7 +310,21 @@ def get_export_download(domain, export_ids, exports_type, username, filters, fil
 def get_export_file(export_instances, filters, temp_path, progress_tracker=None):
     """
     Return an export file for the given ExportInstance and list of filters
+
+    Large single exports are built in parallel. See
+    corehq.apps.export.multiprocess.get_parallel_export_file
     """
+    if len(export_instances) == 1:
+        from corehq.apps.export.multiprocess import (
+            get_parallel_export_file,
+            get_parallel_export_processes,
+        )
+        num_processes = get_parallel_export_processes(get_export_size(export_instances[0], filters))
+        if num_processes:
+            return get_parallel_export_file(
+                export_instances[0], filters, temp_path, num_processes, progress_tracker
+            )
+
     writer = get_export_writer(export_instances, temp_path)
     with writer.open(export_instances):
         for export_instance in export_instances:
@@ -323,7 +337,7 @@ def get_export_file(export_instances, filters, temp_path, progress_tracker=None)
 def get_export_documents(export_instance, filters):
     # Pull doc ids from elasticsearch and stream to disk
     query = _get_export_query(export_instance, filters)
-    return iter_es_docs_from_query(query)
+    return iter_es_docs_from_query(query, num_scroll_partitions=EXPORT_SCROLL_PARTITIONS)
 
 
 def _get_export_query(export_instance, filters):
@@ -357,10 +371,11 @@ def write_export_instance(writer, export_instance, documents, progress_tracker=N
     compute_total = 0
     write_total = 0
     track_load = load_counter(export_instance.type, "export", export_instance.domain)
+    selected_tables = export_instance.selected_tables
 
     for row_number, doc in enumerate(documents):
         total_bytes += sys.getsizeof(doc)
-        for table in export_instance.selected_tables:
+        for table in selected_tables:
             compute_start = _time_in_milliseconds()
             try:
                 rows = table.get_rows(
@@ -477,6 +492,14 @@ def rebuild_export(export_instance, progress_tracker):
     """
     Rebuild the given daily saved ExportInstance
     """
+    from corehq.apps.export.incremental import (
+        rebuild_export_incrementally,
+        supports_incremental_rebuild,
+    )
+    if supports_incremental_rebuild(export_instance):
+        rebuild_export_incrementally(export_instance, progress_tracker)
+        return
+
     filters = export_instance.get_filters()
     with TransientTempfile() as temp_path:
         export_file = get_export_file([export_instance], filters or [], temp_path, progress_tracker)
@@ -484,9 +507,11 @@ def rebuild_export(export_instance, progress_tracker):
             save_export_payload(export_instance, payload)
 
 
-def save_export_payload(export, payload):
+def save_export_payload(export, payload, incremental_rows=None):
     """
     Save the contents of an export file to disk for later retrieval.
+    :param incremental_rows: optional file of the rows the export was built from.
+        See corehq.apps.export.incremental
     """
     if export.last_accessed is None:
         export.last_accessed = datetime.datetime.utcnow()
@@ -495,6 +520,8 @@ def save_export_payload(export, payload):
     try:
         with export.atomic_blobs():
             export.set_payload(payload)
+            if incremental_rows is not None:
+                export.set_incremental_rows(incremental_rows)
     except ResourceConflict:
         # task was executed concurrently, so let first to finish win and abort the rest
         pass
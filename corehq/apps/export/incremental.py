@@ -0,0 +1,232 @@
+"""
+Incremental rebuilds of daily saved exports
+
+A daily saved export that is rebuilt incrementally keeps the rows that were
+generated for each document alongside its payload. The next rebuild only
+generates rows for documents that have been indexed in Elasticsearch since the
+last build, or that have started to match the export's filters. The rows of
+the other documents are copied from the last build, and documents that have
+been deleted or no longer match the filters are dropped.
+
+Rows that depend on other documents, like usernames and case names, are only
+updated with their own document, so exports are rebuilt in full when the rows
+of their last full build are INCREMENTAL_EXPORT_MAX_AGE old. They are also
+rebuilt in full when their tables change.
+
+The IDs of the documents in the export are kept in memory while it is rebuilt,
+so exports of more than INCREMENTAL_EXPORT_MAX_DOCS documents are always
+rebuilt in full, without keeping their rows.
+
+The rows are kept in a gzipped stream of pickles: a header dict, then a
+``(doc_id, rows)`` tuple for each document, where rows is a list of
+``(table index, data, skip_excel_formatting)`` tuples.
+"""
+import contextlib
+import gzip
+import hashlib
+import json
+import pickle
+from datetime import datetime, timedelta
+
+from soil import DownloadBase
+
+from corehq.apps.es import filters
+from corehq.apps.export.export import (
+    _get_export_query,
+    _record_export_duration,
+    _time_in_milliseconds,
+    get_export_writer,
+    save_export_payload,
+)
+from corehq.apps.export.models.new import (
+    CaseExportInstance,
+    ExportRow,
+    FormExportInstance,
+    RowNumberColumn,
+)
+from corehq.elastic import iter_es_docs
+from corehq.toggles import INCREMENTAL_SAVED_EXPORTS
+from corehq.util.datadog.gauges import datadog_counter
+from corehq.util.files import TransientTempfile
+
+INCREMENTAL_ROWS_VERSION = 1
+INCREMENTAL_EXPORT_MAX_AGE = timedelta(days=7)
+INCREMENTAL_EXPORT_MAX_DOCS = 250000
+# documents indexed just before the last build started may not be in its rows
+INDEXING_MARGIN = timedelta(hours=1)
+PROGRESS_UPDATE_FREQUENCY = 100
+
+
+def supports_incremental_rebuild(export_instance):
+    return (
+        export_instance.is_daily_saved_export
+        and isinstance(export_instance, (FormExportInstance, CaseExportInstance))
+        and INCREMENTAL_SAVED_EXPORTS.enabled(export_instance.domain)
+        and _get_export_query(
+            export_instance, export_instance.get_filters() or []
+        ).count() <= INCREMENTAL_EXPORT_MAX_DOCS
+    )
+
+
+def rebuild_export_incrementally(export_instance, progress_tracker=None):
+    """
+    Rebuild the given daily saved ExportInstance, reusing the rows of its last
+    build for documents that haven't changed
+    """
+    start = _time_in_milliseconds()
+    build_date = datetime.utcnow()
+    config_hash = get_export_config_hash(export_instance)
+    query = _get_export_query(export_instance, export_instance.get_filters() or [])
+    doc_ids = set(query.scroll_ids())
+    tables = export_instance.selected_tables
+    row_number_indices = [
+        _get_row_number_indices(table, export_instance.split_multiselects) for table in tables
+    ]
+
+    with TransientTempfile() as temp_path, TransientTempfile() as rows_path:
+        writer = get_export_writer([export_instance], temp_path)
+        with writer.open([export_instance]), \
+                gzip.open(rows_path, 'wb') as rows_file, \
+                _previous_rows(export_instance, config_hash, build_date) as (previous_header, previous_rows):
+            if previous_header:
+                changed_ids = set(query.filter(filters.date_range(
+                    'inserted_at', gte=previous_header['date'] - INDEXING_MARGIN
+                )).scroll_ids())
+                full_build_date = previous_header['full_build_date']
+            else:
+                changed_ids = set()
+                full_build_date = build_date
+            pickler = pickle.Pickler(rows_file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickler.dump({
+                'version': INCREMENTAL_ROWS_VERSION,
+                'config': config_hash,
+                'date': build_date,
+                'full_build_date': full_build_date,
+            })
+
+            def _write_doc_rows(row_number, doc_id, rows):
+                for table_index, data, skip_excel_formatting in rows:
+                    writer.write(tables[table_index], ExportRow(
+                        data=data,
+                        hyperlink_column_indices=tables[table_index].get_hyperlink_column_indices(
+                            export_instance.split_multiselects
+                        ),
+                        skip_excel_formatting=skip_excel_formatting,
+                    ))
+                pickler.dump((doc_id, rows))
+                # each document is only written once, so the pickler doesn't need to remember it
+                pickler.clear_memo()
+                if progress_tracker and row_number % PROGRESS_UPDATE_FREQUENCY == 0:
+                    DownloadBase.set_progress(progress_tracker, row_number, len(doc_ids))
+
+            row_number = 0
+            reused_ids = set()
+            for doc_id, rows in previous_rows:
+                if doc_id in doc_ids and doc_id not in changed_ids:
+                    for table_index, data, skip_excel_formatting in rows:
+                        _renumber_row(data, row_number_indices[table_index], row_number)
+                    _write_doc_rows(row_number, doc_id, rows)
+                    reused_ids.add(doc_id)
+                    row_number += 1
+
+            for doc in iter_es_docs(query.index, sorted(doc_ids - reused_ids)):
+                rows = _get_doc_rows(export_instance, tables, doc, row_number)
+                _write_doc_rows(row_number, doc['_id'], rows)
+                row_number += 1
+
+        if progress_tracker:
+            DownloadBase.set_progress(progress_tracker, row_number, len(doc_ids))
+        with open(temp_path, 'rb') as payload, open(rows_path, 'rb') as incremental_rows:
+            save_export_payload(export_instance, payload, incremental_rows=incremental_rows)
+
+    tags = ['domain:{}'.format(export_instance.domain)]
+    datadog_counter('commcare.exports.incremental.reused_docs', len(reused_ids), tags=tags)
+    datadog_counter('commcare.exports.incremental.built_docs', row_number - len(reused_ids), tags=tags)
+    _record_export_duration(_time_in_milliseconds() - start, export_instance)
+
+
+def get_export_config_hash(export_instance):
+    """
+    :returns: A hash of the parts of the export instance that its rows depend on
+    """
+    config = {
+        'tables': [table.to_json() for table in export_instance.selected_tables],
+        'split_multiselects': export_instance.split_multiselects,
+        'transform_dates': export_instance.transform_dates,
+    }
+    return hashlib.md5(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@contextlib.contextmanager
+def _previous_rows(export_instance, config_hash, build_date):
+    """
+    :yields: tuple of ``(header, rows)`` for the last build, or ``(None, ())``
+        if its rows can't be reused
+    """
+    if not export_instance.has_incremental_rows():
+        yield None, ()
+        return
+
+    fileobj = export_instance.get_incremental_rows()
+    try:
+        records = _iter_pickles(gzip.GzipFile(fileobj=fileobj, mode='rb'))
+        header = next(records, None)
+        if (
+            header
+            and header['version'] == INCREMENTAL_ROWS_VERSION
+            and header['config'] == config_hash
+            and build_date - header['full_build_date'] < INCREMENTAL_EXPORT_MAX_AGE
+        ):
+            yield header, records
+        else:
+            yield None, ()
+    finally:
+        fileobj.close()
+
+
+def _iter_pickles(fileobj):
+    unpickler = pickle.Unpickler(fileobj)
+    while True:
+        try:
+            yield unpickler.load()
+        except EOFError:
+            return
+
+
+def _get_doc_rows(export_instance, tables, doc, row_number):
+    return [
+        (table_index, row.data, row.skip_excel_formatting)
+        for table_index, table in enumerate(tables)
+        for row in table.get_rows(
+            doc,
+            row_number,
+            split_columns=export_instance.split_multiselects,
+            transform_dates=export_instance.transform_dates,
+        )
+    ]
+
+
+def _get_row_number_indices(table, split_columns):
+    """
+    :returns: The indices in the table's rows of the values of its RowNumberColumns
+    """
+    indices = []
+    index = 0
+    for column in table.selected_columns:
+        if isinstance(column, RowNumberColumn):
+            indices.append(index)
+        index += len(column.get_headers(split_column=split_columns))
+    return indices
+
+
+def _renumber_row(data, row_number_indices, row_number):
+    """
+    Set the document's row number in the values of a row's RowNumberColumns,
+    which are its row number joined with its repeat indices, followed by the
+    row number and repeat indices themselves if it has repeat indices
+    """
+    for index in row_number_indices:
+        repeat_indices = data[index].split('.')[1:]
+        data[index] = '.'.join([str(row_number)] + repeat_indices)
+        if repeat_indices:
+            data[index + 1] = row_number
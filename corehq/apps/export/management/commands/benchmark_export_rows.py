@@ -0,0 +1,111 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from corehq.apps.export.models import (
+    ExportColumn,
+    PathNode,
+    RowNumberColumn,
+    ScalarItem,
+    TableConfiguration,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the rows / second generated for a synthetic form export with a value "
+        "looked up by each column, and with the table's compiled row builder"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--columns', type=int, default=300, help='Number of form question columns')
+        parser.add_argument('--forms', type=int, default=2000, help='Number of forms')
+        parser.add_argument('--repeats', type=int, default=5, help='Repeat group iterations per form')
+
+    def handle(self, **options):
+        forms = [
+            _get_form(index, options['columns'], options['repeats'])
+            for index in range(options['forms'])
+        ]
+        tables = [
+            _get_table([], options['columns']),
+            _get_table([PathNode(name='form'), PathNode(name='repeat', is_repeat=True)], options['columns'] // 10),
+        ]
+        print("Columns: {}, forms: {}, repeats: {}".format(
+            options['columns'], options['forms'], options['repeats']
+        ))
+        for table in tables:
+            by_column = _time_rows(table, forms, _get_rows_by_column)
+            compiled = _time_rows(table, forms, _get_compiled_rows)
+            print("Table {}".format('.'.join(node.name for node in table.path) or 'form'))
+            for name, (num_rows, seconds) in [('by column', by_column), ('compiled', compiled)]:
+                print("  {:<12}{:.0f} rows / second".format(name, num_rows / seconds))
+            print("  Speedup: {:.2f}x".format(by_column[1] / compiled[1]))
+
+
+def _get_form(index, num_columns, num_repeats):
+    questions = {'q{}'.format(i): 'value {} {}'.format(index, i) for i in range(num_columns)}
+    questions['group'] = {'q{}'.format(i): {'#text': 'value', 'id': str(i)} for i in range(num_columns // 10)}
+    questions['repeat'] = [
+        {'q{}'.format(i): 'value {}'.format(i) for i in range(num_columns // 10)}
+        for repeat in range(num_repeats)
+    ]
+    return {
+        'domain': 'benchmark',
+        '_id': 'form{}'.format(index),
+        'received_on': '2019-11-01T10:30:00.000000Z',
+        'form': questions,
+    }
+
+
+def _get_table(path, num_columns):
+    base_path = [node.name for node in path] or ['form']
+    column_paths = [base_path + ['q{}'.format(i)] for i in range(num_columns)]
+    if not path:
+        column_paths = [['received_on']] + column_paths + [
+            ['form', 'group', 'q{}'.format(i)] for i in range(num_columns // 10)
+        ]
+    return TableConfiguration(
+        path=path,
+        columns=[RowNumberColumn(label='number', selected=True)] + [
+            ExportColumn(
+                item=ScalarItem(path=[
+                    PathNode(name=name, is_repeat=name == 'repeat') for name in column_path
+                ]),
+                label=column_path[-1],
+                selected=True,
+            )
+            for column_path in column_paths
+        ]
+    )
+
+
+def _time_rows(table, forms, get_rows):
+    num_rows = 0
+    start = time.perf_counter()
+    for row_number, form in enumerate(forms):
+        num_rows += len(get_rows(table, form, row_number))
+    return num_rows, time.perf_counter() - start
+
+
+def _get_compiled_rows(table, form, row_number):
+    return table.get_rows(form, row_number, transform_dates=True)
+
+
+def _get_rows_by_column(table, form, row_number):
+    return get_rows_by_column(table, form, row_number, transform_dates=True)
+
+
+def get_rows_by_column(table, document, row_number, transform_dates=False):
+    """The rows of the table with the value of each column from its own get_value"""
+    rows = []
+    for doc_row in table._get_sub_documents(document, row_number, document_id=document['_id']):
+        row = []
+        for column in table.selected_columns:
+            value = column.get_value(
+                document['domain'], document['_id'], doc_row.doc, table.path,
+                row_index=doc_row.row, transform_dates=transform_dates,
+            )
+            row.extend(value if isinstance(value, list) else [value])
+        rows.append(row)
+    return rows
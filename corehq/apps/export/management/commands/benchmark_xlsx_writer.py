@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from couchexport.export import FormattedRow
+from couchexport.writers import (
+    Excel2007ExportWriter,
+    StreamingExcel2007ExportWriter,
+)
+
+WRITERS = {
+    'openpyxl': Excel2007ExportWriter,
+    'streaming': StreamingExcel2007ExportWriter,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the time and peak memory of the openpyxl and streaming XLSX export writers. "
+        "Each writer runs in its own process, so that their peak memory use is measured separately."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--columns', type=int, default=100)
+        parser.add_argument('--writers', nargs='+', choices=list(WRITERS), default=sorted(WRITERS))
+        parser.add_argument('--formatted-cells', action='store_true', help='Format values as numbers and dates')
+
+    def handle(self, **options):
+        print("Rows: {rows}, columns: {columns}, formatted cells: {formatted_cells}".format(**options))
+        for name in options['writers']:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_run_writer, args=(
+                queue, WRITERS[name], options['rows'], options['columns'], options['formatted_cells']
+            ))
+            process.start()
+            seconds, max_rss_kb, file_size = queue.get()
+            process.join()
+            print("{:<10} {:>10.0f} rows / second {:>10.1f} MB peak memory {:>10.1f} MB file".format(
+                name, options['rows'] / seconds, max_rss_kb / 1024, file_size / 1024 / 1024
+            ))
+
+
+def _run_writer(queue, writer_class, num_rows, num_columns, formatted_cells):
+    writer = writer_class(use_formatted_cells=formatted_cells)
+    headers = ['column {}'.format(column) for column in range(num_columns)]
+    with tempfile.TemporaryFile() as file_:
+        start = time.perf_counter()
+        writer.open([('table', [headers])], file_, table_titles={'table': 'Benchmark'})
+        for row in range(num_rows):
+            writer.write_row('table', FormattedRow([
+                row * column if column % 4 == 0 else 'value {} {}'.format(row, column)
+                for column in range(num_columns)
+            ]))
+        writer.close()
+        seconds = time.perf_counter() - start
+        file_size = os.fstat(file_.fileno()).st_size
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, file_size))
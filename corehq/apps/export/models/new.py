@@ -112,6 +112,7 @@ from corehq.util.timezones.utils import get_timezone_for_domain
 from corehq.util.view_utils import absolute_reverse
 
 DAILY_SAVED_EXPORT_ATTACHMENT_NAME = "payload"
+INCREMENTAL_EXPORT_ATTACHMENT_NAME = "incremental_rows"
 
 
 ExcelFormatValue = namedtuple('ExcelFormatValue', 'format value')
@@ -285,50 +286,19 @@ class ExportColumn(DocumentSchema):
         Transform the given value with the transform specified in self.item.transform.
         Also transform dates if the transform_dates flag is true.
         """
+        return self.get_transform_function(transform_dates)(value, doc)
 
-        # When XML elements have additional attributes in them, the text node is
-        # put inside of the #text key. For example:
-        #
-        # <element id="123">value</element>  -> {'#text': 'value', 'id':'123'}
-        #
-        # Whereas elements without additional attributes just take on the string value:
-        #
-        # <element>value</element>  -> 'value'
-        #
-        # This line ensures that we grab the actual value instead of the dictionary
-        if isinstance(value, dict):
-            if '#text' in value:
-                value = value.get('#text')
-            else:
-                return EMPTY_VALUE
-
-        if transform_dates:
-            value = couch_to_excel_datetime(value, doc)
-        if self.item.transform:
-            value = TRANSFORM_FUNCTIONS[self.item.transform](value, doc)
-        if self.deid_transform:
-            try:
-                value = DEID_TRANSFORM_FUNCTIONS[self.deid_transform](value, doc)
-            except ValueError:
-                # Unable to convert the string to a date
-                pass
-        if value is None:
-            value = MISSING_VALUE
-
-        if isinstance(value, list):
-            def _serialize(str_or_dict):
-                """
-                Serialize old data for scalar questions that were previously a repeat
-
-                This is a total edge case. See https://manage.dimagi.com/default.asp?280549.
-                """
-                if isinstance(str_or_dict, dict):
-                    return ','.join('{}={}'.format(k, v) for k, v in str_or_dict.items())
-                else:
-                    return str_or_dict
-
-            value = ' '.join(_serialize(elem) for elem in value)
-        return value
+    def get_transform_function(self, transform_dates):
+        """
+        :returns: A function of (value, doc) that does the same as self._transform,
+            with the transforms looked up once rather than for each value
+        """
+        return partial(
+            _transform_value,
+            transform_dates=transform_dates,
+            transform=TRANSFORM_FUNCTIONS[self.item.transform] if self.item.transform else None,
+            deid_transform=DEID_TRANSFORM_FUNCTIONS[self.deid_transform] if self.deid_transform else None,
+        )
 
     @staticmethod
     def create_default_from_export_item(table_path, item, app_ids_and_versions, auto_select=True):
@@ -442,6 +412,52 @@ class ExportColumn(DocumentSchema):
             return super(ExportColumn, cls).wrap(data)
 
 
+def _transform_value(value, doc, transform_dates, transform, deid_transform):
+    # When XML elements have additional attributes in them, the text node is
+    # put inside of the #text key. For example:
+    #
+    # <element id="123">value</element>  -> {'#text': 'value', 'id':'123'}
+    #
+    # Whereas elements without additional attributes just take on the string value:
+    #
+    # <element>value</element>  -> 'value'
+    #
+    # This line ensures that we grab the actual value instead of the dictionary
+    if isinstance(value, dict):
+        if '#text' in value:
+            value = value.get('#text')
+        else:
+            return EMPTY_VALUE
+
+    if transform_dates:
+        value = couch_to_excel_datetime(value, doc)
+    if transform:
+        value = transform(value, doc)
+    if deid_transform:
+        try:
+            value = deid_transform(value, doc)
+        except ValueError:
+            # Unable to convert the string to a date
+            pass
+    if value is None:
+        value = MISSING_VALUE
+
+    if isinstance(value, list):
+        def _serialize(str_or_dict):
+            """
+            Serialize old data for scalar questions that were previously a repeat
+
+            This is a total edge case. See https://manage.dimagi.com/default.asp?280549.
+            """
+            if isinstance(str_or_dict, dict):
+                return ','.join('{}={}'.format(k, v) for k, v in str_or_dict.items())
+            else:
+                return str_or_dict
+
+        value = ' '.join(_serialize(elem) for elem in value)
+    return value
+
+
 class DocRow(namedtuple("DocRow", ["doc", "row"])):
     """
     DocRow represents a document and its row index.
@@ -503,57 +519,15 @@ class TableConfiguration(DocumentSchema):
         assert domain is not None, 'Form or Case must be associated with domain'
         assert document_id is not None, 'Form or Case must have an id'
 
-        rows = []
-        for doc_row in sub_documents:
-            doc, row_index = doc_row.doc, doc_row.row
-
-            row_data = {} if as_json else []
-            col_index = 0
-            skip_excel_formatting = []
-            for col in self.selected_columns:
-                val = col.get_value(
-                    domain,
-                    document_id,
-                    doc,
-                    self.path,
-                    row_index=row_index,
-                    split_column=split_columns,
-                    transform_dates=transform_dates,
-                )
-                if as_json:
-                    for index, header in enumerate(col.get_headers(split_column=split_columns)):
-                        if isinstance(val, list):
-                            row_data[header] = "{}".format(val[index])
-                        else:
-                            row_data[header] = "{}".format(val)
-                elif isinstance(val, list):
-                    row_data.extend(val)
-
-                    # we never want to auto-format RowNumberColumn
-                    # (always treat as text)
-                    next_col_index = col_index + len(val)
-                    if isinstance(col, RowNumberColumn):
-                        skip_excel_formatting.extend(
-                            list(range(col_index, next_col_index))
-                        )
-                    col_index = next_col_index
-                else:
-                    row_data.append(val)
+        row_builder = self._get_row_builder(split_columns, transform_dates)
+        return [
+            row_builder.get_row(domain, document_id, doc_row.doc, doc_row.row, as_json)
+            for doc_row in sub_documents
+        ]
 
-                    # we never want to auto-format RowNumberColumn
-                    # (always treat as text)
-                    if isinstance(col, RowNumberColumn):
-                        skip_excel_formatting.append(col_index)
-                    col_index += 1
-            if as_json:
-                rows.append(row_data)
-            else:
-                rows.append(ExportRow(
-                    data=row_data,
-                    hyperlink_column_indices=self.get_hyperlink_column_indices(split_columns),
-                    skip_excel_formatting=skip_excel_formatting
-                ))
-        return rows
+    @memoized
+    def _get_row_builder(self, split_columns, transform_dates):
+        return TableRowBuilder(self, split_columns, transform_dates)
 
     def get_column_new(self, item_path, item_doc_type, column_transform):
         """
@@ -675,6 +649,114 @@ class TableConfiguration(DocumentSchema):
         return TableConfiguration._get_sub_documents_helper(document_id, path[1:], new_docs)
 
 
+class TableRowBuilder(object):
+    """
+    Builds the rows of a TableConfiguration for a given split_columns and transform_dates.
+
+    The work that is the same for every row is done once: the path of each ExportColumn
+    relative to the table is resolved to a parent path and a property name, columns that
+    share a parent path look it up once per row, and transforms are looked up up front.
+    Columns of other types get their values from their own get_value.
+    """
+
+    def __init__(self, table, split_columns, transform_dates):
+        self.table_path = table.path
+        self.split_columns = split_columns
+        self.transform_dates = transform_dates
+        self.hyperlink_column_indices = table.get_hyperlink_column_indices(split_columns)
+
+        base_path = list(table.path)
+        parent_path_indices = {}
+        self.parent_paths = []
+        # list of (parent path index, property name, transform function, column)
+        # where the parent path index is None for columns that get their own values
+        self.columns = []
+        for column in table.selected_columns:
+            item_path = list(column.item.path)
+            if (type(column) is ExportColumn
+                    and len(item_path) > len(base_path)
+                    and item_path[:len(base_path)] == base_path):
+                path = tuple(node.name for node in item_path[len(base_path):])
+                parent_path = path[:-1]
+                if parent_path not in parent_path_indices:
+                    parent_path_indices[parent_path] = len(self.parent_paths)
+                    self.parent_paths.append(parent_path)
+                self.columns.append((
+                    parent_path_indices[parent_path],
+                    path[-1],
+                    column.get_transform_function(transform_dates),
+                    column,
+                ))
+            else:
+                self.columns.append((None, None, None, column))
+        self.headers = [column.get_headers(split_column=split_columns) for column in table.selected_columns]
+
+    def get_row(self, domain, document_id, doc, row_index, as_json=False):
+        parents = [_get_nested_dict(doc, path) for path in self.parent_paths]
+
+        row_data = {} if as_json else []
+        col_index = 0
+        skip_excel_formatting = []
+        for (parent_index, name, transform, col), headers in zip(self.columns, self.headers):
+            if parent_index is None:
+                val = col.get_value(
+                    domain,
+                    document_id,
+                    doc,
+                    self.table_path,
+                    row_index=row_index,
+                    split_column=self.split_columns,
+                    transform_dates=self.transform_dates,
+                )
+            else:
+                parent = parents[parent_index]
+                val = transform(parent.get(name) if parent is not None else None, doc)
+            if as_json:
+                for index, header in enumerate(headers):
+                    if isinstance(val, list):
+                        row_data[header] = "{}".format(val[index])
+                    else:
+                        row_data[header] = "{}".format(val)
+            elif isinstance(val, list):
+                row_data.extend(val)
+
+                # we never want to auto-format RowNumberColumn
+                # (always treat as text)
+                next_col_index = col_index + len(val)
+                if isinstance(col, RowNumberColumn):
+                    skip_excel_formatting.extend(
+                        list(range(col_index, next_col_index))
+                    )
+                col_index = next_col_index
+            else:
+                row_data.append(val)
+
+                # we never want to auto-format RowNumberColumn
+                # (always treat as text)
+                if isinstance(col, RowNumberColumn):
+                    skip_excel_formatting.append(col_index)
+                col_index += 1
+        if as_json:
+            return row_data
+        return ExportRow(
+            data=row_data,
+            hyperlink_column_indices=self.hyperlink_column_indices,
+            skip_excel_formatting=skip_excel_formatting
+        )
+
+
+def _get_nested_dict(doc, path):
+    """
+    :returns: The dict at path in doc, or None if there isn't one. Like
+        NestedDictGetter, but for a path that may be empty.
+    """
+    for name in path:
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(name)
+    return doc if isinstance(doc, dict) else None
+
+
 class DatePeriod(DocumentSchema):
     period_type = StringProperty(required=True)
     days = IntegerProperty()
@@ -1097,6 +1179,19 @@ class ExportInstance(BlobMixin, Document):
         """
         return self.fetch_attachment(DAILY_SAVED_EXPORT_ATTACHMENT_NAME, stream=stream)
 
+    def has_incremental_rows(self):
+        return INCREMENTAL_EXPORT_ATTACHMENT_NAME in self.blobs
+
+    def set_incremental_rows(self, rows_file):
+        """
+        Set the rows of the last incremental build of this instance.
+        See corehq.apps.export.incremental
+        """
+        self.put_attachment(rows_file, INCREMENTAL_EXPORT_ATTACHMENT_NAME)
+
+    def get_incremental_rows(self):
+        return self.fetch_attachment(INCREMENTAL_EXPORT_ATTACHMENT_NAME, stream=True)
+
     def copy_export(self):
         export_json = self.to_json()
         del export_json['_id']
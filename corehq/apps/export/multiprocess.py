@@ -9,6 +9,11 @@ To rebuild an export run the following:
 You can also use the MultiprocessExporter class to have more control over the process.
 See the 'process_skipped_pages' management command for an example.
 
+Single exports of at least PARALLEL_EXPORT_MIN_DOCS documents, including downloads
+and daily saved exports, are built by ``get_parallel_export_file``, which uses the
+same page dumps but merges the rows generated for each page into one export file,
+in page order.
+
 The export works as follows:
   * Dump raw docs from ES into files of size N docs
   * Once each file is complete add it to a multiprocessing Queue
@@ -23,26 +28,47 @@ import json
 import logging
 import multiprocessing
 import os
+import pickle
+import sys
 import tempfile
 import time
 import zipfile
 from collections import namedtuple
 from datetime import timedelta
 
+from django.db import connections
+
+import billiard
 from six.moves.queue import Empty
 
 from couchexport.export import get_writer
 from couchexport.writers import ZippedExportWriter
-
+from dimagi.utils.logging import notify_exception
+from soil import DownloadBase
+
+from corehq.apps.export.const import (
+    PARALLEL_EXPORT_MAX_PROCESSES,
+    PARALLEL_EXPORT_MIN_DOCS,
+    PARALLEL_EXPORT_PAGE_SIZE,
+    PARALLEL_EXPORT_RETRIES_PER_PAGE,
+)
 from corehq.apps.export.dbaccessors import get_properly_wrapped_export_instance
 from corehq.apps.export.export import (
+    ExportFile,
+    _record_datadog_export_compute_rows,
+    _record_datadog_export_duration,
+    _record_datadog_export_write_rows,
+    _record_export_duration,
+    _time_in_milliseconds,
     get_export_documents,
     get_export_size,
     get_export_writer,
     save_export_payload,
     write_export_instance,
 )
+from corehq.apps.export.models.new import ExportRow
 from corehq.elastic import ScanResult
+from corehq.util.datadog.utils import load_counter
 from corehq.util.files import safe_filename
 
 TEMP_FILE_PREFIX = 'cchq_export_dump_'
@@ -54,6 +80,18 @@ logger = logging.getLogger(__name__)
 
 ProgressValue = namedtuple('ProgressValue', 'page progress total')
 
+# the rows generated for a page of documents, and the sizes and time taken to generate them
+PageRows = namedtuple('PageRows', 'path doc_bytes num_rows compute_duration')
+
+
+class ExportDocumentError(Exception):
+    """The rows of a document could not be generated in a worker process"""
+
+    def __init__(self, doc_id, table_label, message):
+        super(ExportDocumentError, self).__init__(doc_id, table_label, message)
+        self.doc_id = doc_id
+        self.table_label = table_label
+
 
 class BaseResult(object):
     success = False
@@ -80,6 +118,12 @@ class QueuedResult(RetryResult):
         self.async_result = async_result
 
 
+class QueuedPage(QueuedResult):
+    def __init__(self, async_result, page_number, page_path, page_size, retry_count, first_row_number):
+        super(QueuedPage, self).__init__(async_result, page_number, page_path, page_size, retry_count)
+        self.first_row_number = first_row_number
+
+
 class OutputPaginator(object):
     """Helper class to paginate raw export output"""
     def __init__(self, export_id, start_page_count=0):
@@ -95,9 +139,10 @@ class OutputPaginator(object):
         if self.file:
             self.file.close()
         prefix = '{}{}_'.format(TEMP_FILE_PREFIX, self.export_id)
-        fileobj = tempfile.NamedTemporaryFile(prefix=prefix, mode='wb', delete=False)
-        self.path = fileobj.name
-        self.file = gzip.GzipFile(fileobj=fileobj)
+        fd, self.path = tempfile.mkstemp(prefix=prefix)
+        os.close(fd)
+        # the file is closed with the gzip file, so the page is complete once it's closed
+        self.file = gzip.open(self.path, 'wb')
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.file.close()
@@ -113,7 +158,7 @@ class OutputPaginator(object):
 
     def write(self, doc):
         self.page_size += 1
-        self.file.write('{}\n'.format(json.dumps(doc)))
+        self.file.write('{}\n'.format(json.dumps(doc)).encode('utf-8'))
 
     def get_result(self):
         return RetryResult(self.page, self.path, self.page_size, 0)
@@ -199,6 +244,197 @@ def _get_export_file_path(export_instance, docs, progress_tracker=None):
         return writer.path
 
 
+def get_parallel_export_processes(total_docs):
+    """
+    :returns: The number of processes to build an export of `total_docs` documents
+        with, or 0 if it should not be built in parallel
+    """
+    if total_docs < PARALLEL_EXPORT_MIN_DOCS:
+        return 0
+    processes = min(multiprocessing.cpu_count() - 1, PARALLEL_EXPORT_MAX_PROCESSES)
+    return processes if processes > 1 else 0
+
+
+def get_parallel_export_file(export_instance, filters, temp_path, num_processes,
+                             progress_tracker=None, page_size=PARALLEL_EXPORT_PAGE_SIZE):
+    """
+    Like ``get_export_file`` for a single export instance, but the rows for each
+    page of documents are generated in a pool of processes, and then written to
+    the export file in page order. Pages that fail are retried, and the export
+    fails if a page fails PARALLEL_EXPORT_RETRIES_PER_PAGE + 1 times.
+
+    billiard is used rather than multiprocessing because it can start processes
+    from celery workers.
+    """
+    start = _time_in_milliseconds()
+    total_docs = 0
+    pages = []
+    # forked processes must not share the parent's database connections
+    connections.close_all()
+    pool = billiard.Pool(processes=num_processes)
+    try:
+        paginator = OutputPaginator(export_instance.get_id)
+        with paginator:
+            for doc in get_export_documents(export_instance, filters):
+                paginator.write(doc)
+                if paginator.page_size == page_size:
+                    page = paginator.get_result()
+                    # closes the page's file before it is queued
+                    paginator.next_page()
+                    pages.append(_queue_page(pool, export_instance, page, total_docs))
+                    total_docs += page.page_size
+            page = paginator.get_result()
+        if page.page_size:
+            pages.append(_queue_page(pool, export_instance, page, total_docs))
+            total_docs += page.page_size
+        else:
+            os.remove(page.path)
+
+        writer = get_export_writer([export_instance], temp_path)
+        selected_tables = export_instance.selected_tables
+        track_load = load_counter(export_instance.type, "export", export_instance.domain)
+        total_bytes = 0
+        total_rows = 0
+        compute_total = 0
+        write_total = 0
+        with writer.open([export_instance]):
+            docs_written = 0
+            for index, page in enumerate(pages):
+                page_rows = _get_page_rows(pool, export_instance, page)
+                pages[index] = None
+                write_start = _time_in_milliseconds()
+                try:
+                    for table_index, row in _iter_page_rows(page_rows.path):
+                        writer.write(selected_tables[table_index], row)
+                finally:
+                    os.remove(page_rows.path)
+                write_total += _time_in_milliseconds() - write_start
+                total_bytes += page_rows.doc_bytes
+                total_rows += page_rows.num_rows
+                compute_total += page_rows.compute_duration
+                track_load(page.page_size)
+                docs_written += page.page_size
+                if progress_tracker:
+                    DownloadBase.set_progress(progress_tracker, docs_written, total_docs)
+    finally:
+        pool.terminate()
+        for page in pages:
+            if page is not None:
+                _remove_page_files(page)
+
+    end = _time_in_milliseconds()
+    tags = ['format:{}'.format(writer.format)]
+    _record_datadog_export_write_rows(write_total, total_bytes, total_rows, tags)
+    _record_datadog_export_compute_rows(compute_total, total_bytes, total_rows, tags)
+    _record_datadog_export_duration(end - start, total_bytes, total_rows, tags)
+    _record_export_duration(end - start, export_instance)
+    return ExportFile(writer.path, writer.format)
+
+
+def _queue_page(pool, export_instance, page, first_row_number, retry_count=0):
+    logger.debug('Queuing export page %s of %s', page.page, export_instance.get_id)
+    async_result = pool.apply_async(
+        _write_page_rows,
+        args=(export_instance, page.path, page.page_size, first_row_number),
+    )
+    return QueuedPage(async_result, page.page, page.path, page.page_size, retry_count, first_row_number)
+
+
+def _get_page_rows(pool, export_instance, page):
+    while True:
+        try:
+            return page.async_result.get()
+        except Exception as e:
+            if page.retry_count >= PARALLEL_EXPORT_RETRIES_PER_PAGE:
+                if isinstance(e, ExportDocumentError):
+                    notify_exception(None, "Error exporting doc", details={
+                        'domain': export_instance.domain,
+                        'export_instance_id': export_instance.get_id,
+                        'export_table': e.table_label,
+                        'doc_id': e.doc_id,
+                    })
+                    e.sentry_capture = False
+                raise
+            logger.exception(
+                "Error processing export page %s of %s (attempt %s)",
+                page.page, export_instance.get_id, page.retry_count + 1
+            )
+            page = _queue_page(pool, export_instance, page, page.first_row_number, page.retry_count + 1)
+
+
+def _remove_page_files(page):
+    if page.async_result.ready() and page.async_result.successful():
+        os.remove(page.async_result.get().path)
+    if os.path.exists(page.path):
+        os.remove(page.path)
+
+
+def _write_page_rows(export_instance, dump_path, doc_count, first_row_number):
+    """
+    Generate the rows of a page of documents and write them to a temporary file
+
+    :returns: A ``PageRows`` with the path to the file, which has a pickled
+        ``(table index, ExportRow)`` tuple for each row. The dump file is removed
+        once all its rows are written.
+    :raises ExportDocumentError: if the rows of a document can't be generated
+    """
+    docs = _get_export_documents_from_file(dump_path, doc_count)
+    fd, rows_path = tempfile.mkstemp(prefix='{}{}_rows_'.format(TEMP_FILE_PREFIX, export_instance.get_id))
+    os.close(fd)
+    total_bytes = 0
+    total_rows = 0
+    compute_total = 0
+    try:
+        with gzip.open(rows_path, 'wb') as rows_file:
+            pickler = pickle.Pickler(rows_file, protocol=pickle.HIGHEST_PROTOCOL)
+            selected_tables = export_instance.selected_tables
+            for row_number, doc in enumerate(docs, start=first_row_number):
+                total_bytes += sys.getsizeof(doc)
+                for table_index, table in enumerate(selected_tables):
+                    compute_start = _time_in_milliseconds()
+                    try:
+                        rows = table.get_rows(
+                            doc,
+                            row_number,
+                            split_columns=export_instance.split_multiselects,
+                            transform_dates=export_instance.transform_dates,
+                        )
+                    except Exception as e:
+                        # the traceback is not sent back to the parent process
+                        logger.exception("Error exporting doc %s", doc.get('_id'))
+                        raise ExportDocumentError(doc.get('_id'), table.label, repr(e))
+                    compute_total += _time_in_milliseconds() - compute_start
+                    total_rows += len(rows)
+                    for row in rows:
+                        pickler.dump((
+                            table_index,
+                            row.data,
+                            row.hyperlink_column_indices,
+                            row.skip_excel_formatting,
+                        ))
+                # rows are written one at a time, so the pickler doesn't need to remember them
+                pickler.clear_memo()
+    except Exception:
+        os.remove(rows_path)
+        raise
+    return PageRows(rows_path, total_bytes, total_rows, compute_total)
+
+
+def _iter_page_rows(rows_path):
+    with gzip.open(rows_path, 'rb') as rows_file:
+        unpickler = pickle.Unpickler(rows_file)
+        while True:
+            try:
+                table_index, data, hyperlink_column_indices, skip_excel_formatting = unpickler.load()
+            except EOFError:
+                return
+            yield table_index, ExportRow(
+                data=data,
+                hyperlink_column_indices=hyperlink_column_indices,
+                skip_excel_formatting=skip_excel_formatting,
+            )
+
+
 class LoggingProgressTracker(object):
     """Ducktyped class that mimics the interface of a celery task
     to keep track of export progress
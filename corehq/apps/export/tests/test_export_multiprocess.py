@@ -0,0 +1,168 @@
+import json
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from couchexport.models import Format
+
+from corehq.apps.export.const import PARALLEL_EXPORT_MIN_DOCS
+from corehq.apps.export.models import (
+    ExportColumn,
+    FormExportInstance,
+    PathNode,
+    RowNumberColumn,
+    ScalarItem,
+    TableConfiguration,
+)
+from corehq.apps.export.multiprocess import (
+    ExportDocumentError,
+    get_parallel_export_file,
+    get_parallel_export_processes,
+)
+from corehq.util.files import TransientTempfile
+
+
+class FakeAsyncResult(object):
+
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def get(self, timeout=None):
+        if self.error:
+            raise self.error
+        return self.value
+
+    def ready(self):
+        return True
+
+    def successful(self):
+        return self.error is None
+
+
+class FakePool(object):
+    """Runs tasks when they are queued, failing the first attempt at each page in `fail_pages`"""
+
+    def __init__(self, fail_pages=()):
+        self.fail_pages = set(fail_pages)
+        self.calls = []
+
+    def __call__(self, processes):
+        return self
+
+    def apply_async(self, func, args):
+        export_instance, dump_path, doc_count, first_row_number = args
+        self.calls.append(first_row_number)
+        if first_row_number in self.fail_pages:
+            self.fail_pages.remove(first_row_number)
+            return FakeAsyncResult(error=ValueError("page failed"))
+        try:
+            return FakeAsyncResult(func(*args))
+        except Exception as e:
+            return FakeAsyncResult(error=e)
+
+    def terminate(self):
+        pass
+
+
+@patch('corehq.apps.export.models.FormExportInstance.save')
+class ParallelExportTest(SimpleTestCase):
+
+    docs = [
+        {
+            'domain': 'my-domain',
+            '_id': str(index),
+            'form': {'q1': 'value{}'.format(index)},
+        }
+        for index in range(5)
+    ]
+
+    export_instance = FormExportInstance(
+        export_format=Format.JSON,
+        tables=[
+            TableConfiguration(
+                label="My table",
+                selected=True,
+                columns=[
+                    RowNumberColumn(label="number", selected=True),
+                    ExportColumn(
+                        label="Q1",
+                        item=ScalarItem(path=[PathNode(name='form'), PathNode(name='q1')]),
+                        selected=True,
+                    ),
+                ]
+            )
+        ]
+    )
+
+    def _get_export(self, pool):
+        with patch('corehq.apps.export.multiprocess.billiard.Pool', pool), \
+                patch('corehq.apps.export.multiprocess.get_export_documents', return_value=iter(self.docs)), \
+                TransientTempfile() as temp_path:
+            export_file = get_parallel_export_file(self.export_instance, [], temp_path, 2, page_size=2)
+            with export_file as export:
+                return json.loads(export.read())
+
+    def test_rows_in_page_order(self, export_save):
+        pool = FakePool()
+        self.assertEqual(self._get_export(pool), {
+            'My table': {
+                'headers': ['number', 'Q1'],
+                'rows': [[str(index), 'value{}'.format(index)] for index in range(5)],
+            }
+        })
+        self.assertEqual(pool.calls, [0, 2, 4])
+        self.assertTrue(export_save.called)
+
+    def test_retry_page(self, export_save):
+        pool = FakePool(fail_pages=[2])
+        self.assertEqual(
+            self._get_export(pool)['My table']['rows'],
+            [[str(index), 'value{}'.format(index)] for index in range(5)],
+        )
+        self.assertEqual(pool.calls, [0, 2, 4, 2])
+
+    def test_page_fails(self, export_save):
+        with patch('corehq.apps.export.multiprocess.PARALLEL_EXPORT_RETRIES_PER_PAGE', 0):
+            with self.assertRaises(ValueError):
+                self._get_export(FakePool(fail_pages=[2]))
+
+    def test_document_error(self, export_save):
+        get_rows = TableConfiguration.get_rows
+
+        def get_rows_or_fail(table, doc, *args, **kwargs):
+            if doc['_id'] == '3':
+                raise ValueError("bad doc")
+            return get_rows(table, doc, *args, **kwargs)
+
+        with patch.object(TableConfiguration, 'get_rows', get_rows_or_fail), \
+                patch('corehq.apps.export.multiprocess.PARALLEL_EXPORT_RETRIES_PER_PAGE', 0), \
+                patch('corehq.apps.export.multiprocess.notify_exception') as notify_exception:
+            with self.assertRaises(ExportDocumentError):
+                self._get_export(FakePool())
+        details = notify_exception.call_args[1]['details']
+        self.assertEqual(details['doc_id'], '3')
+        self.assertEqual(details['export_table'], 'My table')
+
+    def test_metrics(self, export_save):
+        with patch('corehq.apps.export.multiprocess.load_counter') as load_counter, \
+                patch('corehq.apps.export.multiprocess._record_datadog_export_duration') as record_duration:
+            self._get_export(FakePool())
+        track_load = load_counter.return_value
+        self.assertEqual([args[0] for args, kwargs in track_load.call_args_list], [2, 2, 1])
+        duration, doc_bytes, num_rows, tags = record_duration.call_args[0]
+        self.assertEqual(num_rows, 5)
+        self.assertEqual(tags, ['format:json'])
+
+
+class ParallelExportProcessesTest(SimpleTestCase):
+
+    @patch('corehq.apps.export.multiprocess.multiprocessing.cpu_count', return_value=8)
+    def test_processes(self, _):
+        self.assertEqual(get_parallel_export_processes(PARALLEL_EXPORT_MIN_DOCS - 1), 0)
+        self.assertEqual(get_parallel_export_processes(PARALLEL_EXPORT_MIN_DOCS), 4)
+
+    @patch('corehq.apps.export.multiprocess.multiprocessing.cpu_count', return_value=2)
+    def test_too_few_cpus(self, _):
+        self.assertEqual(get_parallel_export_processes(PARALLEL_EXPORT_MIN_DOCS), 0)
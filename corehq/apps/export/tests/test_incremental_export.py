@@ -0,0 +1,160 @@
+import json
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from couchexport.models import Format
+
+from corehq.apps.export.incremental import (
+    _renumber_row,
+    get_export_config_hash,
+    rebuild_export_incrementally,
+    supports_incremental_rebuild,
+)
+from corehq.apps.export.models import (
+    ExportColumn,
+    FormExportInstance,
+    PathNode,
+    RowNumberColumn,
+    ScalarItem,
+    TableConfiguration,
+)
+from corehq.util.test_utils import flag_enabled
+
+
+class FakeQuery(object):
+    index = 'forms'
+
+    def __init__(self, doc_ids, changed_ids):
+        self.doc_ids = doc_ids
+        self.changed_ids = changed_ids
+        self.filtered = False
+
+    def filter(self, filter_):
+        query = FakeQuery(self.doc_ids, self.changed_ids)
+        query.filtered = True
+        return query
+
+    def scroll_ids(self):
+        return iter(self.changed_ids if self.filtered else self.doc_ids)
+
+    def count(self):
+        return len(self.changed_ids if self.filtered else self.doc_ids)
+
+
+@patch('corehq.apps.export.models.FormExportInstance.save')
+class IncrementalExportTest(SimpleTestCase):
+
+    def setUp(self):
+        self.export_instance = FormExportInstance(
+            domain='my-domain',
+            export_format=Format.JSON,
+            is_daily_saved_export=True,
+            tables=[
+                TableConfiguration(
+                    label="My table",
+                    selected=True,
+                    columns=[
+                        RowNumberColumn(label="number", selected=True),
+                        ExportColumn(
+                            label="Q1",
+                            item=ScalarItem(path=[PathNode(name='form'), PathNode(name='q1')]),
+                            selected=True,
+                        ),
+                    ]
+                )
+            ]
+        )
+        self.incremental_rows = None
+        self.built_doc_ids = []
+
+    def _build(self, docs, changed_ids=(), build_date=None):
+        docs_by_id = {doc['_id']: doc for doc in docs}
+        saved = {}
+
+        def _iter_es_docs(index, doc_ids):
+            self.built_doc_ids = list(doc_ids)
+            return [docs_by_id[doc_id] for doc_id in self.built_doc_ids]
+
+        def _save_export_payload(export, payload, incremental_rows=None):
+            saved['payload'] = payload.read()
+            saved['incremental_rows'] = incremental_rows.read()
+
+        with patch('corehq.apps.export.incremental._get_export_query',
+                   return_value=FakeQuery(list(docs_by_id), list(changed_ids))), \
+                patch('corehq.apps.export.incremental.iter_es_docs', _iter_es_docs), \
+                patch('corehq.apps.export.incremental.save_export_payload', _save_export_payload), \
+                patch.object(FormExportInstance, 'has_incremental_rows',
+                             lambda export: self.incremental_rows is not None), \
+                patch.object(FormExportInstance, 'get_incremental_rows',
+                             lambda export: BytesIO(self.incremental_rows)), \
+                patch('corehq.apps.export.incremental.datetime') as datetime_mock:
+            datetime_mock.utcnow.return_value = build_date or datetime(2019, 11, 1)
+            rebuild_export_incrementally(self.export_instance)
+
+        self.incremental_rows = saved['incremental_rows']
+        return json.loads(saved['payload'])['My table']['rows']
+
+    def _doc(self, doc_id, value):
+        return {'_id': doc_id, 'domain': 'my-domain', 'form': {'q1': value}}
+
+    def test_reuse_rows(self, export_save):
+        self.assertEqual(
+            self._build([self._doc('a', 'a1'), self._doc('b', 'b1'), self._doc('d', 'd1')]),
+            [['0', 'a1'], ['1', 'b1'], ['2', 'd1']],
+        )
+        self.assertEqual(self.built_doc_ids, ['a', 'b', 'd'])
+
+        # a was deleted, b changed, c is new and d is unchanged
+        rows = self._build(
+            [self._doc('b', 'b2'), self._doc('c', 'c1'), self._doc('d', 'd1')],
+            changed_ids=['b', 'c'],
+            build_date=datetime(2019, 11, 2),
+        )
+        self.assertEqual(self.built_doc_ids, ['b', 'c'])
+        self.assertEqual(rows, [['0', 'd1'], ['1', 'b2'], ['2', 'c1']])
+
+    def test_changed_config(self, export_save):
+        self._build([self._doc('a', 'a1')])
+        self.export_instance.tables[0].columns[1].label = 'Question 1'
+        self._build([self._doc('a', 'a1')])
+        self.assertEqual(self.built_doc_ids, ['a'])
+
+    def test_full_rebuild_after_max_age(self, export_save):
+        self._build([self._doc('a', 'a1')])
+        self._build([self._doc('a', 'a1')], build_date=datetime(2019, 11, 2))
+        self.assertEqual(self.built_doc_ids, [])
+        self._build([self._doc('a', 'a1')], build_date=datetime(2019, 11, 1) + timedelta(days=8))
+        self.assertEqual(self.built_doc_ids, ['a'])
+
+    @flag_enabled('INCREMENTAL_SAVED_EXPORTS')
+    @patch('corehq.apps.export.incremental.INCREMENTAL_EXPORT_MAX_DOCS', 2)
+    def test_max_docs(self, export_save):
+        with patch('corehq.apps.export.incremental._get_export_query',
+                   return_value=FakeQuery(['a', 'b'], [])):
+            self.assertTrue(supports_incremental_rebuild(self.export_instance))
+        with patch('corehq.apps.export.incremental._get_export_query',
+                   return_value=FakeQuery(['a', 'b', 'c'], [])):
+            self.assertFalse(supports_incremental_rebuild(self.export_instance))
+
+    def test_config_hash(self, export_save):
+        config_hash = get_export_config_hash(self.export_instance)
+        self.assertEqual(config_hash, get_export_config_hash(self.export_instance))
+        self.export_instance.split_multiselects = not self.export_instance.split_multiselects
+        self.assertNotEqual(config_hash, get_export_config_hash(self.export_instance))
+
+
+class RenumberRowTest(SimpleTestCase):
+
+    def test_renumber_row(self):
+        data = ['3', 'value']
+        _renumber_row(data, [0], 5)
+        self.assertEqual(data, ['5', 'value'])
+
+    def test_renumber_repeat_row(self):
+        data = ['value', '3.1.2', 3, 1, 2]
+        _renumber_row(data, [1], 5)
+        self.assertEqual(data, ['value', '5.1.2', 5, 1, 2])
@@ -1,6 +1,9 @@
 from django.test import SimpleTestCase
 
 from corehq.apps.export.const import USERNAME_TRANSFORM
+from corehq.apps.export.management.commands.benchmark_export_rows import (
+    get_rows_by_column,
+)
 from corehq.apps.export.models import (
     DocRow,
     ExportColumn,
@@ -336,3 +339,88 @@ class TableConfigurationGetRowsTest(SimpleTestCase):
         self.assertEqual(
             [row.data for row in table_configuration.get_rows(submission, 0)], []
         )
+
+
+class TableConfigurationRowBuilderTest(SimpleTestCase):
+    submission = {
+        'domain': 'my-domain',
+        '_id': '1234',
+        'received_on': '2019-11-01T10:30:00.000000Z',
+        'form': {
+            'q1': 'foo',
+            'q2': {'#text': 'bar', 'id': '123'},
+            'q3': {'id': '123'},
+            'q4': '',
+            'group': {'q5': 'baz', 'q6': None},
+            'string_group': 'not a group',
+            'repeat1': [
+                {'q7': 'beep', 'group': {'q8': 'boop'}},
+                {'q7': ['old', {'a': 'b'}]},
+            ],
+        },
+    }
+
+    def _get_table(self, path, column_paths):
+        return TableConfiguration(
+            path=path,
+            columns=[RowNumberColumn(label='number', selected=True)] + [
+                ExportColumn(
+                    item=ScalarItem(path=[
+                        PathNode(name=name, is_repeat=name == 'repeat1') for name in column_path
+                    ]),
+                    label=column_path[-1],
+                    selected=True,
+                )
+                for column_path in column_paths
+            ]
+        )
+
+    def test_form_columns(self):
+        table = self._get_table([], [
+            ['received_on'],
+            ['form', 'q1'],
+            ['form', 'q2'],
+            ['form', 'q3'],
+            ['form', 'q4'],
+            ['form', 'group', 'q5'],
+            ['form', 'group', 'q6'],
+            ['form', 'group', 'missing'],
+            ['form', 'string_group', 'q1'],
+            ['form', 'missing_group', 'q1'],
+        ])
+        for transform_dates in [False, True]:
+            rows = table.get_rows(self.submission, 0, transform_dates=transform_dates)
+            self.assertEqual(
+                [row.data for row in rows],
+                get_rows_by_column(table, self.submission, 0, transform_dates=transform_dates),
+            )
+        self.assertEqual(
+            [row.data for row in table.get_rows(self.submission, 0)],
+            [['0', '2019-11-01T10:30:00.000000Z', 'foo', 'bar', '', '', 'baz', '---', '---', '---', '---']]
+        )
+
+    def test_repeat_columns(self):
+        table = self._get_table(
+            [PathNode(name='form'), PathNode(name='repeat1', is_repeat=True)],
+            [
+                ['form', 'repeat1', 'q7'],
+                ['form', 'repeat1', 'group', 'q8'],
+            ]
+        )
+        rows = table.get_rows(self.submission, 0)
+        self.assertEqual([row.data for row in rows], get_rows_by_column(table, self.submission, 0))
+        self.assertEqual(
+            [row.data for row in rows],
+            [
+                ['0.0', 0, 0, 'beep', 'boop'],
+                ['0.1', 0, 1, 'old a=b', '---'],
+            ]
+        )
+        self.assertEqual([row.skip_excel_formatting for row in rows], [[0, 1, 2], [0, 1, 2]])
+
+    def test_as_json(self):
+        table = self._get_table([], [['form', 'q1'], ['form', 'group', 'q5']])
+        self.assertEqual(
+            table.get_rows(self.submission, 0, as_json=True),
+            [{'number': '0', 'q1': 'foo', 'q5': 'baz'}]
+        )
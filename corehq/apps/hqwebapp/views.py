@@ -140,7 +140,9 @@ def server_error(request, template_name='500.html'):
     submission_urls = [
         'receiver_secure_post',
         'receiver_secure_post_with_app_id',
-        'receiver_post_with_app_id'
+        'receiver_post_with_app_id',
+        'receiver_secure_bulk_post',
+        'receiver_secure_bulk_post_with_app_id',
     ]
     if urlname in submission_urls + ['app_aware_restore']:
         return HttpResponse(status=500)
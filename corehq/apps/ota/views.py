@@ -85,7 +85,7 @@ def restore(request, domain, app_id=None):
         return HttpTooManyRequests()
 
     response, timing_context = get_restore_response(
-        domain, request.couch_user, app_id, **get_restore_params(request))
+        domain, request.couch_user, app_id, stream=True, **get_restore_params(request))
     return response
 
 
@@ -200,7 +200,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
                          cache_timeout=None, overwrite_cache=False,
                          as_user=None, device_id=None, user_id=None,
                          openrosa_version=None,
-                         case_sync=None):
+                         case_sync=None, stream=False):
     """
     :param domain: Domain being restored from
     :param couch_user: User performing restore
@@ -217,6 +217,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
     :param user_id: ID of user performing restore (used in case of deleted user with same username)
     :param openrosa_version:
     :param case_sync: Override default case sync algorithm
+    :param stream: Send the response while it is being generated, if enabled for the domain
     :return: Tuple of (http response, timing context or None)
     """
 
@@ -281,7 +282,7 @@ def get_restore_response(domain, couch_user, app_id=None, since=None, version='1
         is_async=async_restore_enabled,
         case_sync=case_sync,
     )
-    return restore_config.get_response(), restore_config.timing_context
+    return restore_config.get_response(stream=stream), restore_config.timing_context
 
 
 @mobile_auth
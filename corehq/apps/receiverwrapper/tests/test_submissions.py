@@ -1,5 +1,6 @@
 import json
 import os
+import uuid
 from io import BytesIO
 
 from django.conf import settings
@@ -13,13 +14,17 @@ from mock import patch
 from corehq.apps.domain.shortcuts import create_domain
 from corehq.apps.receiverwrapper.util import submit_form_locally
 from corehq.apps.users.models import CommCareUser
-from corehq.form_processor.interfaces.dbaccessors import FormAccessors
+from corehq.apps.users.util import DEMO_USER_ID
+from corehq.form_processor.interfaces.dbaccessors import (
+    CaseAccessors,
+    FormAccessors,
+)
 from corehq.form_processor.tests.utils import (
     FormProcessorTestUtils,
     use_sql_backend,
 )
 from corehq.util.json import CommCareJSONEncoder
-from corehq.util.test_utils import TestFileMixin, softer_assert
+from corehq.util.test_utils import TestFileMixin, flag_enabled, softer_assert
 
 
 class BaseSubmissionTest(TestCase):
@@ -235,6 +240,136 @@ class NormalModeSubmissionTest(BaseSubmissionTest):
         self.assertTrue(notification.called)
 
 
+BULK_CASE_FORM = """<?xml version='1.0' ?>
+<data xmlns="http://commcarehq.org/test/submit">
+    <meta>
+        <deviceID>bulk-device</deviceID>
+        <timeStart>2019-11-01T10:00:00.000</timeStart>
+        <timeEnd>2019-11-01T10:01:00.000</timeEnd>
+        <username>test</username>
+        <userID>{user_id}</userID>
+        <instanceID>{form_id}</instanceID>
+    </meta>
+    <case xmlns="http://commcarehq.org/case/transaction/v2" case_id="{case_id}"
+          user_id="{user_id}" date_modified="2019-11-01T10:01:00.000">
+        {create}
+        <update>
+            <visit>{visit}</visit>
+        </update>
+    </case>
+</data>"""
+
+
+class BulkSubmissionTest(BaseSubmissionTest):
+
+    def setUp(self):
+        super(BulkSubmissionTest, self).setUp()
+        self.url = reverse("receiver_secure_bulk_post", args=[self.domain])
+        self.case_id = uuid.uuid4().hex
+
+    def _form(self, visit, create=False, user_id=None):
+        return BytesIO(BULK_CASE_FORM.format(
+            user_id=user_id or self.couch_user.get_id,
+            form_id=uuid.uuid4().hex,
+            case_id=self.case_id,
+            visit=visit,
+            create="<create><case_type>patient</case_type><case_name>bulk</case_name></create>" if create else "",
+        ).encode('utf-8'))
+
+    def _submit_forms(self, forms, url=None):
+        return self.client.post(url or self.url, {"xml_submission_file": forms})
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    def test_forms_processed_in_order(self):
+        response = self._submit_forms([self._form('1', create=True), self._form('2'), self._form('3')])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 201, 201])
+
+        case = CaseAccessors(self.domain.name).get_case(self.case_id)
+        self.assertEqual(case.get_case_property('visit'), '3')
+        self.assertEqual(case.xform_ids, [result['form_id'] for result in results])
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    def test_forms_after_error_not_processed(self):
+        from corehq.form_processor.submission_post import SubmissionPost
+        run = SubmissionPost.run
+        calls = []
+
+        def fail_second_form(submission_post):
+            calls.append(submission_post)
+            if len(calls) == 2:
+                raise Exception("processing failed")
+            return run(submission_post)
+
+        with patch.object(SubmissionPost, 'run', fail_second_form), \
+                patch('corehq.apps.receiverwrapper.views.notify_exception'):
+            response = self._submit_forms([self._form('1', create=True), self._form('2'), self._form('3')])
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 500, 424])
+        self.assertEqual(len(calls), 2)
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    @patch('corehq.form_processor.submission_post.BULK_SUBMISSION_TIME_LIMIT', -1)
+    def test_forms_after_time_limit_not_processed(self):
+        response = self._submit_forms([self._form('1', create=True), self._form('2'), self._form('3')])
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 503, 503])
+        case = CaseAccessors(self.domain.name).get_case(self.case_id)
+        self.assertEqual(case.get_case_property('visit'), '1')
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    @patch('corehq.form_processor.submission_post.rate_limit_submission', return_value=True)
+    def test_every_form_is_rate_limited(self, rate_limit_submission):
+        response = self._submit_forms([self._form('1', create=True), self._form('2'), self._form('3')])
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 429, 429])
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    @patch('corehq.apps.receiverwrapper.views.BULK_SUBMISSION_MAX_FORMS', 2)
+    def test_too_many_forms(self):
+        response = self._submit_forms([self._form('1', create=True), self._form('2'), self._form('3')])
+        self.assertEqual(response.status_code, 400)
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    def test_attachments_not_allowed(self):
+        response = self.client.post(self.url, {
+            "xml_submission_file": [self._form('1', create=True)],
+            "image.jpg": BytesIO(b"fake image"),
+        })
+        self.assertEqual(response.status_code, 400)
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    @flag_enabled('FORM_SUBMISSION_BLACKLIST')
+    def test_blacklisted(self):
+        response = self._submit_forms([self._form('1', create=True), self._form('2')])
+        self.assertEqual(response.status_code, 509)
+        self.assertEqual(CaseAccessors(self.domain.name).get_case_ids_in_domain(), [])
+
+    @flag_enabled('BULK_FORM_SUBMISSIONS')
+    def test_non_demo_user_forms_ignored_in_demo_mode(self):
+        response = self._submit_forms(
+            [self._form('1', create=True, user_id=DEMO_USER_ID), self._form('2'), self._form('3')],
+            url=self.url + '?submit_mode=demo',
+        )
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 201, 201])
+        self.assertIsNotNone(results[0]['form_id'])
+        self.assertEqual([result['form_id'] for result in results[1:]], [None, None])
+        self.assertIn('this submission was ignored', results[1]['content'])
+        case = CaseAccessors(self.domain.name).get_case(self.case_id)
+        self.assertEqual(case.get_case_property('visit'), '1')
+
+    def test_toggle_disabled(self):
+        response = self._submit_forms([self._form('1', create=True)])
+        self.assertEqual(response.status_code, 403)
+
+
+@use_sql_backend
+class BulkSubmissionTestSQL(BulkSubmissionTest):
+    pass
+
+
 @use_sql_backend
 class SubmissionTestSQL(SubmissionTest):
 
@@ -1,9 +1,11 @@
 from django.conf.urls import url
 
-from corehq.apps.receiverwrapper.views import post, secure_post
+from corehq.apps.receiverwrapper.views import post, secure_bulk_post, secure_post
 
 urlpatterns = [
     url(r'^$', post, name='receiver_post'),
+    url(r'^secure/bulk/(?P<app_id>[\w-]+)/$', secure_bulk_post, name='receiver_secure_bulk_post_with_app_id'),
+    url(r'^secure/bulk/$', secure_bulk_post, name='receiver_secure_bulk_post'),
     url(r'^secure/(?P<app_id>[\w-]+)/$', secure_post, name='receiver_secure_post_with_app_id'),
     url(r'^secure/$', secure_post, name='receiver_secure_post'),
 
@@ -236,9 +236,20 @@ def should_ignore_submission(request):
     If submission request.GET has `submit_mode=demo` and submitting user is not demo_user,
     the submissions should be ignored
     """
+    if not IGNORE_ALL_DEMO_USER_SUBMISSIONS and not request.GET.get('submit_mode') == DEMO_SUBMIT_MODE:
+        return False
+
+    instance, _ = couchforms.get_instance_and_attachment(request)
+    return should_ignore_instance(request, instance)
+
+
+def should_ignore_instance(request, instance):
+    """
+    Like ``should_ignore_submission``, for one form ``instance`` of the request,
+    e.g. one of the forms of a bulk submission
+    """
     form_json = None
     if IGNORE_ALL_DEMO_USER_SUBMISSIONS:
-        instance, _ = couchforms.get_instance_and_attachment(request)
         try:
             form_json = convert_xform_to_json(instance)
         except couchforms.XMLSyntaxError:
@@ -254,7 +265,6 @@ def should_ignore_submission(request):
         return False
 
     if form_json is None:
-        instance, _ = couchforms.get_instance_and_attachment(request)
         form_json = convert_xform_to_json(instance)
     return False if from_demo_user(form_json) else True
 
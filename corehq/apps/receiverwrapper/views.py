@@ -1,7 +1,7 @@
 import logging
 import os
 
-from django.http import HttpResponseBadRequest, HttpResponseForbidden
+from django.http import HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
@@ -11,7 +11,11 @@ from tastypie.http import HttpTooManyRequests
 import couchforms
 from casexml.apps.case.xform import get_case_updates, is_device_report
 from couchforms import openrosa_response
-from couchforms.const import MAGIC_PROPERTY, BadRequest
+from couchforms.const import (
+    MAGIC_PROPERTY,
+    MULTIPART_EMPTY_PAYLOAD_ERROR,
+    BadRequest,
+)
 from couchforms.getters import MultimediaBug
 from dimagi.utils.decorators.profile import profile_prod
 from dimagi.utils.logging import notify_exception
@@ -41,11 +45,16 @@ from corehq.apps.receiverwrapper.util import (
     DEMO_SUBMIT_MODE,
     from_demo_user,
     get_app_and_build_ids,
+    should_ignore_instance,
     should_ignore_submission,
 )
 from corehq.form_processor.exceptions import XFormLockError
 from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
-from corehq.form_processor.submission_post import SubmissionPost
+from corehq.form_processor.submission_post import (
+    BULK_SUBMISSION_MAX_FORMS,
+    BulkSubmissionPost,
+    SubmissionPost,
+)
 from corehq.form_processor.utils import (
     convert_xform_to_json,
     should_use_sql_backend,
@@ -145,6 +154,120 @@ def _process_form(request, domain, app_id, user_id, authenticated,
     return response
 
 
+def _process_bulk_forms(request, domain, app_id, user_id):
+    """
+    Process the forms in the ``xml_submission_file`` parts of a multipart
+    request in order, and respond with the status code and body of the
+    OpenRosa response for each form. If a form can't be processed, the forms
+    after it are not processed, and their status is 424 (Failed Dependency)
+    so that the device resubmits them. Forms that are not processed because
+    the request took too long, or because the project's submission rate limit
+    was reached, get a 503 or 429 status. Forms that meet the criteria for
+    ignored submissions get the same response as when submitted individually,
+    and are not processed. Forms with attachments must be submitted
+    individually.
+    """
+    if not toggles.BULK_FORM_SUBMISSIONS.enabled(domain):
+        return HttpResponseForbidden('Bulk form submissions are not enabled for this project')
+
+    if rate_limit_submission(domain):
+        return HttpTooManyRequests()
+
+    if not request.META['CONTENT_TYPE'].startswith('multipart/form-data'):
+        return HttpResponseBadRequest('Bulk form submissions must use multipart/form-data')
+    if set(request.FILES) - {MAGIC_PROPERTY}:
+        return HttpResponseBadRequest('Forms with attachments must be submitted individually')
+    if len(request.FILES.getlist(MAGIC_PROPERTY)) > BULK_SUBMISSION_MAX_FORMS:
+        return HttpResponseBadRequest(
+            'A bulk submission can have at most {} forms'.format(BULK_SUBMISSION_MAX_FORMS))
+    instances = [instance.read() for instance in request.FILES.getlist(MAGIC_PROPERTY)]
+    if not instances or not all(instances):
+        return HttpResponseBadRequest(MULTIPART_EMPTY_PAYLOAD_ERROR.message)
+
+    metric_tags = [
+        'backend:sql' if should_use_sql_backend(domain) else 'backend:couch',
+        'domain:{}'.format(domain),
+        'bulk:true',
+    ]
+    if toggles.FORM_SUBMISSION_BLACKLIST.enabled(domain):
+        response = openrosa_response.BLACKLISTED_RESPONSE
+        _record_metrics(metric_tags, 'blacklisted', response)
+        return response
+
+    ignored = [_should_ignore_bulk_instance(request, instance) for instance in instances]
+    app_id, build_id = get_app_and_build_ids(domain, app_id)
+    bulk_submission_post = BulkSubmissionPost(
+        [instance for instance, is_ignored in zip(instances, ignored) if not is_ignored],
+        domain=domain,
+        app_id=app_id,
+        build_id=build_id,
+        auth_context=AuthContext(
+            domain=domain,
+            user_id=user_id,
+            authenticated=True,
+        ),
+        location=couchforms.get_location(request),
+        received_on=couchforms.get_received_on(request),
+        date_header=couchforms.get_date_header(request),
+        path=couchforms.get_path(request),
+        submit_ip=couchforms.get_submit_ip(request),
+        last_sync_token=couchforms.get_last_sync_token(request),
+        openrosa_headers=couchforms.get_openrosa_headers(request),
+        force_logs=bool(request.GET.get('force_logs', False)),
+    )
+
+    processed = []
+    try:
+        for result in bulk_submission_post.iter_results():
+            _record_metrics(list(metric_tags), result.submission_type, result.response, xform=result.xform)
+            processed.append(_get_bulk_form_result(result.response))
+    except XFormLockError as err:
+        datadog_counter(XFORM_LOCKED_COUNT, tags=metric_tags)
+        processed.append({'status': 423, 'content': "XFormLockError: %s" % err})
+    except Exception:
+        notify_exception(request, "Error processing bulk form submission", [
+            "domain:{}".format(domain),
+            "user_id:{}".format(user_id),
+            "form_index:{}".format(len(processed)),
+        ])
+        processed.append({'status': 500, 'content': "Error processing form"})
+
+    if bulk_submission_post.stopped == BulkSubmissionPost.TIME_LIMIT:
+        unprocessed = {'status': 503, 'content': "Not processed because the request took too long"}
+    elif bulk_submission_post.stopped == BulkSubmissionPost.RATE_LIMITED:
+        unprocessed = {'status': 429, 'content': "Not processed because of the submission rate limit"}
+    else:
+        unprocessed = {'status': 424, 'content': "Not processed because an earlier form failed"}
+
+    results = []
+    processed = iter(processed)
+    for is_ignored in ignored:
+        if is_ignored:
+            # silently ignore forms that meet the ignore-criteria, like _process_form
+            response = openrosa_response.SUBMISSION_IGNORED_RESPONSE
+            _record_metrics(list(metric_tags), 'ignored', response)
+            results.append(_get_bulk_form_result(response))
+        else:
+            results.append(next(processed, None) or dict(unprocessed))
+    return JsonResponse({'results': results})
+
+
+def _should_ignore_bulk_instance(request, instance):
+    try:
+        return should_ignore_instance(request, instance)
+    except couchforms.XMLSyntaxError:
+        # let the usual workflow handle response for invalid xml
+        return False
+
+
+def _get_bulk_form_result(response):
+    return {
+        'status': response.status_code,
+        'form_id': response.get('X-CommCareHQ-FormID'),
+        'content': response.content.decode('utf-8'),
+    }
+
+
 def _submission_error(request, message, count_metric, metric_tags,
         domain, app_id, user_id, authenticated, meta=None, status=400,
         notify=True):
@@ -329,3 +452,43 @@ def secure_post(request, domain, app_id=None):
         )
 
     return decorated_view(request, domain, app_id=app_id)
+
+
+@login_or_digest_ex(allow_cc_users=True)
+@two_factor_exempt
+def _secure_bulk_post_digest(request, domain, app_id=None):
+    """only ever called from secure bulk post"""
+    return _process_bulk_forms(request, domain, app_id, request.couch_user.get_id)
+
+
+@handle_401_response
+@login_or_basic_ex(allow_cc_users=True)
+@two_factor_exempt
+def _secure_bulk_post_basic(request, domain, app_id=None):
+    """only ever called from secure bulk post"""
+    return _process_bulk_forms(request, domain, app_id, request.couch_user.get_id)
+
+
+@location_safe
+@csrf_exempt
+@require_POST
+@check_domain_migration
+def secure_bulk_post(request, domain, app_id=None):
+    authtype_map = {
+        DIGEST: _secure_bulk_post_digest,
+        BASIC: _secure_bulk_post_basic,
+    }
+
+    if request.GET.get('authtype'):
+        authtype = request.GET['authtype']
+    else:
+        authtype = determine_authtype_from_request(request, default=BASIC)
+
+    try:
+        decorated_view = authtype_map[authtype]
+    except KeyError:
+        return HttpResponseBadRequest(
+            'authtype must be one of: {0}'.format(','.join(authtype_map))
+        )
+
+    return decorated_view(request, domain, app_id=app_id)
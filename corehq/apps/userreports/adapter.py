@@ -79,7 +79,7 @@ class IndicatorAdapter(object):
         indicator_rows = self.get_all_values(doc, eval_context)
         self.save_rows(indicator_rows)
 
-    def save_rows(self, rows):
+    def save_rows(self, rows, use_copy=None):
         raise NotImplementedError
 
     def bulk_save(self, docs):
@@ -178,9 +178,13 @@ class IndicatorAdapterLoadTracker(object):
     def track_load(self, value=1):
         self._track_load(value)
 
-    def save_rows(self, rows):
+    def save_rows(self, rows, use_copy=None):
         self._track_load(len(rows))
-        self.adapter.save_rows(rows)
+        self.adapter.save_rows(rows, use_copy=use_copy)
+
+    def _best_effort_save_rows(self, rows, doc):
+        self._track_load(len(rows))
+        self.adapter._best_effort_save_rows(rows, doc)
 
     def delete(self, doc):
         self._track_load()
@@ -0,0 +1,669 @@
+"""
+Compiles UCR expression and filter specs into plain python closures.
+
+The interpreted objects built by ``ExpressionFactory`` and ``FilterFactory``
+read their configuration through JsonObject properties on every call. The
+compiler reads each spec once, at build time, and produces closures over
+plain python values with:
+
+* constant folding (e.g. a ``conditional`` with a constant ``test``)
+* shared sub-expressions: identical specs (by canonical JSON) anywhere in a data
+  source compile to the same closure, and are evaluated once per item if they are
+  referenced more than once
+* direct dict lookups for ``property_name`` and ``property_path``
+
+Spec types the compiler does not know about fall back to the interpreted objects,
+whose own sub-expressions are compiled again, so any valid spec can be compiled.
+
+Compilation is hooked in through ``FactoryContext.compiler``, so indicators built
+by ``IndicatorFactory`` transparently use compiled expressions and filters.
+"""
+import itertools
+import json
+import time
+from collections import Counter
+
+from django.utils.translation import ugettext as _
+
+from jsonobject.exceptions import BadValueError, WrappingAttributeError
+
+from dimagi.utils.web import json_handler
+
+from corehq.apps.userreports.exceptions import BadSpecError
+from corehq.apps.userreports.expressions.factory import (
+    ExpressionFactory,
+    _convert_constant_to_expression_spec,
+    _is_literal,
+)
+from corehq.apps.userreports.expressions.getters import transform_from_datatype
+from corehq.apps.userreports.expressions.specs import (
+    ArrayIndexExpressionSpec,
+    CoalesceExpressionSpec,
+    ConditionalExpressionSpec,
+    ConstantGetterSpec,
+    DictExpressionSpec,
+    NamedExpressionSpec,
+    NestedExpressionSpec,
+    PropertyNameGetterSpec,
+    PropertyPathGetterSpec,
+    RootDocExpressionSpec,
+    SwitchExpressionSpec,
+)
+from corehq.apps.userreports.filters.factory import FilterFactory
+from corehq.apps.userreports.filters.specs import (
+    BooleanExpressionFilterSpec,
+    NamedFilterSpec,
+    NotFilterSpec,
+)
+from corehq.apps.userreports.operators import get_operator
+from corehq.apps.userreports.specs import FactoryContext
+from corehq.util import eval_lazy
+
+# expressions that are cheaper to re-evaluate than to look up in a cache
+CHEAP_EXPRESSION_TYPES = {'identity', 'constant', 'property_name', 'property_path', 'base_iteration_number'}
+
+
+_cache_prefixes = itertools.count()
+# present in the canonical JSON of any spec that references a named expression or filter
+_NAMED_REFERENCE = '"type": "named"'
+
+
+class _Node(object):
+    """A compiled expression or filter
+
+    ``fn`` has the same signature as the interpreted objects: ``fn(item, context=None)``.
+    ``is_constant`` is True if the value was resolved at compile time.
+    ``uses_iteration`` is True if the value can depend on ``EvaluationContext.iteration``.
+    """
+    __slots__ = ('fn', 'is_constant', 'value', 'uses_iteration')
+
+    def __init__(self, fn=None, is_constant=False, value=None, uses_iteration=False):
+        self.fn = fn
+        self.is_constant = is_constant
+        self.value = value
+        self.uses_iteration = uses_iteration
+
+    @classmethod
+    def constant(cls, value):
+        def _constant(item, context=None):
+            return value
+        return cls(_constant, is_constant=True, value=value)
+
+
+class CompiledExpression(object):
+    """Drop in replacement for the interpreted expression and filter objects"""
+
+    def __init__(self, fn, spec, describe):
+        self._fn = fn
+        self.spec = spec
+        self._describe = describe
+
+    def __call__(self, item, context=None):
+        return self._fn(item, context)
+
+    def __str__(self):
+        return self._describe(self.spec)
+
+
+class CompiledNodes(object):
+    """Compiled nodes, keyed by canonical spec, shared by one or more ``ExpressionCompiler``s
+
+    Data sources that share a ``CompiledNodes`` evaluate identical (non-trivial)
+    expressions once per document: results for the root document are cached in
+    ``EvaluationContext.cache``, which survives ``reset_iteration``.
+
+    :param reference_counts: output of ``count_spec_references`` for all the specs that
+    will be compiled. Shared sub-expressions are only cached if this is provided.
+    """
+
+    def __init__(self, reference_counts=None):
+        self.nodes = {}
+        self.reference_counts = reference_counts or Counter()
+        self.stats = Counter()
+
+    def pop_evaluations_saved(self):
+        return self.stats.pop('evaluations_saved', 0)
+
+
+class ExpressionProfiler(object):
+    """Counts the evaluations of, and the time spent in, each compiled node
+
+    Times include the node's sub-expressions. Cache hits of shared nodes are not
+    evaluations, so they are not counted.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = Counter()
+        self.specs = {}
+
+    def wrap(self, kind, key, spec, node):
+        if node.is_constant:
+            return node
+        profile_key = (kind, key)
+        self.specs.setdefault(profile_key, spec)
+        fn = node.fn
+        calls = self.calls
+        seconds = self.seconds
+        timer = time.perf_counter
+
+        def _profiled(item, context=None):
+            start = timer()
+            try:
+                return fn(item, context)
+            finally:
+                seconds[profile_key] += timer() - start
+                calls[profile_key] += 1
+        return _Node(_profiled, uses_iteration=node.uses_iteration)
+
+    def get_report(self, limit=None):
+        """:returns: list of ``(kind, spec, calls, seconds)``, most expensive first"""
+        return [
+            (profile_key[0], self.specs[profile_key], self.calls[profile_key], seconds)
+            for profile_key, seconds in self.seconds.most_common(limit)
+        ]
+
+
+def canonical_spec(spec):
+    return json.dumps(spec, sort_keys=True, default=json_handler)
+
+
+def _spec_key(canonical, scope):
+    if _NAMED_REFERENCE in canonical:
+        # named expressions and filters are resolved per data source
+        return (scope, canonical)
+    return canonical
+
+
+def count_spec_references(specs, named_expressions=None, named_filters=None, scope=None):
+    """Count how many times each sub-spec appears in ``specs``, by canonical JSON.
+
+    A reference to a named expression or filter counts as a use of its definition.
+    """
+    named_expressions = named_expressions or {}
+    named_filters = named_filters or {}
+    counts = Counter()
+
+    def _count(value):
+        counts[_spec_key(canonical_spec(value), scope)] += 1
+
+    def _walk(value):
+        if isinstance(value, dict):
+            if value.get('type') == 'named' and 'name' in value:
+                for named in (named_expressions, named_filters):
+                    if isinstance(named.get(value['name']), dict):
+                        _count(named[value['name']])
+            elif 'type' in value:
+                _count(value)
+            for sub_value in value.values():
+                _walk(sub_value)
+        elif isinstance(value, list):
+            for sub_value in value:
+                _walk(sub_value)
+
+    for spec in specs:
+        _walk(spec)
+    for named in (named_expressions, named_filters):
+        for definition in named.values():
+            if isinstance(definition, dict):
+                for sub_value in definition.values():
+                    _walk(sub_value)
+    return counts
+
+
+def get_reference_counts(config, scope=None):
+    specs = [
+        config.configured_filter,
+        config.configured_indicators,
+        config.base_item_expression,
+        [validation.expression for validation in config.validations],
+    ]
+    return count_spec_references(specs, config.named_expressions, config.named_filters, scope)
+
+
+def get_shared_compilers(configs):
+    """Compilers for ``configs`` that share a single ``CompiledNodes``, so that
+    expressions common to several of the data sources are evaluated once per document.
+
+    :returns: dict of data source id -> ``ExpressionCompiler``
+    """
+    reference_counts = Counter()
+    for config in configs:
+        reference_counts.update(get_reference_counts(config, config._id))
+    nodes = CompiledNodes(reference_counts)
+    return {
+        config._id: ExpressionCompiler.for_data_source(
+            config, config.get_interpreted_factory_context(), nodes=nodes
+        )
+        for config in configs
+    }
+
+
+class ExpressionCompiler(object):
+    """
+    :param named_expressions: dict of name -> expression spec (JSON)
+    :param named_filters: dict of name -> filter spec (JSON)
+    :param interpreted_context: ``FactoryContext`` used to describe compiled expressions
+    with the interpreted objects' ``__str__``
+    :param nodes: ``CompiledNodes`` to compile into, shared with other compilers
+    :param scope: identifies the named expressions and filters of this compiler within ``nodes``
+    :param profiler: ``ExpressionProfiler`` to record the evaluations of every compiled node
+    """
+
+    def __init__(self, named_expressions=None, named_filters=None, interpreted_context=None,
+                 nodes=None, scope=None, profiler=None):
+        self.named_expressions = named_expressions or {}
+        self.named_filters = named_filters or {}
+        self.interpreted_context = interpreted_context or FactoryContext.empty()
+        self.nodes = nodes or CompiledNodes()
+        self.scope = scope
+        self.profiler = profiler
+        self.factory_context = FactoryContext({}, {}, compiler=self)
+        self._compiling_names = set()
+        # one entry per node being built, True if any of its children use the iteration number
+        self._uses_iteration = []
+
+    @property
+    def stats(self):
+        return self.nodes.stats
+
+    @classmethod
+    def for_data_source(cls, config, interpreted_context=None, nodes=None, profiler=None):
+        scope = config._id
+        if nodes is None:
+            nodes = CompiledNodes(get_reference_counts(config, scope))
+        return cls(
+            named_expressions=config.named_expressions,
+            named_filters=config.named_filters,
+            interpreted_context=interpreted_context,
+            nodes=nodes,
+            scope=scope,
+            profiler=profiler,
+        )
+
+    def compile_expression(self, spec):
+        return CompiledExpression(self._expression_node(spec).fn, spec, self._describe_expression)
+
+    def compile_filter(self, spec):
+        return CompiledExpression(self._filter_node(spec).fn, spec, self._describe_filter)
+
+    def _describe_expression(self, spec):
+        return str(ExpressionFactory.from_spec(spec, self.interpreted_context))
+
+    def _describe_filter(self, spec):
+        return str(FilterFactory.from_spec(spec, self.interpreted_context))
+
+    def _expression_node(self, spec):
+        if _is_literal(spec):
+            spec = _convert_constant_to_expression_spec(spec)
+        builder = self.expression_builders.get(spec.get('type'))
+        return self._node('expression', spec, builder, ExpressionFactory)
+
+    def _filter_node(self, spec):
+        FilterFactory.validate_spec(spec)
+        builder = self.filter_builders.get(spec['type'])
+        return self._node('filter', spec, builder, FilterFactory)
+
+    def _node(self, kind, spec, builder, factory):
+        key = _spec_key(canonical_spec(spec), self.scope)
+        node = self.nodes.nodes.get((kind, key))
+        if node is not None:
+            self.stats['shared'] += 1
+            self._add_dependency(node)
+            return node
+
+        self._uses_iteration.append(spec['type'] == 'base_iteration_number')
+        try:
+            if builder is None:
+                self.stats['interpreted'] += 1
+                node = _Node(factory.from_spec_interpreted(spec, self.factory_context))
+            else:
+                node = self._build(builder, spec)
+        finally:
+            uses_iteration = self._uses_iteration.pop()
+        node.uses_iteration = node.uses_iteration or uses_iteration
+        if self.profiler is not None:
+            node = self.profiler.wrap(kind, key, spec, node)
+
+        cheap = kind == 'expression' and spec['type'] in CHEAP_EXPRESSION_TYPES
+        if not node.is_constant and not cheap and self.nodes.reference_counts[key] > 1:
+            node = self._cached(node)
+        self.stats[kind + 's'] += 1
+        self.nodes.nodes[(kind, key)] = node
+        self._add_dependency(node)
+        return node
+
+    def _add_dependency(self, node):
+        if node.uses_iteration and self._uses_iteration:
+            self._uses_iteration[-1] = True
+
+    def _build(self, builder, spec):
+        try:
+            return builder(self, spec)
+        except (AssertionError, BadValueError, TypeError, WrappingAttributeError) as e:
+            raise BadSpecError(_('Problem compiling spec: {}. Message is: {}').format(
+                json.dumps(spec, indent=2, default=json_handler),
+                str(e),
+            ))
+
+    def _cached(self, node):
+        """Evaluate ``node`` at most once per item per iteration of an ``EvaluationContext``
+
+        Unless it uses the iteration number, a node evaluated on the root document is
+        evaluated at most once per ``EvaluationContext``.
+        """
+        self.stats['cached'] += 1
+        fn = node.fn
+        stats = self.stats
+        cache_prefix = 'compiled-{}'.format(next(_cache_prefixes))
+        uses_iteration = node.uses_iteration
+
+        def _cached_fn(item, context=None):
+            if context is None:
+                return fn(item, context)
+            if not uses_iteration and item is context.root_doc:
+                cache = context.cache
+            else:
+                cache = context.iteration_cache
+            key = (cache_prefix, id(item))
+            # the item is kept with its value so that its id can't be reused
+            # by another item, e.g. a temporary ``nested`` argument
+            cached = cache.get(key)
+            if cached is not None and cached[0] is item:
+                stats['evaluations_saved'] += 1
+                return cached[1]
+            value = fn(item, context)
+            cache[key] = (item, value)
+            return value
+        return _Node(_cached_fn, uses_iteration=uses_iteration)
+
+    def _fold(self, value):
+        self.stats['folded'] += 1
+        return _Node.constant(value)
+
+    # expressions
+
+    def _identity(self, spec):
+        def _identity(item, context=None):
+            return item
+        return _Node(_identity)
+
+    def _constant(self, spec):
+        return _Node.constant(ConstantGetterSpec.wrap(spec).constant)
+
+    def _iteration_number(self, spec):
+        def _iteration_number(item, context=None):
+            return context.iteration
+        return _Node(_iteration_number)
+
+    def _property_name(self, spec):
+        wrapped = PropertyNameGetterSpec.wrap(spec)
+        transform = _get_transform(wrapped.datatype)
+        name_node = self._expression_node(wrapped.property_name)
+        if name_node.is_constant:
+            property_name = name_node.value
+
+            def _property_name(item, context=None):
+                if isinstance(item, dict):
+                    return transform(item.get(property_name))
+                return transform(None)
+        else:
+            get_name = name_node.fn
+
+            def _property_name(item, context=None):
+                if isinstance(item, dict):
+                    return transform(item.get(get_name(item, context)))
+                return transform(None)
+        return _Node(_property_name)
+
+    def _property_path(self, spec):
+        wrapped = PropertyPathGetterSpec.wrap(spec)
+        transform = _get_transform(wrapped.datatype)
+        path = tuple(wrapped.property_path)
+
+        def _property_path(item, context=None):
+            if not isinstance(item, dict) or not path:
+                return transform(None)
+            try:
+                for key in path:
+                    item = item[key]
+            except (KeyError, TypeError, ValueError):
+                return transform(None)
+            return transform(item)
+        return _Node(_property_path)
+
+    def _named(self, spec):
+        wrapped = NamedExpressionSpec.wrap(spec)
+        name = wrapped.name
+        if name not in self.named_expressions:
+            raise BadSpecError('Name {} not found in list of named expressions!'.format(name))
+        if name in self._compiling_names:
+            raise BadSpecError('Named expression {} references itself!'.format(name))
+        self._compiling_names.add(name)
+        try:
+            node = self._expression_node(self.named_expressions[name])
+        finally:
+            self._compiling_names.remove(name)
+        if node.is_constant:
+            return node
+        # named expressions are always cached, as they are by NamedExpressionSpec
+        return self._cached(node)
+
+    def _conditional(self, spec):
+        wrapped = ConditionalExpressionSpec.wrap(spec)
+        test = self._filter_node(wrapped.test)
+        if_true = self._expression_node(wrapped.expression_if_true)
+        if_false = self._expression_node(wrapped.expression_if_false)
+        if test.is_constant:
+            self.stats['folded'] += 1
+            return if_true if test.value else if_false
+
+        test_fn, if_true_fn, if_false_fn = test.fn, if_true.fn, if_false.fn
+
+        def _conditional(item, context=None):
+            if test_fn(item, context):
+                return if_true_fn(item, context)
+            return if_false_fn(item, context)
+        return _Node(_conditional)
+
+    def _switch(self, spec):
+        wrapped = SwitchExpressionSpec.wrap(spec)
+        switch_on = self._expression_node(wrapped.switch_on)
+        cases = {value: self._expression_node(expression) for value, expression in wrapped.cases.items()}
+        default = self._expression_node(wrapped.default)
+        if switch_on.is_constant:
+            self.stats['folded'] += 1
+            return _switch_lookup(cases, switch_on.value, default)
+
+        switch_on_fn = switch_on.fn
+        case_fns = {value: node.fn for value, node in cases.items()}
+        default_fn = default.fn
+
+        def _switch(item, context=None):
+            return _switch_lookup(case_fns, switch_on_fn(item, context), default_fn)(item, context)
+        return _Node(_switch)
+
+    def _root_doc(self, spec):
+        wrapped = RootDocExpressionSpec.wrap(spec)
+        expression = self._expression_node(wrapped.expression).fn
+
+        def _root_doc(item, context=None):
+            if context is None:
+                return None
+            return expression(context.root_doc, context)
+        return _Node(_root_doc)
+
+    def _nested(self, spec):
+        wrapped = NestedExpressionSpec.wrap(spec)
+        argument = self._expression_node(wrapped.argument_expression).fn
+        value = self._expression_node(wrapped.value_expression).fn
+
+        def _nested(item, context=None):
+            return value(argument(item, context), context)
+        return _Node(_nested)
+
+    def _array_index(self, spec):
+        wrapped = ArrayIndexExpressionSpec.wrap(spec)
+        array_expression = self._expression_node(wrapped.array_expression).fn
+        index_expression = self._expression_node(wrapped.index_expression).fn
+
+        def _array_index(item, context=None):
+            array_value = array_expression(item, context)
+            if not isinstance(array_value, list):
+                return None
+            index_value = index_expression(item, context)
+            if not isinstance(index_value, int):
+                return None
+            try:
+                return array_value[index_value]
+            except IndexError:
+                return None
+        return _Node(_array_index)
+
+    def _coalesce(self, spec):
+        wrapped = CoalesceExpressionSpec.wrap(spec)
+        expression = self._expression_node(wrapped.expression)
+        default = self._expression_node(wrapped.default_expression)
+        if expression.is_constant:
+            self.stats['folded'] += 1
+            return default if expression.value is None or expression.value == '' else expression
+
+        expression_fn, default_fn = expression.fn, default.fn
+
+        def _coalesce(item, context=None):
+            value = expression_fn(item, context)
+            if value is None or value == '':
+                return default_fn(item, context)
+            return value
+        return _Node(_coalesce)
+
+    def _dict(self, spec):
+        wrapped = DictExpressionSpec.wrap(spec)
+        properties = {key: self._expression_node(value) for key, value in wrapped.properties.items()}
+        # validates the property names
+        wrapped.configure(compiled_properties=properties)
+        property_fns = tuple((key, node.fn) for key, node in properties.items())
+
+        def _dict(item, context=None):
+            return {key: fn(item, context) for key, fn in property_fns}
+        return _Node(_dict)
+
+    expression_builders = {
+        'identity': _identity,
+        'constant': _constant,
+        'base_iteration_number': _iteration_number,
+        'property_name': _property_name,
+        'property_path': _property_path,
+        'named': _named,
+        'conditional': _conditional,
+        'switch': _switch,
+        'root_doc': _root_doc,
+        'nested': _nested,
+        'array_index': _array_index,
+        'coalesce': _coalesce,
+        'dict': _dict,
+    }
+
+    # filters
+
+    def _compound_filter(self, spec):
+        if not isinstance(spec.get('filters'), list):
+            raise BadSpecError('{0} filter type must include a "filters" list'.format(spec['type']))
+        if not spec['filters']:
+            raise BadSpecError('{0} filter must include at least one filter'.format(spec['type']))
+        is_and = spec['type'] == 'and'
+        filters = []
+        for sub_spec in spec['filters']:
+            node = self._filter_node(sub_spec)
+            if node.is_constant:
+                if bool(node.value) != is_and:
+                    # False in an AND or True in an OR decides the result
+                    return self._fold(not is_and)
+                self.stats['folded'] += 1
+            else:
+                filters.append(node.fn)
+
+        if not filters:
+            return self._fold(is_and)
+        filters = tuple(filters)
+        if is_and:
+            def _and(item, context=None):
+                for filter_fn in filters:
+                    if not filter_fn(item, context):
+                        return False
+                return True
+            return _Node(_and)
+
+        def _or(item, context=None):
+            for filter_fn in filters:
+                if filter_fn(item, context):
+                    return True
+            return False
+        return _Node(_or)
+
+    def _not_filter(self, spec):
+        wrapped = NotFilterSpec.wrap(spec)
+        node = self._filter_node(wrapped.filter)
+        if node.is_constant:
+            return self._fold(not node.value)
+        filter_fn = node.fn
+
+        def _not(item, context=None):
+            return not filter_fn(item, context)
+        return _Node(_not)
+
+    def _boolean_expression_filter(self, spec):
+        wrapped = BooleanExpressionFilterSpec.wrap(spec)
+        operator = get_operator(wrapped.operator)
+        expression = self._expression_node(wrapped.expression)
+        reference = self._expression_node(wrapped.property_value)
+        if expression.is_constant and reference.is_constant:
+            return self._fold(operator(expression.value, reference.value))
+
+        expression_fn = expression.fn
+        if reference.is_constant:
+            reference_value = reference.value
+
+            def _boolean_expression(item, context=None):
+                return operator(expression_fn(item, context), reference_value)
+        else:
+            reference_fn = reference.fn
+
+            def _boolean_expression(item, context=None):
+                return operator(expression_fn(item, context), reference_fn(item, context))
+        return _Node(_boolean_expression)
+
+    def _named_filter(self, spec):
+        wrapped = NamedFilterSpec.wrap(spec)
+        name = wrapped.name
+        if name not in self.named_filters:
+            raise BadSpecError('Name {} not found in list of named filters!'.format(name))
+        if name in self._compiling_names:
+            raise BadSpecError('Named filter {} references itself!'.format(name))
+        self._compiling_names.add(name)
+        try:
+            return self._filter_node(self.named_filters[name])
+        finally:
+            self._compiling_names.remove(name)
+
+    filter_builders = {
+        'and': _compound_filter,
+        'or': _compound_filter,
+        'not': _not_filter,
+        'boolean_expression': _boolean_expression_filter,
+        'named': _named_filter,
+    }
+
+
+def _get_transform(datatype):
+    if datatype:
+        return transform_from_datatype(datatype)
+    return eval_lazy
+
+
+def _switch_lookup(cases, value, default):
+    try:
+        return cases.get(value, default)
+    except TypeError:
+        # unhashable values can't match any of the (string) cases
+        return default
@@ -48,6 +48,12 @@ VALID_REFERENCED_DOC_TYPES = [
 ASYNC_INDICATOR_QUEUE_TIME = timedelta(minutes=5)
 ASYNC_INDICATOR_CHUNK_SIZE = 100
 
+# number of threads that build the documents of a couch backed data source in partitioned rebuilds
+UCR_REBUILD_COUCH_WORKERS = 4
+
+# batches of at least this many rows are saved to UCR tables with COPY rather than INSERT
+UCR_COPY_ROWS_THRESHOLD = 500
+
 XFORM_CACHE_KEY_PREFIX = 'xform_to_json_cache'
 
 NAMED_EXPRESSION_PREFIX = 'NamedExpression'
@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
+from dimagi.utils.couch.database import iter_docs
+
 from corehq.apps.userreports.models import (
     DataSourceConfiguration,
     StaticDataSourceConfiguration,
@@ -16,7 +18,20 @@ class DataSourceProvider(metaclass=ABCMeta):
         pass
 
     def get_data_sources(self):
-        sources = self.get_all_data_sources()
+        return self._filter_by_doc_type(self.get_all_data_sources())
+
+    def get_data_source_revs(self):
+        """
+        :returns: dict of data source ID -> revision for all the data sources of this
+        provider, including those of other document types
+        """
+        return {source._id: source._doc.get('_rev') for source in self.get_all_data_sources()}
+
+    def get_data_sources_by_ids(self, data_source_ids):
+        data_source_ids = set(data_source_ids)
+        return [source for source in self.get_data_sources() if source._id in data_source_ids]
+
+    def _filter_by_doc_type(self, sources):
         if self.referenced_doc_type:
             return [source for source in sources if source.referenced_doc_type == self.referenced_doc_type]
         else:
@@ -29,6 +44,27 @@ class DynamicDataSourceProvider(DataSourceProvider):
         return DataSourceConfiguration.view(
             'userreports/active_data_sources', reduce=False, include_docs=True).all()
 
+    def get_data_source_revs(self):
+        db = DataSourceConfiguration.get_db()
+        data_source_ids = [
+            row['id'] for row in
+            db.view('userreports/active_data_sources', reduce=False, include_docs=False)
+        ]
+        if not data_source_ids:
+            return {}
+        return {
+            row['id']: row['value']['rev']
+            for row in db.view('_all_docs', keys=data_source_ids)
+            if 'value' in row
+        }
+
+    def get_data_sources_by_ids(self, data_source_ids):
+        sources = [
+            DataSourceConfiguration.wrap(doc)
+            for doc in iter_docs(DataSourceConfiguration.get_db(), data_source_ids)
+        ]
+        return self._filter_by_doc_type([source for source in sources if not source.is_deactivated])
+
 
 class StaticDataSourceProvider(DataSourceProvider):
 
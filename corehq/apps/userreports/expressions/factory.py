@@ -349,6 +349,13 @@ class ExpressionFactory(object):
 
     @classmethod
     def from_spec(cls, spec, context=None):
+        compiler = getattr(context, 'compiler', None)
+        if compiler is not None:
+            return compiler.compile_expression(spec)
+        return cls.from_spec_interpreted(spec, context)
+
+    @classmethod
+    def from_spec_interpreted(cls, spec, context=None):
         if _is_literal(spec):
             return cls.from_spec(_convert_constant_to_expression_spec(spec), context)
         try:
@@ -512,22 +512,33 @@ class RelatedDocExpressionSpec(JsonObject):
     @staticmethod
     @ucr_context_cache(vary_on=('related_doc_type', 'doc_id',))
     def _get_document(related_doc_type, doc_id, context):
+        related_docs = context.related_docs
+        if related_docs is not None and related_docs.domain == context.root_doc['domain']:
+            try:
+                return related_docs.get(related_doc_type, doc_id)
+            except KeyError:
+                pass
+        else:
+            related_docs = None
+
         document_store = get_document_store_for_doc_type(
             context.root_doc['domain'], related_doc_type,
             load_source="related_doc_expression")
         try:
             doc = document_store.get_document(doc_id)
         except DocumentNotFoundError:
-            return None
-        if context.root_doc['domain'] != doc.get('domain'):
-            return None
+            doc = None
+        if doc is not None and context.root_doc['domain'] != doc.get('domain'):
+            doc = None
+        if related_docs is not None:
+            related_docs.set(related_doc_type, doc_id, doc)
         return doc
 
     def get_value(self, doc_id, context):
         assert context.root_doc['domain']
         doc = self._get_document(self.related_doc_type, doc_id, context)
         # explicitly use a new evaluation context since this is a new document
-        return self._value_expression(doc, EvaluationContext(doc, 0))
+        return self._value_expression(doc, EvaluationContext(doc, 0, related_docs=context.related_docs))
 
     def __str__(self):
         return "{}[{}]/{}".format(self.related_doc_type,
@@ -85,6 +85,13 @@ class FilterFactory(object):
 
     @classmethod
     def from_spec(cls, spec, context=None):
+        compiler = getattr(context, 'compiler', None)
+        if compiler is not None:
+            return compiler.compile_filter(spec)
+        return cls.from_spec_interpreted(spec, context)
+
+    @classmethod
+    def from_spec_interpreted(cls, spec, context=None):
         cls.validate_spec(spec)
         try:
             return cls.constructor_map[spec['type']](spec, context)
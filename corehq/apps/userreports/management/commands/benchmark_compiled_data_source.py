@@ -0,0 +1,81 @@
+import time
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corehq.apps.userreports.models import (
+    DataSourceConfiguration,
+    get_datasource_config,
+)
+from corehq.apps.userreports.specs import EvaluationContext
+from corehq.apps.userreports.util import get_sample_docs
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the per document transform time of a data source with interpreted "
+        "and compiled expressions, over a sample of real documents from the domain"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('data_source_id')
+        parser.add_argument('--docs', type=int, default=200, help='Number of documents to sample')
+        parser.add_argument('--iterations', type=int, default=5, help='Passes over the sample for each mode')
+
+    def handle(self, domain, data_source_id, **options):
+        config, _ = get_datasource_config(data_source_id, domain)
+        docs = get_sample_docs(config, options['docs'], load_source='benchmark_compiled_data_source')
+        if not docs:
+            raise CommandError("No documents found for {}".format(data_source_id))
+
+        interpreted = _copy_config(config, compile_expressions=False)
+        compiled = _copy_config(config, compile_expressions=True)
+
+        mismatches = [
+            doc['_id'] for doc in docs
+            if _comparable_rows(interpreted, doc) != _comparable_rows(compiled, doc)
+        ]
+        if mismatches:
+            print("WARNING: compiled rows differ for {} docs, e.g. {}".format(len(mismatches), mismatches[:5]))
+
+        interpreted_time = _time_transform(interpreted, docs, options['iterations'])
+        compiled_time = _time_transform(compiled, docs, options['iterations'])
+        print("Documents: {}, iterations: {}".format(len(docs), options['iterations']))
+        print("Interpreted: {:.3f} ms / doc".format(interpreted_time * 1000))
+        print("Compiled:    {:.3f} ms / doc".format(compiled_time * 1000))
+        print("Speedup:     {:.2f}x".format(interpreted_time / compiled_time))
+        print("Compiler stats: {}".format(dict(compiled.expression_compiler.stats)))
+
+
+def _copy_config(config, compile_expressions):
+    copied = DataSourceConfiguration.wrap(deepcopy(config.to_json()))
+    copied._compile_expressions = compile_expressions
+    # build the indicators up front so that it isn't included in the timing
+    copied.indicators
+    return copied
+
+
+def _transform(config, doc):
+    # mirrors get_all_values without validations, which write to the database
+    eval_context = EvaluationContext(doc)
+    rows = []
+    for item in config.get_items(doc, eval_context):
+        rows.append(config.indicators.get_values(item, eval_context))
+        eval_context.increment_iteration()
+    return rows
+
+
+def _comparable_rows(config, doc):
+    return [
+        [(value.column.id, value.value) for value in row if value.column.id != 'inserted_at']
+        for row in _transform(config, doc)
+    ]
+
+
+def _time_transform(config, docs, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        for doc in docs:
+            _transform(config, doc)
+    return (time.perf_counter() - start) / (iterations * len(docs))
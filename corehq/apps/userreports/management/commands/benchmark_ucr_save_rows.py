@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corehq.apps.userreports.models import get_datasource_config
+from corehq.apps.userreports.sql.adapter import IndicatorSqlAdapter
+from corehq.apps.userreports.util import get_sample_docs
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the rows / second written to a data source table with INSERT and with COPY, "
+        "using rows from a sample of real documents. Writes to a temporary copy of the table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('data_source_id')
+        parser.add_argument('--docs', type=int, default=1000, help='Number of documents to sample')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per save')
+        parser.add_argument('--iterations', type=int, default=3, help='Passes over the sample for each mode')
+
+    def handle(self, domain, data_source_id, **options):
+        config, _ = get_datasource_config(data_source_id, domain)
+        docs = get_sample_docs(config, options['docs'], load_source='benchmark_ucr_save_rows')
+        rows = [row for doc in docs for row in config.get_all_values(doc)]
+        if not rows:
+            raise CommandError("No rows found for {}".format(data_source_id))
+
+        adapter = IndicatorSqlAdapter(config, override_table_name='benchmark_{}'.format(config.table_id))
+        if adapter.session_helper.is_citus_db:
+            raise CommandError("COPY is not used for data sources on Citus")
+        adapter.build_table(source='benchmark_ucr_save_rows')
+        try:
+            results = [
+                (name, _time_save(adapter, rows, options['batch_size'], options['iterations'], use_copy))
+                for name, use_copy in [('INSERT', False), ('COPY', True)]
+            ]
+        finally:
+            adapter.drop_table(source='benchmark_ucr_save_rows', skip_log=True)
+
+        print("Rows: {}, batch size: {}, upsert: {}".format(
+            len(rows), options['batch_size'], adapter.supports_upsert()
+        ))
+        for name, seconds in results:
+            print("{:<8}{:.0f} rows / second".format(name, len(rows) / seconds))
+        print("Speedup: {:.2f}x".format(results[0][1] / results[1][1]))
+
+
+def _time_save(adapter, rows, batch_size, iterations, use_copy):
+    start = time.perf_counter()
+    for i in range(iterations):
+        for index in range(0, len(rows), batch_size):
+            adapter.save_rows(rows[index:index + batch_size], use_copy=use_copy)
+    return (time.perf_counter() - start) / iterations
@@ -60,6 +60,6 @@ def print_profile_stats(filename, sort_by):
        1) choose one of the previous calls to investigate
        2) use print_callees or print_callers to follow the calls
           * usage https://docs.python.org/2/library/profile.html#pstats.Stats.print_stats
-       3) check out branch je/time-ucr to get logs for processing time of each column
-          (you'll likely need to rebase it on latest master)
+       3) run profile_data_source_expressions to get the processing time of each column
+          and expression over a sample of documents
     """)
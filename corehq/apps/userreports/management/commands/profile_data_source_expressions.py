@@ -0,0 +1,76 @@
+import time
+from collections import Counter
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand, CommandError
+
+from corehq.apps.userreports.compiler import (
+    ExpressionCompiler,
+    ExpressionProfiler,
+    canonical_spec,
+)
+from corehq.apps.userreports.models import (
+    DataSourceConfiguration,
+    get_datasource_config,
+)
+from corehq.apps.userreports.specs import EvaluationContext
+from corehq.apps.userreports.util import get_sample_docs
+
+
+class Command(BaseCommand):
+    help = (
+        "Rank the indicators, expressions and filters of a data source by the time spent "
+        "evaluating them, over a sample of real documents from the domain"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain')
+        parser.add_argument('data_source_id')
+        parser.add_argument('--docs', type=int, default=200, help='Number of documents to sample')
+        parser.add_argument('--limit', type=int, default=20, help='Number of expressions to show')
+
+    def handle(self, domain, data_source_id, **options):
+        config, _ = get_datasource_config(data_source_id, domain)
+        docs = get_sample_docs(config, options['docs'], load_source='profile_data_source_expressions')
+        if not docs:
+            raise CommandError("No documents found for {}".format(data_source_id))
+
+        profiler = ExpressionProfiler()
+        config = DataSourceConfiguration.wrap(deepcopy(config.to_json()))
+        config.set_expression_compiler(ExpressionCompiler.for_data_source(
+            config, config.get_interpreted_factory_context(), profiler=profiler
+        ))
+        # build the indicators up front so that it isn't included in the timing
+        indicators = config.indicators.indicators
+
+        indicator_seconds = Counter()
+        start = time.perf_counter()
+        for doc in docs:
+            eval_context = EvaluationContext(doc)
+            for item in config.get_items(doc, eval_context):
+                for indicator in indicators:
+                    indicator_start = time.perf_counter()
+                    indicator.get_values(item, eval_context)
+                    indicator_seconds[_indicator_name(indicator)] += time.perf_counter() - indicator_start
+                eval_context.increment_iteration()
+        total_seconds = time.perf_counter() - start
+
+        print("Documents: {}, {:.3f} ms / doc\n".format(len(docs), total_seconds * 1000 / len(docs)))
+        print("Indicators by total time\n")
+        for name, seconds in indicator_seconds.most_common():
+            print("{:>10.1f} ms {:>6.1%}  {}".format(seconds * 1000, seconds / total_seconds, name))
+
+        print("\nExpressions and filters by total time, including sub-expressions\n")
+        print("{:>10} {:>10} {:>12}  {}".format('total ms', 'calls', 'us / call', 'spec'))
+        for kind, spec, calls, seconds in profiler.get_report(options['limit']):
+            print("{:>10.1f} {:>10} {:>12.1f}  {} {}".format(
+                seconds * 1000, calls, seconds * 1000000 / calls, kind, _truncate(canonical_spec(spec))
+            ))
+
+
+def _indicator_name(indicator):
+    return ', '.join(column.id for column in indicator.get_columns()) or indicator.display_name
+
+
+def _truncate(value, length=120):
+    return value if len(value) <= length else value[:length - 3] + '...'
@@ -10,17 +10,21 @@ class Command(BaseCommand):
         parser.add_argument('indicator_config_id')
         parser.add_argument('--in-place', action='store_true', dest='in_place', default=False,
                             help='Rebuild table in place (preserve existing data)')
+        parser.add_argument('--partitioned', action='store_true', default=False,
+                            help='Split the rebuild into partitions that are built concurrently by celery')
         parser.add_argument('--initiated-by', action='store', required=True, dest='initiated',
                             help='Who initiated the rebuild (for sending email notifications)')
 
     def handle(self, indicator_config_id, **options):
         if options['in_place']:
             tasks.rebuild_indicators_in_place(
-                indicator_config_id, options['initiated'], source='rebuild_indicator_table'
+                indicator_config_id, options['initiated'], source='rebuild_indicator_table',
+                partitioned=options['partitioned'],
             )
         else:
             tasks.rebuild_indicators(
                 indicator_config_id,
                 initiated_by=options['initiated'],
-                source='rebuild_indicator_table'
+                source='rebuild_indicator_table',
+                partitioned=options['partitioned'],
             )
@@ -380,8 +380,47 @@ class DataSourceConfiguration(CachedCouchDocumentMixin, Document, AbstractUCRDat
                 for name, filter in self.named_filters.items()}
 
     def get_factory_context(self):
+        return FactoryContext(
+            self.named_expression_objects, self.named_filter_objects, self.expression_compiler
+        )
+
+    @property
+    @memoized
+    def expression_compiler(self):
+        """The ``ExpressionCompiler`` shared by all the expressions and filters in this
+        data source, or None if they should be interpreted.
+
+        Set ``_compile_expressions`` before first use to override the domain toggle,
+        or use ``set_expression_compiler`` to share a compiler with other data sources.
+        """
+        from corehq import toggles
+        from corehq.apps.userreports.compiler import ExpressionCompiler
+        shared_compiler = getattr(self, '_shared_expression_compiler', None)
+        if shared_compiler is not None:
+            return shared_compiler
+        compile_expressions = getattr(self, '_compile_expressions', None)
+        if compile_expressions is None:
+            compile_expressions = toggles.UCR_COMPILED_EXPRESSIONS.enabled(self.domain)
+        if not compile_expressions:
+            return None
+        return ExpressionCompiler.for_data_source(self, self.get_interpreted_factory_context())
+
+    def set_expression_compiler(self, compiler):
+        """Must be called before the indicators, filters or expressions are first used"""
+        self._shared_expression_compiler = compiler
+
+    def get_interpreted_factory_context(self):
         return FactoryContext(self.named_expression_objects, self.named_filter_objects)
 
+    @property
+    @memoized
+    def root_related_doc_expressions(self):
+        """``(related_doc_type, doc_id_expression)`` for the ``related_doc`` expressions
+        that are evaluated on the root document, used to prefetch related documents
+        """
+        from corehq.apps.userreports.related_docs import get_root_related_doc_expressions
+        return get_root_related_doc_expressions(self)
+
     @property
     @memoized
     def default_indicators(self):
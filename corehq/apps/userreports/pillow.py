@@ -1,10 +1,15 @@
 import hashlib
 import signal
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from datetime import datetime, timedelta
+from functools import partial
 
 from django.conf import settings
 
+from memoized import memoized
+
 from pillowtop.checkpoints.manager import KafkaPillowCheckpoint
 from pillowtop.const import DEFAULT_PROCESSOR_CHUNK_SIZE
 from pillowtop.dao.exceptions import DocumentMismatchError
@@ -20,13 +25,13 @@ from corehq.apps.change_feed.consumer.feed import (
 )
 from corehq.apps.change_feed.topics import LOCATION as LOCATION_TOPIC
 from corehq.apps.domain.dbaccessors import get_domain_ids_by_names
+from corehq.apps.userreports.compiler import get_shared_compilers
 from corehq.apps.userreports.const import KAFKA_TOPICS
 from corehq.apps.userreports.data_source_providers import (
     DynamicDataSourceProvider,
     StaticDataSourceProvider,
 )
 from corehq.apps.userreports.exceptions import (
-    BadSpecError,
     StaleRebuildError,
     TableRebuildError,
     UserReportsWarning,
@@ -37,12 +42,14 @@ from corehq.apps.userreports.rebuild import (
     get_tables_rebuild_migrate,
     migrate_tables,
 )
+from corehq.apps.userreports.related_docs import prefetch_related_docs
 from corehq.apps.userreports.specs import EvaluationContext
 from corehq.apps.userreports.sql import get_metadata
 from corehq.apps.userreports.tasks import rebuild_indicators
 from corehq.apps.userreports.util import get_indicator_adapter
 from corehq.sql_db.connections import connection_manager
-from corehq.util.datadog.gauges import datadog_bucket_timer, datadog_histogram
+from corehq.toggles import UCR_COMPILED_EXPRESSIONS
+from corehq.util.datadog.gauges import datadog_bucket_timer, datadog_counter, datadog_histogram
 from corehq.util.soft_assert import soft_assert
 from corehq.util.timer import TimingContext
 
@@ -105,6 +112,10 @@ def _filter_missing_domains(configs):
     ]
 
 
+def _copy_config(config):
+    return config.__class__.wrap(deepcopy(config.to_json()))
+
+
 class ConfigurableReportTableManagerMixin(object):
 
     def __init__(self, data_source_providers, ucr_division=None,
@@ -124,6 +135,8 @@ class ConfigurableReportTableManagerMixin(object):
         """
         self.bootstrapped = False
         self.last_bootstrapped = datetime.utcnow()
+        # data source ID -> revision as of the last bootstrap
+        self.config_revs = {}
         self.data_source_providers = data_source_providers
         self.ucr_division = ucr_division
         self.include_ucrs = include_ucrs
@@ -162,26 +175,146 @@ class ConfigurableReportTableManagerMixin(object):
         )
 
     def bootstrap_if_needed(self):
-        if self.needs_bootstrap():
+        if not self.bootstrapped:
             self.bootstrap()
+        elif self.needs_bootstrap():
+            self.incremental_bootstrap()
 
     def bootstrap(self, configs=None):
-        configs = self.get_filtered_configs(configs)
-        if not configs:
-            pillow_logging.warning("UCR pillow has no configs to process")
+        with self._bootstrap_timer('full'):
+            if configs is None:
+                config_revs = self._get_config_revs()
+            else:
+                config_revs = {config._id: config._doc.get('_rev') for config in configs}
+            configs = self.get_filtered_configs(configs)
+            if not configs:
+                pillow_logging.warning("UCR pillow has no configs to process")
+
+            self.table_adapters_by_domain = defaultdict(list)
+            self.compiled_nodes_by_domain = defaultdict(list)
+            self._share_expression_compilers(configs)
+
+            for config in configs:
+                self.table_adapters_by_domain[config.domain].append(
+                    get_indicator_adapter(config, raise_errors=True, load_source='change_feed')
+                )
+
+            if self.run_migrations:
+                self.rebuild_tables_if_necessary()
+
+            self.config_revs = config_revs
+            self.bootstrapped = True
+            self.last_bootstrapped = datetime.utcnow()
 
-        self.table_adapters_by_domain = defaultdict(list)
+    def incremental_bootstrap(self):
+        """Reload only the data sources that have been added, changed or removed
+        since the last bootstrap, and only check their tables for changes.
 
+        The data sources of other domains are left as they are.
+        """
+        with self._bootstrap_timer('incremental'):
+            revs_by_provider = [
+                (provider, provider.get_data_source_revs())
+                for provider in self.data_source_providers
+            ]
+            config_revs = {}
+            changed_configs = []
+            for provider, revs in revs_by_provider:
+                config_revs.update(revs)
+                changed_ids = [
+                    config_id for config_id, rev in revs.items()
+                    if config_id not in self.config_revs or self.config_revs[config_id] != rev
+                ]
+                if changed_ids:
+                    changed_configs.extend(provider.get_data_sources_by_ids(changed_ids))
+
+            # removed, changed or new data sources
+            stale_ids = {
+                config_id for config_id, rev in self.config_revs.items()
+                if config_id not in config_revs or config_revs[config_id] != rev
+            }
+            stale_ids.update(config._id for config in changed_configs)
+            if stale_ids:
+                changed_configs = self.get_filtered_configs(changed_configs) if changed_configs else []
+                self._reload_configs(changed_configs, stale_ids)
+
+            datadog_counter('commcare.change_feed.ucr_bootstrap.configs_reloaded', len(stale_ids))
+            self.config_revs = config_revs
+            self.last_bootstrapped = datetime.utcnow()
+
+    def _reload_configs(self, changed_configs, stale_ids):
+        """Replace the adapters of data sources in ``stale_ids`` with adapters
+        for ``changed_configs`` then rebuild or migrate their tables
+        """
+        changed_configs_by_domain = defaultdict(list)
+        for config in changed_configs:
+            changed_configs_by_domain[config.domain].append(config)
+        domains = set(changed_configs_by_domain) | {
+            domain for domain, adapters in self.table_adapters_by_domain.items()
+            if any(adapter.config._id in stale_ids for adapter in adapters)
+        }
+
+        changed_adapters = []
+        for domain in domains:
+            adapters = [
+                adapter for adapter in self.table_adapters_by_domain.get(domain, [])
+                if adapter.config._id not in stale_ids
+            ]
+            configs = changed_configs_by_domain[domain]
+            if configs and self._shares_expression_compilers(domain):
+                # compilers are shared when the expressions are first used, so share
+                # them again between fresh copies of the unchanged data sources
+                configs = [_copy_config(adapter.config) for adapter in adapters] + configs
+                adapters = []
+                self.compiled_nodes_by_domain.pop(domain, None)
+                self._share_expression_compilers(configs)
+
+            for config in configs:
+                adapter = get_indicator_adapter(config, raise_errors=True, load_source='change_feed')
+                adapters.append(adapter)
+                if config._id in stale_ids:
+                    changed_adapters.append(adapter)
+
+            if adapters:
+                self.table_adapters_by_domain[domain] = adapters
+            else:
+                self.table_adapters_by_domain.pop(domain, None)
+
+        if self.run_migrations and changed_adapters:
+            self._rebuild_sql_tables(changed_adapters)
+
+    def _get_config_revs(self):
+        config_revs = {}
+        for provider in self.data_source_providers:
+            config_revs.update(provider.get_data_source_revs())
+        return config_revs
+
+    def _bootstrap_timer(self, bootstrap_type):
+        return datadog_bucket_timer('commcare.change_feed.ucr_bootstrap.timing', tags=[
+            'type:{}'.format(bootstrap_type),
+        ], timing_buckets=(1, 10, 60, 300, 900))
+
+    def _share_expression_compilers(self, configs):
+        """Compile the expressions of data sources in the same domain and on the same
+        document type together, so that expressions they have in common are evaluated
+        once per document rather than once per data source.
+        """
+        configs_by_doc_type = defaultdict(list)
         for config in configs:
-            self.table_adapters_by_domain[config.domain].append(
-                get_indicator_adapter(config, raise_errors=True, load_source='change_feed')
-            )
+            configs_by_doc_type[(config.domain, config.referenced_doc_type)].append(config)
 
-        if self.run_migrations:
-            self.rebuild_tables_if_necessary()
+        for (domain, doc_type), doc_type_configs in configs_by_doc_type.items():
+            if len(doc_type_configs) < 2 or not self._shares_expression_compilers(domain):
+                continue
+            # the expressions are compiled when they are first used, so errors in
+            # their specs are raised by the data source that uses them
+            compilers = get_shared_compilers(doc_type_configs)
+            for config in doc_type_configs:
+                config.set_expression_compiler(compilers[config._id])
+            self.compiled_nodes_by_domain[domain].append(compilers[doc_type_configs[0]._id].nodes)
 
-        self.bootstrapped = True
-        self.last_bootstrapped = datetime.utcnow()
+    def _shares_expression_compilers(self, domain):
+        return UCR_COMPILED_EXPRESSIONS.enabled(domain)
 
     def rebuild_tables_if_necessary(self):
         self._rebuild_sql_tables([
@@ -265,6 +398,23 @@ class ConfigurableReportPillowProcessor(ConfigurableReportTableManagerMixin, Bul
 
     domain_timing_context = Counter()
 
+    def __init__(self, *args, adapter_workers=0, **kwargs):
+        """
+        Keyword Arguments:
+        adapter_workers -- if greater than one, the number of threads used to process
+                           the data sources in a domain concurrently within a chunk
+        """
+        super(ConfigurableReportPillowProcessor, self).__init__(*args, **kwargs)
+        self.adapter_workers = adapter_workers
+
+    def _shares_expression_compilers(self, domain):
+        # a shared compiler's nodes and counters would be mutated by the threads
+        # of every data source it's shared with, and the threads don't share
+        # evaluation contexts, so each data source keeps its own compiler
+        if self.adapter_workers > 1:
+            return False
+        return super(ConfigurableReportPillowProcessor, self)._shares_expression_compilers(domain)
+
     @time_ucr_process_change
     def _save_doc_to_table(self, domain, table, doc, eval_context):
         # best effort will swallow errors in the table
@@ -273,6 +423,7 @@ class ConfigurableReportPillowProcessor(ConfigurableReportTableManagerMixin, Bul
         except UserReportsWarning:
             # remove it until the next bootstrap call
             self.table_adapters_by_domain[domain].remove(table)
+            self.config_revs.pop(table.config._id, None)
 
     def process_changes_chunk(self, changes):
         """
@@ -301,19 +452,57 @@ class ConfigurableReportPillowProcessor(ConfigurableReportTableManagerMixin, Bul
     def _process_chunk_for_domain(self, domain, changes_chunk):
         adapters = list(self.table_adapters_by_domain[domain])
         changes_by_id = {change.id: change for change in changes_chunk}
-        to_delete_by_adapter = defaultdict(list)
-        rows_to_save_by_adapter = defaultdict(list)
-        async_configs_by_doc_id = defaultdict(list)
         to_update = {change for change in changes_chunk if not change.deleted}
         with self._datadog_timing('extract'):
             retry_changes, docs = bulk_fetch_changes_docs(to_update, domain)
+
+        with self._datadog_timing('related_doc_prefetch'):
+            related_docs = prefetch_related_docs(domain, docs, [adapter.config for adapter in adapters])
+
+        process_adapters = partial(
+            self._process_adapters, changes_chunk, changes_by_id, to_update, docs, related_docs
+        )
+        if self.adapter_workers > 1 and len(adapters) > 1:
+            # each adapter is processed by one thread, with its own database session
+            results = list(self._adapter_executor.map(process_adapters, [[adapter] for adapter in adapters]))
+        else:
+            results = [process_adapters(adapters)]
+
+        change_exceptions = []
+        async_configs_by_doc_id = defaultdict(list)
+        for adapter_retry_changes, adapter_exceptions, adapter_async_configs in results:
+            retry_changes.update(adapter_retry_changes)
+            change_exceptions.extend(adapter_exceptions)
+            for doc_id, config_ids in adapter_async_configs.items():
+                async_configs_by_doc_id[doc_id].extend(config_ids)
+
+        if async_configs_by_doc_id:
+            with self._datadog_timing('async_config_load'):
+                doc_type_by_id = {
+                    _id: changes_by_id[_id].metadata.document_type
+                    for _id in async_configs_by_doc_id.keys()
+                }
+                AsyncIndicator.bulk_update_records(async_configs_by_doc_id, domain, doc_type_by_id)
+
+        self._record_shared_evaluations(domain)
+        return retry_changes, change_exceptions
+
+    def _process_adapters(self, changes_chunk, changes_by_id, to_update, docs, related_docs, adapters):
+        """Transform ``docs`` for each adapter then bulk delete and load the results
+
+        :returns: tuple of (changes to retry, list of (change, exception), dict of doc ID -> async config IDs)
+        """
+        to_delete_by_adapter = defaultdict(list)
+        rows_to_save_by_adapter = defaultdict(list)
+        async_configs_by_doc_id = defaultdict(list)
+        retry_changes = set()
         change_exceptions = []
 
         with self._datadog_timing('single_batch_transform'):
             for doc in docs:
                 change = changes_by_id[doc['_id']]
                 doc_subtype = change.metadata.document_subtype
-                eval_context = EvaluationContext(doc)
+                eval_context = EvaluationContext(doc, related_docs=related_docs)
                 with self._datadog_timing('single_doc_transform'):
                     for adapter in adapters:
                         with self._datadog_timing('transform', adapter.config._id):
@@ -355,15 +544,22 @@ class ConfigurableReportPillowProcessor(ConfigurableReportTableManagerMixin, Bul
                     except Exception:
                         retry_changes.update(to_update)
 
-        if async_configs_by_doc_id:
-            with self._datadog_timing('async_config_load'):
-                doc_type_by_id = {
-                    _id: changes_by_id[_id].metadata.document_type
-                    for _id in async_configs_by_doc_id.keys()
-                }
-                AsyncIndicator.bulk_update_records(async_configs_by_doc_id, domain, doc_type_by_id)
+        return retry_changes, change_exceptions, async_configs_by_doc_id
 
-        return retry_changes, change_exceptions
+    @property
+    @memoized
+    def _adapter_executor(self):
+        return ThreadPoolExecutor(max_workers=self.adapter_workers)
+
+    def _record_shared_evaluations(self, domain):
+        evaluations_saved = sum(
+            nodes.pop_evaluations_saved()
+            for nodes in self.compiled_nodes_by_domain.get(domain, [])
+        )
+        if evaluations_saved:
+            datadog_counter('commcare.change_feed.ucr_shared_evaluations', evaluations_saved, tags=[
+                'domain:{}'.format(domain),
+            ])
 
     def _datadog_timing(self, step, config_id=None):
         tags = [
@@ -442,7 +638,7 @@ class ConfigurableReportKafkaPillow(ConstructedPillow):
     # todo; To remove after full rollout of https://github.com/dimagi/commcare-hq/pull/21329/
 
     def __init__(self, processor, pillow_name, topics, num_processes, process_num, retry_errors=False,
-            processor_chunk_size=0):
+            processor_chunk_size=0, max_processor_chunk_size=0, prefetch_chunks=0):
         change_feed = KafkaChangeFeed(
             topics, client_id=pillow_name, num_processes=num_processes, process_num=process_num
         )
@@ -457,7 +653,9 @@ class ConfigurableReportKafkaPillow(ConstructedPillow):
             processor=processor,
             checkpoint=checkpoint,
             change_processed_event_handler=event_handler,
-            processor_chunk_size=processor_chunk_size
+            processor_chunk_size=processor_chunk_size,
+            max_processor_chunk_size=max_processor_chunk_size,
+            prefetch_chunks=prefetch_chunks,
         )
         # set by the superclass constructor
         assert self.processors is not None
@@ -479,7 +677,8 @@ class ConfigurableReportKafkaPillow(ConstructedPillow):
 def get_kafka_ucr_pillow(pillow_id='kafka-ucr-main', ucr_division=None,
                          include_ucrs=None, exclude_ucrs=None, topics=None,
                          num_processes=1, process_num=0,
-                         processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, **kwargs):
+                         processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, max_processor_chunk_size=0,
+                         adapter_workers=0, prefetch_chunks=0, **kwargs):
     # todo; To remove after full rollout of https://github.com/dimagi/commcare-hq/pull/21329/
     topics = topics or KAFKA_TOPICS
     topics = [t for t in topics]
@@ -489,20 +688,24 @@ def get_kafka_ucr_pillow(pillow_id='kafka-ucr-main', ucr_division=None,
             ucr_division=ucr_division,
             include_ucrs=include_ucrs,
             exclude_ucrs=exclude_ucrs,
-            run_migrations=(process_num == 0)  # only first process runs migrations
+            run_migrations=(process_num == 0),  # only first process runs migrations
+            adapter_workers=adapter_workers,
         ),
         pillow_name=pillow_id,
         topics=topics,
         num_processes=num_processes,
         process_num=process_num,
         processor_chunk_size=processor_chunk_size,
+        max_processor_chunk_size=max_processor_chunk_size,
+        prefetch_chunks=prefetch_chunks,
     )
 
 
 def get_kafka_ucr_static_pillow(pillow_id='kafka-ucr-static', ucr_division=None,
                                 include_ucrs=None, exclude_ucrs=None, topics=None,
                                 num_processes=1, process_num=0,
-                                processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, **kwargs):
+                                processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, max_processor_chunk_size=0,
+                                adapter_workers=0, prefetch_chunks=0, **kwargs):
     # todo; To remove after full rollout of https://github.com/dimagi/commcare-hq/pull/21329/
     topics = topics or KAFKA_TOPICS
     topics = [t for t in topics]
@@ -513,7 +716,8 @@ def get_kafka_ucr_static_pillow(pillow_id='kafka-ucr-static', ucr_division=None,
             include_ucrs=include_ucrs,
             exclude_ucrs=exclude_ucrs,
             bootstrap_interval=7 * 24 * 60 * 60,  # 1 week
-            run_migrations=(process_num == 0)  # only first process runs migrations
+            run_migrations=(process_num == 0),  # only first process runs migrations
+            adapter_workers=adapter_workers,
         ),
         pillow_name=pillow_id,
         topics=topics,
@@ -521,6 +725,8 @@ def get_kafka_ucr_static_pillow(pillow_id='kafka-ucr-static', ucr_division=None,
         process_num=process_num,
         retry_errors=True,
         processor_chunk_size=processor_chunk_size,
+        max_processor_chunk_size=max_processor_chunk_size,
+        prefetch_chunks=prefetch_chunks,
     )
 
 
@@ -1,3 +1,4 @@
+import json
 import logging
 from collections import defaultdict
 
@@ -14,6 +15,7 @@ from fluff.signals import (
 )
 
 from corehq.apps.userreports.models import id_is_static
+from corehq.form_processor.utils.general import should_use_sql_backend
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +34,8 @@ class DataSourceResumeHelper(object):
         self.config = config
         self._client = get_redis_client().client.get_client()
         self._key = get_redis_key_for_config(config)
+        self._partitions_key = '{}:partitions'.format(self._key)
+        self._completed_partitions_key = '{}:completed-partitions'.format(self._key)
 
     def get_completed_case_type_or_xmlns(self):
         return self._client.lrange(self._key, 0, -1)
@@ -39,11 +43,109 @@ class DataSourceResumeHelper(object):
     def add_completed_case_type_or_xmlns(self, case_type_or_xmlns):
         self._client.rpush(self._key, case_type_or_xmlns)
 
+    def set_partitions(self, partitions):
+        pipeline = self._client.pipeline()
+        pipeline.delete(self._partitions_key, self._completed_partitions_key)
+        pipeline.rpush(self._partitions_key, *[partition.key for partition in partitions])
+        pipeline.execute()
+
+    def get_partitions(self):
+        return [
+            RebuildPartition.from_key(key.decode('utf-8'))
+            for key in self._client.lrange(self._partitions_key, 0, -1)
+        ]
+
+    def get_completed_partitions(self):
+        return {
+            RebuildPartition.from_key(key.decode('utf-8'))
+            for key in self._client.smembers(self._completed_partitions_key)
+        }
+
+    def add_completed_partition(self, partition):
+        """Mark a partition as built
+
+        :return: True if this call completed the last outstanding partition.
+        Only one caller will ever see True for a given build.
+        """
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.sadd(self._completed_partitions_key, partition.key)
+        pipeline.scard(self._completed_partitions_key)
+        pipeline.llen(self._partitions_key)
+        added, num_completed, num_partitions = pipeline.execute()
+        return bool(added) and num_completed >= num_partitions
+
+    def is_partitioned(self):
+        return bool(self._client.exists(self._partitions_key))
+
     def clear_resume_info(self):
-        self._client.delete(self._key)
+        self._client.delete(self._key, self._partitions_key, self._completed_partitions_key)
 
     def has_resume_info(self):
-        return self._client.exists(self._key)
+        return bool(self._client.exists(self._key) or self._client.exists(self._partitions_key))
+
+
+@attr.s(frozen=True)
+class RebuildPartition(object):
+    """An independently buildable slice of the documents in a data source
+
+    SQL forms and cases are split by the shard they live on (``db_alias``).
+    Everything else has a single partition for each case type or xmlns,
+    whose IDs are read once and built by a pool of threads.
+    """
+    case_type_or_xmlns = attr.ib()
+    db_alias = attr.ib(default=None)
+
+    @property
+    def key(self):
+        return json.dumps([self.case_type_or_xmlns, self.db_alias])
+
+    @classmethod
+    def from_key(cls, key):
+        return cls(*json.loads(key))
+
+    def iter_document_ids(self, config, document_store):
+        from corehq.apps.change_feed import document_types
+        from corehq.form_processor.backends.sql.dbaccessors import (
+            CaseReindexAccessor,
+            FormAccessorSQL,
+            iter_all_ids,
+        )
+        if self.db_alias is None:
+            return document_store.iter_document_ids()
+        elif config.referenced_doc_type in document_types.CASE_DOC_TYPES:
+            accessor = CaseReindexAccessor(
+                config.domain, case_type=self.case_type_or_xmlns, limit_db_aliases=[self.db_alias]
+            )
+            return iter_all_ids(accessor)
+        else:
+            # the same forms as the document store's iter_document_ids, limited to this shard
+            return FormAccessorSQL.iter_form_ids_by_xmlns(
+                config.domain, self.case_type_or_xmlns, db_alias=self.db_alias
+            )
+
+
+def get_rebuild_partitions(config):
+    """Split the documents a data source is built from into ``RebuildPartition``s
+    that can be built concurrently
+    """
+    from corehq.apps.change_feed import document_types
+    from corehq.sql_db.util import get_db_aliases_for_partitioned_query
+    from couchforms.models import all_known_formlike_doc_types
+
+    doc_type = config.referenced_doc_type
+    split_by_shard = should_use_sql_backend(config.domain) and (
+        doc_type in document_types.CASE_DOC_TYPES or doc_type in all_known_formlike_doc_types()
+    )
+    partitions = []
+    for case_type_or_xmlns in config.get_case_type_or_xmlns_filter():
+        if split_by_shard:
+            partitions.extend(
+                RebuildPartition(case_type_or_xmlns, db_alias=db_alias)
+                for db_alias in get_db_aliases_for_partitioned_query()
+            )
+        else:
+            partitions.append(RebuildPartition(case_type_or_xmlns))
+    return partitions
 
 
 @attr.s
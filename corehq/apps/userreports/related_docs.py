@@ -0,0 +1,141 @@
+from collections import defaultdict
+
+from corehq.apps.change_feed.data_sources import get_document_store_for_doc_type
+from corehq.apps.userreports.compiler import canonical_spec
+from corehq.apps.userreports.expressions.factory import ExpressionFactory
+from corehq.apps.userreports.specs import EvaluationContext
+
+# keys of expressions and filters whose sub-expressions are evaluated on the same item
+# as the expression itself
+_SAME_ITEM_KEYS = {
+    'conditional': ('test', 'expression_if_true', 'expression_if_false'),
+    'switch': ('switch_on', 'default'),
+    'coalesce': ('expression', 'default_expression'),
+    'array_index': ('array_expression', 'index_expression'),
+    'nested': ('argument_expression',),
+    'iterator': ('expressions',),
+    'property_name': ('property_name',),
+    'boolean_expression': ('expression',),
+    'and': ('filters',),
+    'or': ('filters',),
+    'not': ('filter',),
+}
+# as above, for keys that are a dict of sub-expressions
+_SAME_ITEM_DICT_KEYS = {
+    'switch': 'cases',
+    'dict': 'properties',
+    'evaluator': 'context_variables',
+}
+
+
+class RelatedDocumentCache(object):
+    """Related documents for a chunk of changes in a single domain
+
+    Shared by the ``EvaluationContext`` of every document in the chunk, so that a
+    related document is loaded at most once per chunk. Documents that don't exist
+    or are in another domain are cached as None.
+    """
+
+    def __init__(self, domain):
+        self.domain = domain
+        self._docs = {}
+
+    def get(self, doc_type, doc_id):
+        """:raises: KeyError if the document hasn't been loaded"""
+        return self._docs[(doc_type, doc_id)]
+
+    def set(self, doc_type, doc_id, doc):
+        self._docs[(doc_type, doc_id)] = doc
+
+    def __len__(self):
+        return len(self._docs)
+
+    def prefetch(self, doc_type, doc_ids):
+        doc_ids = {doc_id for doc_id in doc_ids if (doc_type, doc_id) not in self._docs}
+        if not doc_ids:
+            return
+        document_store = get_document_store_for_doc_type(
+            self.domain, doc_type, load_source="related_doc_prefetch"
+        )
+        for doc in document_store.iter_documents(list(doc_ids)):
+            if doc.get('domain') == self.domain and doc.get('_id') in doc_ids:
+                self.set(doc_type, doc['_id'], doc)
+        for doc_id in doc_ids:
+            self._docs.setdefault((doc_type, doc_id), None)
+
+
+def prefetch_related_docs(domain, docs, configs):
+    """Load the related documents that ``configs`` look up from ``docs`` with one
+    query per document type, rather than one query per document.
+
+    Only ``related_doc`` expressions that are evaluated on the root document are
+    prefetched. Others, such as lookups from within a repeat, are loaded on demand
+    and cached for the rest of the chunk.
+
+    :returns: ``RelatedDocumentCache`` for the ``EvaluationContext`` of each document
+    """
+    related_docs = RelatedDocumentCache(domain)
+    doc_ids_by_type = defaultdict(set)
+    for config in configs:
+        for related_doc_type, doc_id_expression in config.root_related_doc_expressions:
+            for doc in docs:
+                try:
+                    doc_id = doc_id_expression(doc, EvaluationContext(doc))
+                except Exception:
+                    # errors are reported when the document is processed
+                    continue
+                if doc_id and isinstance(doc_id, str):
+                    doc_ids_by_type[related_doc_type].add(doc_id)
+
+    for related_doc_type, doc_ids in doc_ids_by_type.items():
+        related_docs.prefetch(related_doc_type, doc_ids)
+    return related_docs
+
+
+def get_root_related_doc_expressions(config):
+    """:returns: list of ``(related_doc_type, doc_id_expression)`` for each distinct
+    ``related_doc`` expression in ``config`` that is evaluated on the root document
+    """
+    specs = {}
+    named_expressions = config.named_expressions
+    named_filters = config.named_filters
+    seen_names = set()
+
+    def _walk(spec):
+        if isinstance(spec, list):
+            for sub_spec in spec:
+                _walk(sub_spec)
+            return
+        if not isinstance(spec, dict):
+            return
+        spec_type = spec.get('type')
+        if spec_type == 'related_doc':
+            doc_id_spec = spec.get('doc_id_expression')
+            key = (spec.get('related_doc_type'), canonical_spec(doc_id_spec))
+            specs.setdefault(key, doc_id_spec)
+            _walk(doc_id_spec)
+        elif spec_type == 'root_doc':
+            _walk(spec.get('expression'))
+        elif spec_type == 'named':
+            name = spec.get('name')
+            if name not in seen_names:
+                seen_names.add(name)
+                _walk(named_expressions.get(name))
+                _walk(named_filters.get(name))
+        for key in _SAME_ITEM_KEYS.get(spec_type, ()):
+            _walk(spec.get(key))
+        sub_specs = spec.get(_SAME_ITEM_DICT_KEYS.get(spec_type))
+        if isinstance(sub_specs, dict):
+            _walk(list(sub_specs.values()))
+
+    _walk(config.configured_filter)
+    if not config.base_item_expression:
+        for indicator in config.configured_indicators:
+            _walk(indicator.get('expression'))
+            _walk(indicator.get('filter'))
+
+    factory_context = config.get_factory_context()
+    return [
+        (related_doc_type, ExpressionFactory.from_spec(doc_id_spec, factory_context))
+        for (related_doc_type, _), doc_id_spec in specs.items()
+    ]
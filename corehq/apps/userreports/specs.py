@@ -13,7 +13,14 @@ def TypeProperty(value):
     return StringProperty(required=True, choices=[value])
 
 
-class FactoryContext(namedtuple('FactoryContext', ('named_expressions', 'named_filters'))):
+class FactoryContext(namedtuple('FactoryContext', ('named_expressions', 'named_filters', 'compiler'))):
+    """
+    :param compiler: optional ``ExpressionCompiler``. If set, expressions and filters
+    built with this context are compiled instead of interpreted.
+    """
+
+    def __new__(cls, named_expressions, named_filters, compiler=None):
+        return super(FactoryContext, cls).__new__(cls, named_expressions, named_filters, compiler)
 
     @staticmethod
     def empty():
@@ -26,12 +33,14 @@ class EvaluationContext(object):
     as the root document and the iteration number.
     """
 
-    def __init__(self, root_doc, iteration=0):
+    def __init__(self, root_doc, iteration=0, related_docs=None):
         self.root_doc = root_doc
         self.iteration = iteration
         self.inserted_timestamp = datetime.utcnow()
         self.cache = {}
         self.iteration_cache = {}
+        # RelatedDocumentCache shared by all the documents in a chunk, if any
+        self.related_docs = related_docs
 
     def exists_in_cache(self, key):
         return key in self.cache or key in self.iteration_cache
@@ -1,17 +1,20 @@
 import hashlib
 import itertools
 import logging
+from datetime import date, time
 
 from django.utils.translation import ugettext as _
 
 import psycopg2
 import sqlalchemy
+from psycopg2 import sql
 from memoized import memoized
 from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.schema import Index, PrimaryKeyConstraint
 
 from corehq.apps.userreports.adapter import IndicatorAdapter
+from corehq.apps.userreports.const import UCR_COPY_ROWS_THRESHOLD
 from corehq.apps.userreports.exceptions import (
     ColumnNotFoundError,
     TableRebuildError,
@@ -168,9 +171,12 @@ class IndicatorSqlAdapter(IndicatorAdapter):
         except Exception as e:
             self.handle_exception(doc, e)
 
-    def save_rows(self, rows):
+    def save_rows(self, rows, use_copy=None):
         """
         Saves rows to a data source after deleting the old rows
+
+        :param use_copy: If True load the rows with ``COPY`` (see ``_copy_rows``) rather
+        than ``INSERT``. Defaults to True for at least ``UCR_COPY_ROWS_THRESHOLD`` rows.
         """
         if not rows:
             return
@@ -185,6 +191,12 @@ class IndicatorSqlAdapter(IndicatorAdapter):
             if config.distribution_type == 'hash':
                 self._by_column_update(formatted_rows)
                 return
+        elif use_copy or (use_copy is None and len(formatted_rows) >= UCR_COPY_ROWS_THRESHOLD):
+            self._copy_rows(formatted_rows)
+            return
+        self._insert_rows(formatted_rows)
+
+    def _insert_rows(self, formatted_rows):
         doc_ids = set(row['doc_id'] for row in formatted_rows)
         table = self.get_table()
         if self.supports_upsert():
@@ -205,6 +217,35 @@ class IndicatorSqlAdapter(IndicatorAdapter):
             for query in queries:
                 session.execute(query)
 
+    def _copy_rows(self, formatted_rows):
+        """
+        Stream the rows into a temporary table with ``COPY FROM STDIN`` and merge them
+        into the data source table with a single statement.
+
+        This avoids compiling and sending an ``INSERT`` with every value inlined, which
+        is slow for large batches (e.g. rebuilds). Not supported on Citus.
+        """
+        table = self.get_table()
+        column_names = [column.name for column in table.columns if column.name in formatted_rows[0]]
+        columns = sql.SQL(', ').join(sql.Identifier(name) for name in column_names)
+        target = sql.Identifier(table.name)
+        temp_table = sql.Identifier('ucr_copy_{}'.format(hashlib.md5(table.name.encode('utf-8')).hexdigest()[:8]))
+        merge = _get_copy_merge_queries(table, column_names, temp_table, upsert=self.supports_upsert())
+
+        with self.session_context() as session:
+            cursor = session.connection().connection.cursor()
+            cursor.execute(sql.SQL("CREATE TEMPORARY TABLE {temp_table} (LIKE {target}) ON COMMIT DROP").format(
+                temp_table=temp_table, target=target
+            ))
+            cursor.copy_expert(
+                sql.SQL("COPY {temp_table} ({columns}) FROM STDIN").format(
+                    temp_table=temp_table, columns=columns
+                ),
+                _CopyRowsReader(formatted_rows, column_names),
+            )
+            for query in merge:
+                cursor.execute(query)
+
     def _by_column_update(self, rows):
         config = self.config.sql_settings.citus_config
         shard_col = config.distribution_column
@@ -348,6 +389,10 @@ class MultiDBSqlAdapter(object):
         for adapter in self.all_adapters:
             adapter.best_effort_save(doc, eval_context)
 
+    def _best_effort_save_rows(self, rows, doc):
+        for adapter in self.all_adapters:
+            adapter._best_effort_save_rows(rows, doc)
+
     def save(self, doc, eval_context=None):
         for adapter in self.all_adapters:
             adapter.save(doc, eval_context)
@@ -379,9 +424,9 @@ class MultiDBSqlAdapter(object):
         for adapter in self.all_adapters:
             adapter.clear_table()
 
-    def save_rows(self, rows):
+    def save_rows(self, rows, use_copy=None):
         for adapter in self.all_adapters:
-            adapter.save_rows(rows)
+            adapter.save_rows(rows, use_copy=use_copy)
 
     def bulk_save(self, docs):
         for adapter in self.all_adapters:
@@ -426,6 +471,89 @@ class ErrorRaisingMultiDBAdapter(MultiDBSqlAdapter):
     mirror_adapter_cls = ErrorRaisingIndicatorSqlAdapter
 
 
+def _get_copy_merge_queries(table, column_names, temp_table, upsert):
+    """The queries that merge the rows copied into ``temp_table`` into ``table``"""
+    target = sql.Identifier(table.name)
+    columns = sql.SQL(', ').join(sql.Identifier(name) for name in column_names)
+    if not upsert:
+        return [
+            sql.SQL("DELETE FROM {target} WHERE doc_id IN (SELECT doc_id FROM {temp_table})").format(
+                target=target, temp_table=temp_table
+            ),
+            sql.SQL("INSERT INTO {target} ({columns}) SELECT {columns} FROM {temp_table}").format(
+                target=target, columns=columns, temp_table=temp_table
+            ),
+        ]
+
+    pk_columns = [column.name for column in table.primary_key.columns]
+    update_columns = [name for name in column_names if name not in pk_columns]
+    if update_columns:
+        on_conflict = sql.SQL("ON CONFLICT ({pk_columns}) DO UPDATE SET {updates}").format(
+            pk_columns=sql.SQL(', ').join(sql.Identifier(name) for name in pk_columns),
+            updates=sql.SQL(', ').join(
+                sql.SQL("{column} = EXCLUDED.{column}").format(column=sql.Identifier(name))
+                for name in update_columns
+            ),
+        )
+    else:
+        # every column is in the primary key, so an existing row is already up to date
+        on_conflict = sql.SQL("ON CONFLICT DO NOTHING")
+    return [sql.SQL("INSERT INTO {target} ({columns}) SELECT {columns} FROM {temp_table} {on_conflict}").format(
+        target=target, columns=columns, temp_table=temp_table, on_conflict=on_conflict
+    )]
+
+
+class _CopyRowsReader(object):
+    """File-like object that ``copy_expert`` reads rows from in PostgreSQL's text format,
+    so that the rows are encoded as they are sent rather than all at once
+    """
+
+    def __init__(self, rows, column_names):
+        self._lines = (
+            '\t'.join(_copy_text_value(row[name]) for name in column_names) + '\n'
+            for row in rows
+        )
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copy_text_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, (list, tuple)):
+        value = _array_literal(value)
+    elif isinstance(value, (date, time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (
+        value.replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def _array_literal(values):
+    return '{{{}}}'.format(','.join(
+        'NULL' if value is None
+        else '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for value in values
+    ))
+
+
 def get_indicator_table(indicator_config, metadata, override_table_name=None):
     sql_columns = [column_to_sql(col) for col in indicator_config.get_columns()]
     table_name = override_table_name or get_table_name(indicator_config.domain, indicator_config.table_id)
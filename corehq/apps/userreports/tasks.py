@@ -1,9 +1,10 @@
 import logging
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 
 from django.conf import settings
-from django.db import DatabaseError, InternalError, transaction
+from django.db import DatabaseError, InternalError, connections, transaction
 from django.db.models import Count, Min
 from django.utils.translation import ugettext as _
 
@@ -35,7 +36,9 @@ from corehq.apps.userreports.const import (
     ASYNC_INDICATOR_CHUNK_SIZE,
     ASYNC_INDICATOR_QUEUE_TIME,
     UCR_CELERY_QUEUE,
+    UCR_COPY_ROWS_THRESHOLD,
     UCR_INDICATOR_CELERY_QUEUE,
+    UCR_REBUILD_COUCH_WORKERS,
 )
 from corehq.apps.userreports.exceptions import (
     StaticDataSourceConfigurationNotFoundError,
@@ -47,7 +50,11 @@ from corehq.apps.userreports.models import (
     get_report_config,
     id_is_static,
 )
-from corehq.apps.userreports.rebuild import DataSourceResumeHelper
+from corehq.apps.userreports.rebuild import (
+    DataSourceResumeHelper,
+    RebuildPartition,
+    get_rebuild_partitions,
+)
 from corehq.apps.userreports.reports.data_source import (
     ConfigurableReportDataSource,
 )
@@ -80,23 +87,57 @@ def _get_config_by_id(indicator_config_id):
 def _build_indicators(config, document_store, relevant_ids):
     adapter = get_indicator_adapter(config, raise_errors=True, load_source='build_indicators')
 
+    rows_by_doc = []
+    num_rows = 0
     for doc in document_store.iter_documents(relevant_ids):
         if config.asynchronous:
             AsyncIndicator.update_record(
                 doc.get('_id'), config.referenced_doc_type, config.domain, [config._id]
             )
-        else:
-            # save is a noop if the filter doesn't match
-            adapter.best_effort_save(doc)
+            continue
+
+        try:
+            rows = adapter.get_all_values(doc)
+        except Exception as e:
+            adapter.handle_exception(doc, e)
+            continue
+        # rows is empty if the filter doesn't match
+        if rows:
+            rows_by_doc.append((doc, rows))
+            num_rows += len(rows)
+        if num_rows >= UCR_COPY_ROWS_THRESHOLD:
+            _save_indicator_rows(adapter, rows_by_doc)
+            rows_by_doc = []
+            num_rows = 0
+
+    if rows_by_doc:
+        _save_indicator_rows(adapter, rows_by_doc)
+
+
+def _save_indicator_rows(adapter, rows_by_doc):
+    """Save rows for many documents at once, which uses COPY for large batches"""
+    try:
+        adapter.save_rows([row for doc, rows in rows_by_doc for row in rows])
+    except Exception:
+        # save them one document at a time so that errors are handled per document
+        for doc, rows in rows_by_doc:
+            adapter._best_effort_save_rows(rows, doc)
 
 
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True)
-def rebuild_indicators(indicator_config_id, initiated_by=None, limit=-1, source=None, engine_id=None):
+def rebuild_indicators(indicator_config_id, initiated_by=None, limit=-1, source=None, engine_id=None,
+                       partitioned=False):
+    """
+    :param partitioned: If True the documents are split into partitions (see ``get_rebuild_partitions``)
+    which are built concurrently by ``build_indicators_partition`` subtasks. Not supported with ``limit``.
+    """
     config = _get_config_by_id(indicator_config_id)
     success = _('Your UCR table {} has finished rebuilding in {}').format(config.table_id, config.domain)
     failure = _('There was an error rebuilding Your UCR table {} in {}.').format(config.table_id, config.domain)
+    assert not (partitioned and limit > -1), "Partitioned rebuilds can't be limited"
     send = False
-    if limit == -1:
+    if limit == -1 and not partitioned:
+        # partitioned builds notify from the subtask that completes the build
         send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by)
     with notify_someone(initiated_by, success_message=success, error_message=failure, send=send):
         adapter = get_indicator_adapter(config)
@@ -120,15 +161,18 @@ def rebuild_indicators(indicator_config_id, initiated_by=None, limit=-1, source=
 
         skip_log = bool(limit > 0)  # don't store log for temporary report builder UCRs
         adapter.rebuild_table(initiated_by=initiated_by, source=source, skip_log=skip_log)
-        _iteratively_build_table(config, limit=limit)
+        if partitioned:
+            _queue_partitioned_build(config, initiated_by)
+        else:
+            _iteratively_build_table(config, limit=limit)
 
 
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True)
-def rebuild_indicators_in_place(indicator_config_id, initiated_by=None, source=None):
+def rebuild_indicators_in_place(indicator_config_id, initiated_by=None, source=None, partitioned=False):
     config = _get_config_by_id(indicator_config_id)
     success = _('Your UCR table {} has finished rebuilding in {}').format(config.table_id, config.domain)
     failure = _('There was an error rebuilding Your UCR table {} in {}.').format(config.table_id, config.domain)
-    send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by)
+    send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by) and not partitioned
     with notify_someone(initiated_by, success_message=success, error_message=failure, send=send):
         adapter = get_indicator_adapter(config)
         if not id_is_static(indicator_config_id):
@@ -138,7 +182,10 @@ def rebuild_indicators_in_place(indicator_config_id, initiated_by=None, source=N
             config.save()
 
         adapter.build_table(initiated_by=initiated_by, source=source)
-        _iteratively_build_table(config, in_place=True)
+        if partitioned:
+            _queue_partitioned_build(config, initiated_by, in_place=True)
+        else:
+            _iteratively_build_table(config, in_place=True)
 
 
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True, acks_late=True)
@@ -146,20 +193,26 @@ def resume_building_indicators(indicator_config_id, initiated_by=None):
     config = _get_config_by_id(indicator_config_id)
     success = _('Your UCR table {} has finished rebuilding in {}').format(config.table_id, config.domain)
     failure = _('There was an error rebuilding Your UCR table {} in {}.').format(config.table_id, config.domain)
-    send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by)
+    resume_helper = DataSourceResumeHelper(config)
+    partitioned = resume_helper.is_partitioned()
+    send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by) and not partitioned
     with notify_someone(initiated_by, success_message=success, error_message=failure, send=send):
-        resume_helper = DataSourceResumeHelper(config)
         adapter = get_indicator_adapter(config)
         adapter.log_table_build(
             initiated_by=initiated_by,
             source='resume_building_indicators',
         )
-        _iteratively_build_table(config, resume_helper)
+        if partitioned:
+            completed = resume_helper.get_completed_partitions()
+            for partition in resume_helper.get_partitions():
+                if partition not in completed:
+                    build_indicators_partition.delay(config._id, partition.key, initiated_by=initiated_by)
+        else:
+            _iteratively_build_table(config, resume_helper)
 
 
 def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-1):
     resume_helper = resume_helper or DataSourceResumeHelper(config)
-    indicator_config_id = config._id
     case_type_or_xmlns_list = config.get_case_type_or_xmlns_filter()
     completed_ct_xmlns = resume_helper.get_completed_case_type_or_xmlns()
     if completed_ct_xmlns:
@@ -190,8 +243,12 @@ def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-
 
         resume_helper.add_completed_case_type_or_xmlns(case_type_or_xmlns)
 
+    _mark_build_finished(config, resume_helper, in_place)
+
+
+def _mark_build_finished(config, resume_helper, in_place=False):
     resume_helper.clear_resume_info()
-    if not id_is_static(indicator_config_id):
+    if not id_is_static(config._id):
         if in_place:
             config.meta.build.finished_in_place = True
         else:
@@ -210,6 +267,74 @@ def _iteratively_build_table(config, resume_helper=None, in_place=False, limit=-
             current_config.save()
 
 
+def _queue_partitioned_build(config, initiated_by=None, in_place=False):
+    resume_helper = DataSourceResumeHelper(config)
+    partitions = get_rebuild_partitions(config)
+    resume_helper.set_partitions(partitions)
+    for partition in partitions:
+        build_indicators_partition.delay(config._id, partition.key, initiated_by=initiated_by, in_place=in_place)
+
+
+@task(serializer='pickle', queue=UCR_CELERY_QUEUE, ignore_result=True, acks_late=True)
+def build_indicators_partition(indicator_config_id, partition_key, initiated_by=None, in_place=False):
+    """Build the rows for one ``RebuildPartition`` of a data source.
+
+    The subtask that completes the last outstanding partition marks the build as finished.
+    """
+    config = _get_config_by_id(indicator_config_id)
+    partition = RebuildPartition.from_key(partition_key)
+    resume_helper = DataSourceResumeHelper(config)
+    if partition in resume_helper.get_completed_partitions():
+        return
+
+    success = _('Your UCR table {} has finished rebuilding in {}').format(config.table_id, config.domain)
+    failure = _('There was an error rebuilding Your UCR table {} in {}.').format(config.table_id, config.domain)
+    send = toggles.SEND_UCR_REBUILD_INFO.enabled(initiated_by)
+    with notify_someone(initiated_by, success_message=None, error_message=failure, send=send):
+        document_store = get_document_store_for_doc_type(
+            config.domain, config.referenced_doc_type,
+            case_type_or_xmlns=partition.case_type_or_xmlns,
+            load_source="build_indicators",
+        )
+        doc_ids = partition.iter_document_ids(config, document_store)
+        with TimingContext() as timer:
+            if partition.db_alias is None:
+                _build_indicators_in_threads(config, document_store, doc_ids)
+            else:
+                for relevant_ids in chunked(doc_ids, ID_CHUNK_SIZE, list):
+                    _build_indicators(config, document_store, relevant_ids)
+        datadog_histogram(
+            'commcare.ucr.rebuild_partition.duration', timer.duration,
+            tags=['config_id:{}'.format(config._id)],
+        )
+
+    if resume_helper.add_completed_partition(partition):
+        with notify_someone(initiated_by, success_message=success, error_message=failure, send=send):
+            _mark_build_finished(config, resume_helper, in_place)
+
+
+def _build_indicators_in_threads(config, document_store, doc_ids, max_workers=UCR_REBUILD_COUCH_WORKERS):
+    """Build chunks of ``doc_ids`` concurrently. The IDs are read once, and
+    only a chunk per thread is read ahead of the chunks being built.
+    """
+    def _build_chunk(relevant_ids):
+        try:
+            _build_indicators(config, document_store, relevant_ids)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        for relevant_ids in chunked(doc_ids, ID_CHUNK_SIZE, list):
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(_build_chunk, relevant_ids))
+        for future in pending:
+            future.result()
+
+
 @task(serializer='pickle', queue=UCR_CELERY_QUEUE)
 def compare_ucr_dbs(domain, report_config_id, filter_values, sort_column=None, sort_order=None, params=None):
     if report_config_id not in settings.UCR_COMPARISONS:
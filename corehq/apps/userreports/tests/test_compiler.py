@@ -0,0 +1,374 @@
+from datetime import date
+
+from django.test import SimpleTestCase
+
+from corehq.apps.userreports.compiler import (
+    CompiledNodes,
+    ExpressionCompiler,
+    ExpressionProfiler,
+    count_spec_references,
+    get_shared_compilers,
+)
+from corehq.apps.userreports.exceptions import BadSpecError
+from corehq.apps.userreports.expressions.factory import ExpressionFactory
+from corehq.apps.userreports.filters.factory import FilterFactory
+from corehq.apps.userreports.specs import EvaluationContext, FactoryContext
+from corehq.apps.userreports.tests.utils import get_sample_data_source
+
+NAMED_EXPRESSIONS = {
+    'age': {'type': 'property_name', 'property_name': 'age', 'datatype': 'integer'},
+    'is_adult': {
+        'type': 'conditional',
+        'test': {
+            'type': 'boolean_expression',
+            'expression': {'type': 'named', 'name': 'age'},
+            'operator': 'gte',
+            'property_value': 18,
+        },
+        'expression_if_true': 'yes',
+        'expression_if_false': 'no',
+    },
+}
+
+EXPRESSIONS = [
+    {'type': 'identity'},
+    {'type': 'constant', 'constant': '2018-01-01'},
+    7,
+    {'type': 'property_name', 'property_name': 'name'},
+    {'type': 'property_name', 'property_name': 'dob', 'datatype': 'date'},
+    {'type': 'property_name', 'property_name': {'type': 'property_name', 'property_name': 'pointer'}},
+    {'type': 'property_path', 'property_path': ['child', 'age'], 'datatype': 'integer'},
+    {'type': 'property_path', 'property_path': ['child', 'missing', 'deeper']},
+    {'type': 'property_path', 'property_path': ['name', 'not_a_dict']},
+    {'type': 'named', 'name': 'is_adult'},
+    {'type': 'root_doc', 'expression': {'type': 'property_name', 'property_name': 'name'}},
+    {
+        'type': 'nested',
+        'argument_expression': {'type': 'property_name', 'property_name': 'child'},
+        'value_expression': {'type': 'property_name', 'property_name': 'age'},
+    },
+    {
+        'type': 'array_index',
+        'array_expression': {'type': 'property_name', 'property_name': 'siblings'},
+        'index_expression': 1,
+    },
+    {
+        'type': 'switch',
+        'switch_on': {'type': 'property_name', 'property_name': 'district'},
+        'cases': {'north': 1, 'south': 2},
+        'default': 0,
+    },
+    {
+        'type': 'coalesce',
+        'expression': {'type': 'property_name', 'property_name': 'blank'},
+        'default_expression': 'default',
+    },
+    {
+        'type': 'dict',
+        'properties': {
+            'name': {'type': 'property_name', 'property_name': 'name'},
+            'adult': {'type': 'named', 'name': 'is_adult'},
+        },
+    },
+    # not natively compiled, falls back to the interpreted expression
+    {
+        'type': 'evaluator',
+        'statement': 'a + 1',
+        'context_variables': {'a': {'type': 'named', 'name': 'age'}},
+    },
+]
+
+FILTERS = [
+    {
+        'type': 'and',
+        'filters': [
+            {
+                'type': 'boolean_expression',
+                'expression': {'type': 'property_name', 'property_name': 'name'},
+                'operator': 'eq',
+                'property_value': 'bob',
+            },
+            {'type': 'not', 'filter': {'type': 'named', 'name': 'is_north'}},
+        ],
+    },
+    {
+        'type': 'or',
+        'filters': [
+            {'type': 'named', 'name': 'is_north'},
+            {
+                'type': 'boolean_expression',
+                'expression': {'type': 'property_name', 'property_name': 'age', 'datatype': 'integer'},
+                'operator': 'in',
+                'property_value': [30, 31],
+            },
+        ],
+    },
+    {
+        'type': 'boolean_expression',
+        'expression': {'type': 'property_name', 'property_name': 'dob'},
+        'operator': 'eq',
+        'property_value': '1987-02-01',
+    },
+    {'type': 'property_match', 'property_name': 'name', 'property_value': 'bob'},
+]
+
+NAMED_FILTERS = {
+    'is_north': {
+        'type': 'boolean_expression',
+        'expression': {'type': 'property_name', 'property_name': 'district'},
+        'operator': 'eq',
+        'property_value': 'north',
+    },
+}
+
+DOCS = [
+    {
+        'name': 'bob', 'age': '30', 'dob': '1987-02-01', 'district': 'north', 'pointer': 'name',
+        'child': {'age': '3.0'}, 'siblings': ['a', 'b'], 'blank': '',
+    },
+    {'name': 'alice', 'age': 'seventeen', 'district': 'east', 'child': 'nope', 'siblings': 'a'},
+    {},
+]
+
+
+class CompiledExpressionsTest(SimpleTestCase):
+
+    def setUp(self):
+        self.interpreted_context = FactoryContext(
+            {
+                name: ExpressionFactory.from_spec(spec, FactoryContext(
+                    {'age': ExpressionFactory.from_spec(NAMED_EXPRESSIONS['age'])}, {}
+                ))
+                for name, spec in NAMED_EXPRESSIONS.items()
+            },
+            {name: FilterFactory.from_spec(spec) for name, spec in NAMED_FILTERS.items()},
+        )
+        self.compiler = ExpressionCompiler(
+            NAMED_EXPRESSIONS, NAMED_FILTERS, self.interpreted_context,
+            nodes=CompiledNodes(count_spec_references(
+                [EXPRESSIONS, FILTERS], NAMED_EXPRESSIONS, NAMED_FILTERS
+            )),
+        )
+
+    def test_expressions_match_interpreter(self):
+        for spec in EXPRESSIONS:
+            interpreted = ExpressionFactory.from_spec(spec, self.interpreted_context)
+            compiled = ExpressionFactory.from_spec(spec, self.compiler.factory_context)
+            for doc in DOCS:
+                self.assertEqual(
+                    interpreted(doc, EvaluationContext(doc)),
+                    compiled(doc, EvaluationContext(doc)),
+                    spec,
+                )
+            self.assertEqual(str(interpreted), str(compiled))
+
+    def test_filters_match_interpreter(self):
+        for spec in FILTERS:
+            interpreted = FilterFactory.from_spec(spec, self.interpreted_context)
+            compiled = FilterFactory.from_spec(spec, self.compiler.factory_context)
+            for doc in DOCS:
+                self.assertEqual(
+                    interpreted(doc, EvaluationContext(doc)),
+                    compiled(doc, EvaluationContext(doc)),
+                    spec,
+                )
+
+    def test_constant_folding(self):
+        compiled = self.compiler.compile_expression({
+            'type': 'conditional',
+            'test': {'type': 'boolean_expression', 'expression': 3, 'operator': 'gt', 'property_value': 2},
+            'expression_if_true': {'type': 'property_name', 'property_name': 'name'},
+            'expression_if_false': {'type': 'property_name', 'property_name': 'age'},
+        })
+        self.assertEqual('bob', compiled(DOCS[0]))
+        self.assertEqual(2, self.compiler.stats['folded'])
+
+    def test_constants_are_wrapped(self):
+        compiled = self.compiler.compile_expression({'type': 'constant', 'constant': '2018-01-01'})
+        self.assertEqual(date(2018, 1, 1), compiled({}))
+
+    def test_shared_sub_expressions_evaluated_once(self):
+        calls = []
+        ExpressionFactory.spec_map['test_counter'] = lambda spec, context: (
+            lambda item, context=None: calls.append(item) or len(calls)
+        )
+        self.addCleanup(ExpressionFactory.spec_map.pop, 'test_counter')
+        spec = {'type': 'test_counter'}
+        compiler = ExpressionCompiler(nodes=CompiledNodes(count_spec_references([spec, spec])))
+        first = compiler.compile_expression(spec)
+        second = compiler.compile_expression({
+            'type': 'nested', 'argument_expression': {'type': 'identity'}, 'value_expression': spec
+        })
+        doc = {}
+        context = EvaluationContext(doc)
+        self.assertEqual(1, first(doc, context))
+        self.assertEqual(1, second(doc, context))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, compiler.stats['shared'])
+
+    def test_shared_across_compilers_and_iterations(self):
+        calls = []
+        ExpressionFactory.spec_map['test_counter'] = lambda spec, context: (
+            lambda item, context=None: calls.append(item) or len(calls)
+        )
+        self.addCleanup(ExpressionFactory.spec_map.pop, 'test_counter')
+        spec = {'type': 'test_counter'}
+        nodes = CompiledNodes(count_spec_references([spec, spec]))
+        first = ExpressionCompiler(nodes=nodes, scope='first').compile_expression(spec)
+        second = ExpressionCompiler(nodes=nodes, scope='second').compile_expression(spec)
+        doc = {}
+        context = EvaluationContext(doc)
+        self.assertEqual(1, first(doc, context))
+        context.reset_iteration()
+        self.assertEqual(1, second(doc, context))
+        self.assertEqual(1, len(calls))
+        self.assertEqual(1, nodes.pop_evaluations_saved())
+        self.assertEqual(0, nodes.pop_evaluations_saved())
+
+    def test_shared_sub_expressions_on_temporary_items(self):
+        ExpressionFactory.spec_map['test_value'] = lambda spec, context: (
+            lambda item, context=None: item['value']
+        )
+        self.addCleanup(ExpressionFactory.spec_map.pop, 'test_value')
+        spec = {'type': 'test_value'}
+        compiler = ExpressionCompiler(nodes=CompiledNodes(count_spec_references([spec, spec])))
+        compiled = compiler.compile_expression(spec)
+        context = EvaluationContext({})
+        # each item is freed after it is evaluated, so its id can be reused by the next one
+        self.assertEqual(list(range(100)), [compiled({'value': value}, context) for value in range(100)])
+
+    def test_iteration_dependent_expressions_not_shared_across_iterations(self):
+        spec = {
+            'type': 'conditional',
+            'test': {
+                'type': 'boolean_expression',
+                'expression': {'type': 'base_iteration_number'},
+                'operator': 'eq',
+                'property_value': 0,
+            },
+            'expression_if_true': 'first',
+            'expression_if_false': 'other',
+        }
+        compiler = ExpressionCompiler(nodes=CompiledNodes(count_spec_references([spec, spec])))
+        compiled = compiler.compile_expression(spec)
+        doc = {}
+        context = EvaluationContext(doc)
+        self.assertEqual('first', compiled(doc, context))
+        context.increment_iteration()
+        self.assertEqual('other', compiled(doc, context))
+
+    def test_named_expressions_resolved_per_compiler(self):
+        spec = {'type': 'named', 'name': 'value'}
+        nodes = CompiledNodes(count_spec_references([spec, spec]))
+        first = ExpressionCompiler(
+            {'value': {'type': 'property_name', 'property_name': 'a'}}, nodes=nodes, scope='first'
+        ).compile_expression(spec)
+        second = ExpressionCompiler(
+            {'value': {'type': 'property_name', 'property_name': 'b'}}, nodes=nodes, scope='second'
+        ).compile_expression(spec)
+        doc = {'a': 1, 'b': 2}
+        context = EvaluationContext(doc)
+        self.assertEqual(1, first(doc, context))
+        self.assertEqual(2, second(doc, context))
+
+    def test_missing_named_expression(self):
+        with self.assertRaises(BadSpecError):
+            self.compiler.compile_expression({'type': 'named', 'name': 'missing'})
+
+    def test_self_referencing_named_expression(self):
+        compiler = ExpressionCompiler({'loop': {'type': 'named', 'name': 'loop'}})
+        with self.assertRaises(BadSpecError):
+            compiler.compile_expression({'type': 'named', 'name': 'loop'})
+
+    def test_profiler(self):
+        profiler = ExpressionProfiler()
+        name = {'type': 'property_name', 'property_name': 'name'}
+        spec = {
+            'type': 'conditional',
+            'test': {'type': 'boolean_expression', 'expression': name, 'operator': 'eq', 'property_value': 'bob'},
+            'expression_if_true': {'type': 'constant', 'constant': 'yes'},
+            'expression_if_false': name,
+        }
+        compiled = ExpressionCompiler(
+            nodes=CompiledNodes(count_spec_references([spec])), profiler=profiler
+        ).compile_expression(spec)
+        for doc in DOCS:
+            compiled(doc, EvaluationContext(doc))
+
+        calls_by_type = {
+            spec['type']: calls for kind, spec, calls, seconds in profiler.get_report()
+        }
+        # the name isn't used by the true branch, which is a constant and never evaluated
+        self.assertEqual(
+            {'conditional': 3, 'boolean_expression': 3, 'property_name': 5},
+            calls_by_type,
+        )
+
+
+class CompiledDataSourceTest(SimpleTestCase):
+
+    def test_data_source_matches_interpreter(self):
+        interpreted = get_sample_data_source()
+        interpreted._compile_expressions = False
+        compiled = get_sample_data_source()
+        compiled._compile_expressions = True
+        doc = {
+            'doc_type': 'CommCareCase',
+            'domain': interpreted.domain,
+            '_id': 'some-id',
+            'type': 'ticket',
+            'category': 'bug',
+            'tags': 'easy-win public',
+            'is_starred': 'yes',
+            'estimate': 2,
+            'priority': 4,
+            'opened_on': '2018-02-01T00:00:00Z',
+            'owner_id': 'some-user-id',
+        }
+
+        def _values(config):
+            return [
+                [(value.column.id, value.value) for value in row if value.column.id != 'inserted_at']
+                for row in config.get_all_values(doc)
+            ]
+
+        self.assertIsNotNone(compiled.expression_compiler)
+        self.assertEqual(_values(interpreted), _values(compiled))
+
+    def test_shared_compilers_match_interpreter(self):
+        interpreted = get_sample_data_source()
+        interpreted._compile_expressions = False
+        first = get_sample_data_source()
+        first._id = 'a-data-source'
+        second = get_sample_data_source()
+        second._id = 'another-data-source'
+        compilers = get_shared_compilers([first, second])
+        first.set_expression_compiler(compilers[first._id])
+        second.set_expression_compiler(compilers[second._id])
+        doc = {
+            'doc_type': 'CommCareCase',
+            'domain': interpreted.domain,
+            '_id': 'some-id',
+            'type': 'ticket',
+            'category': 'bug',
+            'tags': 'easy-win public',
+            'is_starred': 'yes',
+            'estimate': 2,
+            'priority': 4,
+            'opened_on': '2018-02-01T00:00:00Z',
+            'owner_id': 'some-user-id',
+        }
+
+        def _values(config, eval_context):
+            rows = [
+                [(value.column.id, value.value) for value in row if value.column.id != 'inserted_at']
+                for row in config.get_all_values(doc, eval_context)
+            ]
+            eval_context.reset_iteration()
+            return rows
+
+        eval_context = EvaluationContext(doc)
+        expected = _values(interpreted, EvaluationContext(doc))
+        self.assertEqual(expected, _values(first, eval_context))
+        self.assertEqual(expected, _values(second, eval_context))
+        self.assertIs(compilers[first._id].nodes, compilers[second._id].nodes)
@@ -23,6 +23,7 @@ from corehq.apps.userreports.expressions.specs import (
     PropertyPathGetterSpec,
     eval_statements,
 )
+from corehq.apps.userreports.related_docs import RelatedDocumentCache
 from corehq.apps.userreports.specs import EvaluationContext, FactoryContext
 from corehq.apps.users.models import CommCareUser
 from corehq.form_processor.interfaces.dbaccessors import FormAccessors
@@ -925,6 +926,26 @@ class RelatedDocExpressionTest(SimpleTestCase):
         self.database.mock_docs.clear()
         self.assertEqual('foo', self.expression(my_doc, context))
 
+    def test_related_document_cache(self):
+        related_docs = RelatedDocumentCache('test-domain')
+        related_docs.set('CommCareCase', 'cached-id', {'domain': 'test-domain', 'related_property': 'foo'})
+        my_doc = {'domain': 'test-domain', 'parent_id': 'cached-id'}
+        self.assertEqual('foo', self.expression(my_doc, EvaluationContext(my_doc, related_docs=related_docs)))
+
+    def test_related_document_cache_miss(self):
+        self.database.mock_docs = {
+            'uncached-id': {'domain': 'test-domain', 'related_property': 'foo'},
+        }
+        related_docs = RelatedDocumentCache('test-domain')
+        my_doc = {'domain': 'test-domain', 'parent_id': 'uncached-id'}
+        self.assertEqual('foo', self.expression(my_doc, EvaluationContext(my_doc, related_docs=related_docs)))
+
+        # other documents in the chunk use the cached copy
+        self.database.mock_docs.clear()
+        other_doc = {'domain': 'test-domain', 'parent_id': 'uncached-id'}
+        other_context = EvaluationContext(other_doc, related_docs=related_docs)
+        self.assertEqual('foo', self.expression(other_doc, other_context))
+
 
 class RelatedDocExpressionDbTest(TestCase):
     domain = 'related-doc-db-test-domain'
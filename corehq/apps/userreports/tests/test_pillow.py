@@ -56,10 +56,10 @@ def teardown_module():
     skip_domain_filter_patch.stop()
 
 
-def _get_pillow(configs, processor_chunk_size=0):
+def _get_pillow(configs, processor_chunk_size=0, adapter_workers=0):
     pillow = get_case_pillow(processor_chunk_size=processor_chunk_size)
     # overwrite processors since we're only concerned with UCR here
-    ucr_processor = ConfigurableReportPillowProcessor(data_source_providers=[])
+    ucr_processor = ConfigurableReportPillowProcessor(data_source_providers=[], adapter_workers=adapter_workers)
     ucr_processor.bootstrap(configs)
     pillow.processors = [ucr_processor]
     return pillow
@@ -90,6 +90,85 @@ class ConfigurableReportTableManagerTest(SimpleTestCase):
         table_manager.last_bootstrapped = before_now - timedelta(seconds=REBUILD_CHECK_INTERVAL)
         self.assertTrue(table_manager.needs_bootstrap())
 
+    @mock.patch('corehq.apps.userreports.pillow.UCR_COMPILED_EXPRESSIONS.enabled', return_value=True)
+    def test_threaded_processor_does_not_share_compilers(self, *args):
+        self.assertTrue(ConfigurableReportPillowProcessor([])._shares_expression_compilers('domain'))
+        processor = ConfigurableReportPillowProcessor([], adapter_workers=2)
+        self.assertFalse(processor._shares_expression_compilers('domain'))
+
+
+class _DataSourceProvider(MockDataSourceProvider):
+
+    def __init__(self, sources):
+        super(_DataSourceProvider, self).__init__()
+        self.sources = sources
+
+    def get_all_data_sources(self):
+        return list(self.sources)
+
+
+def _config_with_rev(config_id, domain, rev):
+    config = DataSourceConfiguration(
+        domain=domain,
+        referenced_doc_type='CommCareCase',
+        table_id=config_id,
+        configured_filter={},
+        configured_indicators=[],
+    )
+    config._id = config_id
+    config._doc['_rev'] = rev
+    return config
+
+
+@mock.patch('corehq.apps.userreports.pillow._filter_missing_domains', side_effect=lambda configs: configs)
+@mock.patch('corehq.apps.userreports.pillow.UCR_COMPILED_EXPRESSIONS.enabled', return_value=False)
+@mock.patch('corehq.apps.userreports.pillow.get_indicator_adapter',
+            side_effect=lambda config, **kwargs: mock.Mock(config=config))
+class IncrementalBootstrapTest(SimpleTestCase):
+
+    def _get_config_ids_by_domain(self, table_manager):
+        return {
+            domain: sorted(adapter.config._id for adapter in adapters)
+            for domain, adapters in table_manager.table_adapters_by_domain.items()
+        }
+
+    def test_incremental_bootstrap(self, *args):
+        provider = _DataSourceProvider([
+            _config_with_rev('unchanged', 'a', '1-a'),
+            _config_with_rev('changed', 'a', '1-a'),
+            _config_with_rev('removed', 'b', '1-a'),
+        ])
+        table_manager = ConfigurableReportTableManagerMixin([provider], run_migrations=False)
+        table_manager.bootstrap()
+        unchanged_adapter = table_manager.table_adapters_by_domain['a'][0]
+
+        provider.sources = [
+            _config_with_rev('unchanged', 'a', '1-a'),
+            _config_with_rev('changed', 'a', '2-b'),
+            _config_with_rev('new', 'c', '1-a'),
+        ]
+        table_manager.run_migrations = True
+        with mock.patch.object(table_manager, '_rebuild_sql_tables') as rebuild_sql_tables:
+            table_manager.incremental_bootstrap()
+
+        self.assertEqual(
+            {'a': ['changed', 'unchanged'], 'c': ['new']},
+            self._get_config_ids_by_domain(table_manager),
+        )
+        self.assertIn(unchanged_adapter, table_manager.table_adapters_by_domain['a'])
+        rebuilt_adapters, = rebuild_sql_tables.call_args[0]
+        self.assertEqual(['changed', 'new'], sorted(adapter.config._id for adapter in rebuilt_adapters))
+        self.assertEqual({'unchanged': '1-a', 'changed': '2-b', 'new': '1-a'}, table_manager.config_revs)
+
+    def test_nothing_changed(self, *args):
+        provider = _DataSourceProvider([_config_with_rev('unchanged', 'a', '1-a')])
+        table_manager = ConfigurableReportTableManagerMixin([provider])
+        with mock.patch.object(table_manager, '_rebuild_sql_tables') as rebuild_sql_tables:
+            table_manager.bootstrap()
+            table_manager.incremental_bootstrap()
+        self.assertEqual(1, rebuild_sql_tables.call_count)
+        self.assertEqual({'a': ['unchanged']}, self._get_config_ids_by_domain(table_manager))
+
 
 @override_settings(TESTS_SHOULD_USE_SQL_BACKEND=True)
 class ChunkedUCRProcessorTest(TestCase):
@@ -246,6 +325,56 @@ class ChunkedUCRProcessorTest(TestCase):
         self.assertEqual(set([case.case_id for case in cases]), set(invalid_data))
 
 
+class ThreadedUCRProcessorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(ThreadedUCRProcessorTest, cls).setUpClass()
+        cls.configs = []
+        cls.adapters = []
+        for table_id in ('threaded-1', 'threaded-2'):
+            config = get_sample_data_source()
+            config.table_id = table_id
+            config.save()
+            adapter = get_indicator_adapter(config)
+            adapter.build_table()
+            cls.configs.append(config)
+            cls.adapters.append(adapter)
+        cls.fake_time_now = datetime(2015, 4, 24, 12, 30, 8, 24886)
+        cls.pillow = _get_pillow(cls.configs, processor_chunk_size=100, adapter_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        for adapter in cls.adapters:
+            adapter.drop_table()
+            adapter.config.delete()
+        super(ThreadedUCRProcessorTest, cls).tearDownClass()
+
+    def tearDown(self):
+        for adapter in self.adapters:
+            adapter.clear_table()
+        delete_all_cases()
+        delete_all_xforms()
+
+    @mock.patch('corehq.apps.userreports.specs.datetime')
+    @mock.patch('corehq.apps.userreports.pillow.ConfigurableReportPillowProcessor.process_change')
+    def test_basic_sql(self, process_change, datetime_mock):
+        datetime_mock.utcnow.return_value = self.fake_time_now
+        since = self.pillow.get_change_feed().get_latest_offsets()
+        cases = [
+            _save_sql_case(get_sample_doc_and_indicators(self.fake_time_now)[0])
+            for i in range(10)
+        ]
+        self.pillow.process_changes(since=since, forever=False)
+
+        for adapter in self.adapters:
+            self.assertEqual(
+                {case.case_id for case in cases},
+                {row.doc_id for row in adapter.get_query_object().all()}
+            )
+        self.assertFalse(process_change.called)
+
+
 class IndicatorPillowTest(TestCase):
 
     @classmethod
@@ -0,0 +1,114 @@
+from django.test import SimpleTestCase
+
+from mock import patch
+
+from corehq.apps.userreports.models import DataSourceConfiguration
+from corehq.apps.userreports.related_docs import (
+    get_root_related_doc_expressions,
+    prefetch_related_docs,
+)
+
+
+def _related_doc(property_name, value_expression=None):
+    return {
+        'type': 'related_doc',
+        'related_doc_type': 'CommCareCase',
+        'doc_id_expression': {'type': 'property_name', 'property_name': property_name},
+        'value_expression': value_expression or {'type': 'property_name', 'property_name': 'name'},
+    }
+
+
+def _get_config(base_item_expression=None):
+    return DataSourceConfiguration(
+        domain='test-domain',
+        referenced_doc_type='CommCareCase',
+        table_id='related-docs',
+        configured_filter={
+            'type': 'boolean_expression',
+            'expression': {'type': 'named', 'name': 'parent_name'},
+            'operator': 'eq',
+            'property_value': 'bob',
+        },
+        named_expressions={'parent_name': _related_doc('parent_id')},
+        base_item_expression=base_item_expression or {},
+        configured_indicators=[
+            {
+                'type': 'expression',
+                'column_id': 'grandparent',
+                'datatype': 'string',
+                'expression': _related_doc('parent_id', _related_doc('grandparent_id')),
+            },
+            {
+                'type': 'expression',
+                'column_id': 'host',
+                'datatype': 'string',
+                'expression': {
+                    'type': 'conditional',
+                    'test': {'type': 'not', 'filter': {
+                        'type': 'boolean_expression',
+                        'expression': {'type': 'property_name', 'property_name': 'closed'},
+                        'operator': 'eq',
+                        'property_value': True,
+                    }},
+                    'expression_if_true': _related_doc('host_id'),
+                    'expression_if_false': None,
+                },
+            },
+            {
+                'type': 'expression',
+                'column_id': 'from_subcase',
+                'datatype': 'string',
+                'expression': {
+                    'type': 'nested',
+                    'argument_expression': {'type': 'property_name', 'property_name': 'subcase'},
+                    'value_expression': _related_doc('subcase_parent_id'),
+                },
+            },
+        ],
+    )
+
+
+class RootRelatedDocExpressionsTest(SimpleTestCase):
+
+    def test_root_expressions(self):
+        doc = {'parent_id': 'p', 'host_id': 'h', 'grandparent_id': 'g', 'subcase': {'subcase_parent_id': 's'}}
+        expressions = get_root_related_doc_expressions(_get_config())
+        self.assertEqual(
+            ['h', 'p'],
+            sorted(expression(doc) for _, expression in expressions),
+        )
+
+    def test_base_item_expression(self):
+        expressions = get_root_related_doc_expressions(
+            _get_config({'type': 'property_name', 'property_name': 'items'})
+        )
+        # only the filter is evaluated on the root document
+        self.assertEqual(1, len(expressions))
+
+
+class PrefetchRelatedDocsTest(SimpleTestCase):
+
+    @patch('corehq.apps.userreports.related_docs.get_document_store_for_doc_type')
+    def test_prefetch(self, get_document_store):
+        docs = [
+            {'_id': 'a', 'domain': 'test-domain', 'parent_id': 'p1', 'host_id': 'h1'},
+            {'_id': 'b', 'domain': 'test-domain', 'parent_id': 'p1'},
+            {'_id': 'c', 'domain': 'test-domain', 'parent_id': 'p2'},
+        ]
+        document_store = get_document_store.return_value
+        document_store.iter_documents.return_value = [
+            {'_id': 'p1', 'domain': 'test-domain'},
+            {'_id': 'h1', 'domain': 'other-domain'},
+        ]
+        related_docs = prefetch_related_docs('test-domain', docs, [_get_config()])
+
+        self.assertEqual(1, document_store.iter_documents.call_count)
+        self.assertEqual(
+            {'p1', 'p2', 'h1'},
+            set(document_store.iter_documents.call_args[0][0]),
+        )
+        self.assertEqual({'_id': 'p1', 'domain': 'test-domain'}, related_docs.get('CommCareCase', 'p1'))
+        self.assertIsNone(related_docs.get('CommCareCase', 'p2'))
+        self.assertIsNone(related_docs.get('CommCareCase', 'h1'))
+        with self.assertRaises(KeyError):
+            related_docs.get('CommCareCase', 'g1')
@@ -1,6 +1,18 @@
 from django.test import SimpleTestCase
 
-from corehq.apps.userreports.rebuild import DataSourceResumeHelper
+from mock import MagicMock, Mock, patch
+
+from corehq.apps.userreports.adapter import IndicatorAdapterLoadTracker
+from corehq.apps.userreports.rebuild import (
+    DataSourceResumeHelper,
+    RebuildPartition,
+    get_rebuild_partitions,
+)
+from corehq.apps.userreports.sql.adapter import MultiDBSqlAdapter
+from corehq.apps.userreports.tasks import (
+    _build_indicators_in_threads,
+    _save_indicator_rows,
+)
 from corehq.apps.userreports.tests.utils import get_sample_data_source
 
 
@@ -41,3 +53,96 @@ class DataSourceResumeBuildTest(SimpleTestCase):
     def test_has_resume_info_true(self):
         self._resume_helper.add_completed_case_type_or_xmlns('type1')
         self.assertEqual(True, self._resume_helper.has_resume_info())
+
+    def test_partitions(self):
+        partitions = [RebuildPartition('type1', db_alias='p1'), RebuildPartition('type1', db_alias='p2')]
+        self._resume_helper.set_partitions(partitions)
+        self.assertTrue(self._resume_helper.is_partitioned())
+        self.assertTrue(self._resume_helper.has_resume_info())
+        self.assertEqual(partitions, self._resume_helper.get_partitions())
+
+        self.assertFalse(self._resume_helper.add_completed_partition(partitions[0]))
+        self.assertFalse(self._resume_helper.add_completed_partition(partitions[0]))
+        self.assertEqual({partitions[0]}, self._resume_helper.get_completed_partitions())
+        self.assertTrue(self._resume_helper.add_completed_partition(partitions[1]))
+
+        self._resume_helper.clear_resume_info()
+        self.assertFalse(self._resume_helper.is_partitioned())
+        self.assertEqual(set(), self._resume_helper.get_completed_partitions())
+
+
+class RebuildPartitionTest(SimpleTestCase):
+
+    def test_key_round_trip(self):
+        for partition in [
+            RebuildPartition(None, db_alias='p1'),
+            RebuildPartition('http://openrosa.org/formdesigner/123'),
+        ]:
+            self.assertEqual(partition, RebuildPartition.from_key(partition.key))
+
+    @patch('corehq.apps.userreports.rebuild.should_use_sql_backend', return_value=True)
+    @patch('corehq.sql_db.util.get_db_aliases_for_partitioned_query', return_value=['p1', 'p2'])
+    def test_sql_partitions(self, *args):
+        partitions = get_rebuild_partitions(get_sample_data_source())
+        self.assertEqual(
+            [RebuildPartition('ticket', db_alias='p1'), RebuildPartition('ticket', db_alias='p2')],
+            partitions
+        )
+
+    @patch('corehq.apps.userreports.rebuild.should_use_sql_backend', return_value=False)
+    def test_couch_partitions(self, *args):
+        partitions = get_rebuild_partitions(get_sample_data_source())
+        self.assertEqual([RebuildPartition('ticket')], partitions)
+
+    def test_couch_partition_reads_ids_once(self):
+        document_store = Mock()
+        document_store.iter_document_ids.return_value = iter(['a', 'b'])
+        partition = RebuildPartition('ticket')
+        doc_ids = partition.iter_document_ids(get_sample_data_source(), document_store)
+        self.assertEqual(['a', 'b'], list(doc_ids))
+        document_store.iter_document_ids.assert_called_once_with()
+
+
+class BuildIndicatorsInThreadsTest(SimpleTestCase):
+
+    @patch('corehq.apps.userreports.tasks.ID_CHUNK_SIZE', 10)
+    @patch('corehq.apps.userreports.tasks.connections')
+    def test_all_chunks_built(self, connections):
+        built_ids = []
+        with patch('corehq.apps.userreports.tasks._build_indicators',
+                   side_effect=lambda config, store, ids: built_ids.extend(ids)):
+            _build_indicators_in_threads(None, None, iter(range(95)), max_workers=3)
+        self.assertEqual(list(range(95)), sorted(built_ids))
+        self.assertEqual(10, connections.close_all.call_count)
+
+    @patch('corehq.apps.userreports.tasks.connections')
+    def test_error(self, connections):
+        with patch('corehq.apps.userreports.tasks._build_indicators', side_effect=ValueError), \
+                self.assertRaises(ValueError):
+            _build_indicators_in_threads(None, None, iter(range(5)), max_workers=2)
+
+
+class SaveIndicatorRowsTest(SimpleTestCase):
+
+    def _get_adapter(self, adapters):
+        adapter = MultiDBSqlAdapter.__new__(MultiDBSqlAdapter)
+        adapter.main_adapter = adapters[0]
+        adapter.all_adapters = adapters
+        return adapter
+
+    def test_mirror_fails_batch(self):
+        main, mirror = MagicMock(), MagicMock()
+        mirror.save_rows.side_effect = Exception("mirror failed")
+        track_load = Mock()
+        adapter = IndicatorAdapterLoadTracker(self._get_adapter([main, mirror]), track_load)
+        rows_by_doc = [({'_id': 'a'}, ['a1', 'a2']), ({'_id': 'b'}, ['b1'])]
+
+        _save_indicator_rows(adapter, rows_by_doc)
+
+        for db_adapter in [main, mirror]:
+            db_adapter.save_rows.assert_called_once_with(['a1', 'a2', 'b1'], use_copy=None)
+            self.assertEqual(
+                [call[0] for call in db_adapter._best_effort_save_rows.call_args_list],
+                [(['a1', 'a2'], {'_id': 'a'}), (['b1'], {'_id': 'b'})],
+            )
+        self.assertEqual([call[0][0] for call in track_load.call_args_list], [3, 2, 1])
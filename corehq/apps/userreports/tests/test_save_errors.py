@@ -1,9 +1,14 @@
 import uuid
+from datetime import date, datetime
+from decimal import Decimal
 
-from django.test import TestCase, override_settings
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
 
+import sqlalchemy
 from alembic.operations import Operations
 from alembic.runtime.migration import MigrationContext
+from psycopg2 import sql
 
 from corehq.apps.userreports.app_manager.helpers import clean_table_name
 from corehq.apps.userreports.const import UCR_SQL_BACKEND
@@ -15,6 +20,10 @@ from corehq.apps.userreports.models import (
     DataSourceConfiguration,
     InvalidUCRData,
 )
+from corehq.apps.userreports.sql.adapter import (
+    _copy_text_value,
+    _get_copy_merge_queries,
+)
 from corehq.apps.userreports.util import get_indicator_adapter
 
 
@@ -131,3 +140,73 @@ class AdapterBulkSaveTest(TestCase):
     def test_save_rows_empty(self):
         self.adapter.build_table()
         self.adapter.save_rows([])
+
+    def test_save_rows_copy(self):
+        docs = [
+            {
+                "_id": str(i),
+                "domain": self.domain,
+                "doc_type": "CommCareCase",
+                "name": 'doc\tname\\' + str(i) if i else None,
+            }
+            for i in range(10)
+        ]
+        self.adapter.build_table()
+        self.adapter.save_rows([row for doc in docs for row in self.adapter.get_all_values(doc)], use_copy=True)
+        docs[1]['name'] = 'updated'
+        self.adapter.save_rows(self.adapter.get_all_values(docs[1]), use_copy=True)
+
+        names = {row.doc_id: row.name for row in self.adapter.get_query_object()}
+        self.assertEqual(10, len(names))
+        self.assertIsNone(names['0'])
+        self.assertEqual('updated', names['1'])
+        self.assertEqual('doc\tname\\2', names['2'])
+
+
+class CopyTextValueTest(SimpleTestCase):
+
+    def test_values(self):
+        self.assertEqual('\\N', _copy_text_value(None))
+        self.assertEqual('t', _copy_text_value(True))
+        self.assertEqual('3', _copy_text_value(3))
+        self.assertEqual('1.50', _copy_text_value(Decimal('1.50')))
+        self.assertEqual('2018-01-02', _copy_text_value(date(2018, 1, 2)))
+        self.assertEqual('2018-01-02T03:04:05', _copy_text_value(datetime(2018, 1, 2, 3, 4, 5)))
+        self.assertEqual('a\\tb\\nc\\\\d', _copy_text_value('a\tb\nc\\d'))
+        self.assertEqual('{"a","b\\\\"c",NULL}', _copy_text_value(['a', 'b"c', None]))
+
+
+class CopyMergeQueriesTest(TestCase):
+
+    def _get_sql(self, columns, column_names, upsert=True):
+        table = sqlalchemy.Table('ucr_table', sqlalchemy.MetaData(), *columns)
+        queries = _get_copy_merge_queries(table, column_names, sql.Identifier('ucr_copy'), upsert=upsert)
+        with connection.cursor() as cursor:
+            return [query.as_string(cursor.cursor) for query in queries]
+
+    def test_upsert(self):
+        columns = [
+            sqlalchemy.Column('doc_id', sqlalchemy.String, primary_key=True),
+            sqlalchemy.Column('name', sqlalchemy.String),
+        ]
+        self.assertEqual(self._get_sql(columns, ['doc_id', 'name']), [
+            'INSERT INTO "ucr_table" ("doc_id", "name") SELECT "doc_id", "name" FROM "ucr_copy" '
+            'ON CONFLICT ("doc_id") DO UPDATE SET "name" = EXCLUDED."name"'
+        ])
+
+    def test_upsert_all_columns_in_primary_key(self):
+        columns = [
+            sqlalchemy.Column('doc_id', sqlalchemy.String, primary_key=True),
+            sqlalchemy.Column('repeat_iteration', sqlalchemy.Integer, primary_key=True),
+        ]
+        self.assertEqual(self._get_sql(columns, ['doc_id', 'repeat_iteration']), [
+            'INSERT INTO "ucr_table" ("doc_id", "repeat_iteration") '
+            'SELECT "doc_id", "repeat_iteration" FROM "ucr_copy" ON CONFLICT DO NOTHING'
+        ])
+
+    def test_delete_and_insert(self):
+        columns = [sqlalchemy.Column('doc_id', sqlalchemy.String, primary_key=True)]
+        self.assertEqual(self._get_sql(columns, ['doc_id'], upsert=False), [
+            'DELETE FROM "ucr_table" WHERE doc_id IN (SELECT doc_id FROM "ucr_copy")',
+            'INSERT INTO "ucr_table" ("doc_id") SELECT "doc_id" FROM "ucr_copy"',
+        ])
@@ -142,6 +142,27 @@ def get_indicator_adapter(config, raise_errors=False, load_source="unknown"):
     return IndicatorAdapterLoadTracker(adapter, track_load)
 
 
+def get_sample_docs(config, limit, load_source="unknown"):
+    """Up to ``limit`` of the documents a data source is built from, for benchmarking"""
+    from corehq.apps.change_feed.data_sources import get_document_store_for_doc_type
+    docs = []
+    for case_type_or_xmlns in config.get_case_type_or_xmlns_filter():
+        document_store = get_document_store_for_doc_type(
+            config.domain, config.referenced_doc_type,
+            case_type_or_xmlns=case_type_or_xmlns,
+            load_source=load_source,
+        )
+        doc_ids = []
+        for doc_id in document_store.iter_document_ids():
+            doc_ids.append(doc_id)
+            if len(doc_ids) + len(docs) >= limit:
+                break
+        docs.extend(document_store.iter_documents(doc_ids))
+        if len(docs) >= limit:
+            break
+    return docs
+
+
 def get_table_name(domain, table_id, max_length=50, prefix=UCR_TABLE_PREFIX):
     """
     :param domain:
@@ -1,6 +1,8 @@
 import copy
 import json
 import logging
+import queue
+import threading
 import time
 from collections import namedtuple
 from urllib.parse import unquote
@@ -234,10 +236,16 @@ def iter_es_docs(index_name, ids):
         yield from mget_query(index_name, ids_chunk)
 
 
-def iter_es_docs_from_query(query):
+def iter_es_docs_from_query(query, num_scroll_partitions=1):
     """Returns all docs which match query
+
+    :param num_scroll_partitions: Scroll the ids of the docs in up to this many
+        partitions of the index's shards in parallel
     """
-    scroll_result = query.scroll_ids()
+    if num_scroll_partitions > 1:
+        scroll_result = query.exclude_source().size(5000).parallel_scroll(num_scroll_partitions)
+    else:
+        scroll_result = query.scroll_ids()
 
     def iter_export_docs():
         with TransientTempfile() as temp_path:
@@ -267,6 +275,92 @@ def scroll_query(index_name, q, es_instance_alias=ES_DEFAULT_INSTANCE):
         raise ESError(e)
 
 
+def scroll_query_partitions(index_name, q, num_partitions, es_instance_alias=ES_DEFAULT_INSTANCE):
+    """
+    Split a scroll over the index into up to ``num_partitions`` independent
+    scrolls, each over a different set of the index's shards. The partitions
+    can be consumed concurrently, each on its own connection.
+
+    Sliced scrolls aren't supported before Elasticsearch 5, so the shards of
+    each partition are selected with the ``_shards`` search preference.
+
+    :returns: A list of ScanResults, one for each partition
+    """
+    es_meta = ES_META[index_name]
+    client = get_es_instance(es_instance_alias)
+    try:
+        shard_ids = sorted({copies[0]['shard'] for copies in client.search_shards(index=es_meta.index)['shards']})
+        return [
+            scan(
+                client,
+                index=es_meta.index,
+                doc_type=es_meta.type,
+                query=q,
+                preference='_shards:{}'.format(','.join(str(shard_id) for shard_id in partition_shard_ids)),
+            )
+            for partition_shard_ids in _partition_shard_ids(shard_ids, num_partitions)
+        ]
+    except ElasticsearchException as e:
+        raise ESError(e)
+
+
+def _partition_shard_ids(shard_ids, num_partitions):
+    num_partitions = max(1, min(num_partitions, len(shard_ids)))
+    return [shard_ids[partition::num_partitions] for partition in range(num_partitions)]
+
+
+def iter_in_parallel(iterables, chunk_size=1000):
+    """
+    Iterate over each of the iterables in its own thread, yielding their items
+    in the order they arrive. The first error raised by an iterable is raised
+    once the items it yielded before it have been yielded.
+    """
+    chunks = queue.Queue(maxsize=2 * len(iterables))
+    stopped = threading.Event()
+    done = object()
+    errors = []
+
+    def send(chunk):
+        while not stopped.is_set():
+            try:
+                chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def run(iterable):
+        try:
+            for chunk in chunked(iterable, chunk_size):
+                if stopped.is_set():
+                    return
+                send(chunk)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            send(done)
+
+    threads = [
+        threading.Thread(target=run, args=(iterable,), name='iter-in-parallel-{}'.format(index))
+        for index, iterable in enumerate(iterables)
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        remaining = len(threads)
+        while remaining:
+            chunk = chunks.get()
+            if chunk is done:
+                remaining -= 1
+                if errors:
+                    raise errors[0]
+            else:
+                yield from chunk
+    finally:
+        stopped.set()
+
+
 class ScanResult(object):
 
     def __init__(self, count, iterator):
@@ -313,7 +313,15 @@ def extract_case_blocks(doc, include_path=False):
        path: ["form", "path", "to", "block"]
 
     Repeat nodes will all share the same path.
+
+    The case blocks of a form that was parsed by
+    ``corehq.form_processor.parsers.form_xml.parse_form_xml`` when it was
+    submitted were collected while parsing, and are not looked for again.
     """
+    parsed_xml = getattr(doc, '_parsed_xml', None)
+    if parsed_xml is not None:
+        return [struct if include_path else struct.caseblock for struct in parsed_xml.case_blocks]
+
     if isinstance(doc, XFormInstance):
         form = doc.to_json()['form']
     elif isinstance(doc, dict):
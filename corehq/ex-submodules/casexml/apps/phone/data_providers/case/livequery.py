@@ -23,42 +23,62 @@ Example case graphs with outcomes:
 """
 import logging
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from itertools import chain, islice
 
+from django.db import connections
+
 from casexml.apps.case.const import CASE_INDEX_EXTENSION as EXTENSION
 from casexml.apps.phone.const import ASYNC_RETRY_AFTER
 from casexml.apps.phone.data_providers.case.load_testing import (
     get_xml_for_response,
 )
 from casexml.apps.phone.data_providers.case.stock import get_stock_payload
-from casexml.apps.phone.data_providers.case.utils import get_case_sync_updates
+from casexml.apps.phone.data_providers.case.utils import (
+    get_cached_case_xml,
+    get_case_sync_updates,
+)
 from casexml.apps.phone.tasks import ASYNC_RESTORE_SENT
 from corehq.form_processor.interfaces.dbaccessors import CaseAccessors
-from corehq.sql_db.routers import read_from_plproxy_standbys
-from corehq.toggles import LIVEQUERY_READ_FROM_STANDBYS, NAMESPACE_USER
+from corehq.sql_db.routers import (
+    allow_read_from_plproxy_standby,
+    read_from_plproxy_standbys,
+)
+from corehq.toggles import (
+    CACHED_RESTORE_CASE_XML,
+    LIVEQUERY_PREFETCH_CASES,
+    LIVEQUERY_READ_FROM_STANDBYS,
+    NAMESPACE_USER,
+)
 from corehq.util.datadog.utils import case_load_counter
 
 
 def livequery_read_from_standbys(func):
     @wraps(func)
-    def _inner(timing_context, restore_state, response, async_task=None):
+    def _inner(timing_context, restore_state, response, async_task=None, **kwargs):
         if LIVEQUERY_READ_FROM_STANDBYS.enabled(restore_state.restore_user.user_id, NAMESPACE_USER):
             with read_from_plproxy_standbys():
-                return func(timing_context, restore_state, response, async_task)
+                return func(timing_context, restore_state, response, async_task, **kwargs)
         else:
-            return func(timing_context, restore_state, response, async_task)
+            return func(timing_context, restore_state, response, async_task, **kwargs)
 
     return _inner
 
 
 @livequery_read_from_standbys
-def do_livequery(timing_context, restore_state, response, async_task=None):
+def do_livequery(timing_context, restore_state, response, async_task=None,
+                 owner_ids=None, synced_case_ids=frozenset()):
     """Get case sync restore response
 
     This function makes no changes to external state other than updating
     the `restore_state.current_sync_log` and progress of `async_task`.
     Extends `response` with restore elements.
+
+    :param owner_ids: Sync the cases of these owners rather than all of
+    `restore_state.owner_ids`.
+    :param synced_case_ids: Ids of cases that are already in `response`.
+    They are not sent again, and are kept in the sync log's case ids.
     """
     def index_key(index):
         return '{} {}'.format(index.case_id, index.identifier)
@@ -70,8 +90,8 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
         """
         return case_id in hosts_by_extension and case_id not in parents_by_child
 
-    def has_live_extension(case_id, cache={}):
-        """Check if available case_id has a live extension case
+    def get_hosts_with_live_extensions():
+        """Get ids of available cases that have a live extension case
 
         Do not check for live children because an available parent
         cannot cause it's children to become live. This is unlike an
@@ -83,19 +103,18 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
             - it is open and is the extension of an available case.
         - A case is live if it is owned and available.
 
-        The result is cached to reduce recursion in subsequent calls
-        and to prevent infinite recursion.
+        Walks from live and owned cases to their hosts, one level of the
+        extension graph at a time, so deep extension chains do not
+        cause deep recursion.
         """
-        try:
-            return cache[case_id]
-        except KeyError:
-            cache[case_id] = False
-        cache[case_id] = result = any(
-            ext_id in live_ids      # has live extension
-            or ext_id in owned_ids  # ext is owned and available, will be live
-            or has_live_extension(ext_id)
-            for ext_id in extensions_by_host[case_id]
-        )
+        result = set()
+        frontier = live_ids | owned_ids
+        while frontier:
+            frontier = {host_id
+                for case_id in frontier
+                for host_id in hosts_by_extension.get(case_id, ())
+                if host_id not in result}
+            result.update(frontier)
         return result
 
     def enliven(case_id):
@@ -103,19 +122,20 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
 
         This closure mutates `live_ids` from the enclosing function.
         """
-        if case_id in live_ids:
-            # already live
-            return
-        debug('enliven(%s)', case_id)
-        live_ids.add(case_id)
-        # case is open and is the extension of a live case
-        ext_ids = extensions_by_host.get(case_id, [])
-        # case has live extension
-        host_ids = hosts_by_extension.get(case_id, [])
-        # case has live child
-        parent_ids = parents_by_child.get(case_id, [])
-        for cid in chain(ext_ids, host_ids, parent_ids):
-            enliven(cid)
+        stack = [case_id]
+        while stack:
+            case_id = stack.pop()
+            if case_id in live_ids:
+                # already live
+                continue
+            debug('enliven(%s)', case_id)
+            live_ids.add(case_id)
+            # case is open and is the extension of a live case
+            stack.extend(extensions_by_host.get(case_id, []))
+            # case has live extension
+            stack.extend(hosts_by_extension.get(case_id, []))
+            # case has live child
+            stack.extend(parents_by_child.get(case_id, []))
 
     def classify(index, prev_ids):
         """Classify index as either live or extension with live status pending
@@ -200,7 +220,7 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
     parents_by_child = defaultdict(set)    # child_id -> parent_ids
     indices = defaultdict(list)  # case_id -> list of CommCareCaseIndex-like
     seen_ix = defaultdict(set)   # case_id -> set of '<index.case_id> <index.identifier>'
-    owner_ids = list(restore_state.owner_ids)
+    owner_ids = list(restore_state.owner_ids if owner_ids is None else owner_ids)
 
     debug("sync %s for %r", restore_state.current_sync_log._id, owner_ids)
     with timing_context("livequery"):
@@ -235,10 +255,11 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
                     enliven(case_id)
 
             # available case with live extension -> live
+            hosts_with_live_extensions = get_hosts_with_live_extensions()
             for case_id in open_ids:
                 if (case_id not in live_ids
                         and not is_extension(case_id)
-                        and has_live_extension(case_id)):
+                        and case_id in hosts_with_live_extensions):
                     enliven(case_id)
 
             debug('live: %r', live_ids)
@@ -250,15 +271,22 @@ def do_livequery(timing_context, restore_state, response, async_task=None):
                     live_ids, restore_state, accessor)
         else:
             sync_ids = live_ids
-        restore_state.current_sync_log.case_ids_on_phone = live_ids
+        if synced_case_ids:
+            sync_ids = sync_ids - synced_case_ids
+            restore_state.current_sync_log.case_ids_on_phone = live_ids | synced_case_ids
+        else:
+            restore_state.current_sync_log.case_ids_on_phone = live_ids
 
         with timing_context("compile_response(%s cases)" % len(sync_ids)):
             iaccessor = PrefetchIndexCaseAccessor(accessor, indices)
+            batches = batch_cases(iaccessor, sync_ids)
+            if LIVEQUERY_PREFETCH_CASES.enabled(restore_state.domain):
+                batches = prefetch_batches(batches)
             compile_response(
                 timing_context,
                 restore_state,
                 response,
-                batch_cases(iaccessor, sync_ids),
+                batches,
                 init_progress(async_task, len(sync_ids)),
             )
 
@@ -308,6 +336,35 @@ def batch_cases(accessor, case_ids):
         yield accessor.get_cases(next_ids)
 
 
+def prefetch_batches(batches):
+    """Load the next batch of cases in a background thread while the current
+    batch is being serialized
+
+    Batches are yielded in order. The thread's database connections are
+    closed once all batches have been loaded.
+    """
+    standbys = allow_read_from_plproxy_standby()
+    done = object()
+
+    def next_batch():
+        if standbys:
+            with read_from_plproxy_standbys():
+                return next(batches, done)
+        return next(batches, done)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        try:
+            future = executor.submit(next_batch)
+            while True:
+                cases = future.result()
+                if cases is done:
+                    break
+                future = executor.submit(next_batch)
+                yield cases
+        finally:
+            executor.submit(connections.close_all)
+
+
 def init_progress(async_task, total):
     if not async_task:
         return lambda done: None
@@ -328,6 +385,10 @@ def init_progress(async_task, total):
 
 def compile_response(timing_context, restore_state, response, batches, update_progress):
     done = 0
+    cache_case_xml = (
+        restore_state.loadtest_factor == 1
+        and CACHED_RESTORE_CASE_XML.enabled(restore_state.domain)
+    )
     for cases in batches:
         with timing_context("get_stock_payload"):
             response.extend(get_stock_payload(
@@ -341,9 +402,12 @@ def compile_response(timing_context, restore_state, response, batches, update_pr
                 restore_state.domain, cases, restore_state.last_sync_log)
 
         with timing_context("get_xml_for_response (%s updates)" % len(updates)):
-            response.extend(item
-                for update in updates
-                for item in get_xml_for_response(update, restore_state))
+            if cache_case_xml:
+                response.extend(get_cached_case_xml(updates, restore_state.version))
+            else:
+                response.extend(item
+                    for update in updates
+                    for item in get_xml_for_response(update, restore_state))
 
         done += len(cases)
         update_progress(done)
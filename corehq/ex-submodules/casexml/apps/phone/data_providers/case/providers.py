@@ -1,6 +1,10 @@
 from casexml.apps.phone.data_providers import AsyncDataProvider
 from casexml.apps.phone.data_providers.case.clean_owners import CleanOwnerCaseSyncOperation
 from casexml.apps.phone.data_providers.case.livequery import do_livequery
+from casexml.apps.phone.data_providers.case.snapshot import (
+    do_livequery_with_snapshot,
+    use_restore_snapshot,
+)
 
 
 class CasePayloadProvider(AsyncDataProvider):
@@ -9,7 +13,14 @@ class CasePayloadProvider(AsyncDataProvider):
     """
 
     def extend_response(self, restore_state, response):
-        if restore_state.is_livequery:
+        if use_restore_snapshot(restore_state):
+            do_livequery_with_snapshot(
+                self.timing_context,
+                restore_state,
+                response,
+                self.async_task,
+            )
+        elif restore_state.is_livequery:
             do_livequery(
                 self.timing_context,
                 restore_state,
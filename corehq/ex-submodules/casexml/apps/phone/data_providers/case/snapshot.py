@@ -0,0 +1,168 @@
+"""
+Shared restore snapshots
+
+The case payload of an initial livequery restore depends only on the owner
+ids of the restoring user. Apart from the user's own id, users in the same
+groups or at the same locations have the same owner ids, and so get the same
+cases for them. The first initial restore for a set of shared owner ids saves
+their case payload as a snapshot, and later initial restores for the same
+shared owner ids use it rather than querying and serializing the cases
+again.
+
+The cases owned by the user, including their usercase, are generated for
+each user and added after the snapshot, leaving out any cases that are
+already in it. The other parts of the restore, including the sync token,
+registration block and fixtures, are also generated for each user.
+
+A restore that uses a snapshot gets a sync log dated when the snapshot was
+generated, so that the next sync sends any cases that have been modified
+since then.
+"""
+import json
+import shutil
+import struct
+import tempfile
+from datetime import datetime
+from uuid import uuid4
+
+from casexml.apps.phone import xml as xml_util
+from casexml.apps.phone.data_providers.case.livequery import do_livequery
+from casexml.apps.phone.restore_caching import RestoreSnapshotCache
+from casexml.apps.phone.utils import get_cached_items_with_count
+from corehq.blobs import CODES, get_blob_db
+from corehq.blobs.exceptions import NotFound
+from corehq.toggles import SHARED_RESTORE_SNAPSHOTS
+from corehq.util.datadog.gauges import datadog_counter
+
+SNAPSHOT_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# snapshots start with the length of their JSON header
+_HEADER_LENGTH = struct.Struct('>Q')
+
+
+def use_restore_snapshot(restore_state):
+    return (
+        restore_state.is_livequery
+        and restore_state.is_initial
+        and restore_state.loadtest_factor == 1
+        and SHARED_RESTORE_SNAPSHOTS.enabled(restore_state.domain)
+    )
+
+
+def do_livequery_with_snapshot(timing_context, restore_state, response, async_task=None):
+    """Extend `response` with the case payload from the restore snapshot for
+    the owner ids the user shares with other users, generating and saving the
+    snapshot if there isn't one, and then with the cases owned by the user
+    """
+    user_id = restore_state.restore_user.user_id
+    shared_owner_ids = restore_state.owner_ids - {user_id}
+    if not shared_owner_ids:
+        do_livequery(timing_context, restore_state, response, async_task)
+        return
+
+    _extend_response_with_shared_cases(timing_context, restore_state, response, shared_owner_ids, async_task)
+    # a case is live for a set of owners if it is live for one of them, so the
+    # cases that are live for the user's own id complete the payload
+    do_livequery(
+        timing_context, restore_state, response, async_task,
+        owner_ids={user_id},
+        synced_case_ids=set(restore_state.current_sync_log.case_ids_on_phone),
+    )
+
+
+def _extend_response_with_shared_cases(timing_context, restore_state, response, shared_owner_ids, async_task):
+    cache = RestoreSnapshotCache(restore_state.domain, shared_owner_ids, restore_state.version)
+    tags = ['domain:{}'.format(restore_state.domain)]
+    if not restore_state.overwrite_cache:
+        with timing_context("restore snapshot"):
+            if _extend_response_from_snapshot(cache.get_value(), restore_state, response):
+                datadog_counter('commcare.restores.snapshot.hits', tags=tags)
+                return
+    datadog_counter('commcare.restores.snapshot.misses', tags=tags)
+
+    # the sync log date is set before any cases are loaded
+    date = restore_state.current_sync_log.date
+    with tempfile.TemporaryFile('w+b') as fileobj:
+        recorder = SnapshotRecorder(response, fileobj)
+        do_livequery(timing_context, restore_state, recorder, async_task, owner_ids=shared_owner_ids)
+        with timing_context("save restore snapshot"):
+            header = json.dumps({
+                'date': date.strftime(SNAPSHOT_DATE_FORMAT),
+                'num_items': recorder.num_items,
+                'case_ids': sorted(restore_state.current_sync_log.case_ids_on_phone),
+            }).encode('utf-8')
+            name = _save_snapshot(restore_state.domain, cache, header, fileobj)
+            cache.set_value(name)
+
+
+def _extend_response_from_snapshot(name, restore_state, response):
+    """:returns: True if the snapshot was found, otherwise False"""
+    if not name:
+        return False
+    try:
+        fileobj = get_blob_db().get(key=name)
+    except NotFound:
+        return False
+    with fileobj:
+        header_length, = _HEADER_LENGTH.unpack(_read(fileobj, _HEADER_LENGTH.size))
+        header = json.loads(_read(fileobj, header_length).decode('utf-8'))
+        sync_log = restore_state.current_sync_log
+        sync_log.date = datetime.strptime(header['date'], SNAPSHOT_DATE_FORMAT)
+        sync_log.case_ids_on_phone = set(header['case_ids'])
+        response.append_file(fileobj, header['num_items'])
+    return True
+
+
+def _save_snapshot(domain, cache, header, fileobj):
+    name = 'restore-snapshot-{}.xml'.format(uuid4().hex)
+    with tempfile.TemporaryFile('w+b') as snapshot:
+        snapshot.write(_HEADER_LENGTH.pack(len(header)))
+        snapshot.write(header)
+        fileobj.seek(0)
+        shutil.copyfileobj(fileobj, snapshot)
+        snapshot.seek(0)
+        get_blob_db().put(
+            snapshot,
+            domain=domain,
+            parent_id=cache.cache_key,
+            type_code=CODES.restore,
+            key=name,
+            timeout=cache.timeout // 60,
+        )
+    return name
+
+
+def _read(fileobj, size):
+    # blob streams may return fewer bytes than requested
+    data = bytearray()
+    while len(data) < size:
+        chunk = fileobj.read(size - len(data))
+        if not chunk:
+            raise EOFError("restore snapshot is incomplete")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class SnapshotRecorder(object):
+    """Restore content that is also written to `fileobj`
+
+    Elements are serialized once, and passed on to `content` as bytes.
+    """
+
+    def __init__(self, content, fileobj):
+        self.content = content
+        self.fileobj = fileobj
+        self.num_items = 0
+
+    def append(self, xml_element):
+        if isinstance(xml_element, bytes):
+            xml_bytes, num_items = get_cached_items_with_count(xml_element)
+        else:
+            xml_element = xml_bytes = xml_util.tostring(xml_element)
+            num_items = 1
+        self.num_items += num_items
+        self.fileobj.write(xml_bytes)
+        self.content.append(xml_element)
+
+    def extend(self, iterable):
+        for element in iterable:
+            self.append(element)
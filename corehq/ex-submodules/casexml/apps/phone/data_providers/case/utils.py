@@ -1,5 +1,13 @@
 from collections import namedtuple
+
+from django.core.cache import cache
+
 from casexml.apps.case import const
+from casexml.apps.phone.xml import get_case_xml
+from corehq.util.datadog.gauges import datadog_counter
+
+# cached case XML is keyed by the case's modified date, so it is never stale
+CASE_XML_CACHE_TIMEOUT = 24 * 60 * 60
 
 
 # stub class used by commtrack config to check case types for consumption payload
@@ -51,3 +59,37 @@ def get_case_sync_updates(domain, cases, last_sync_log):
             case_updates_to_sync.append(sync_update)
 
     return case_updates_to_sync
+
+
+def get_cached_case_xml(updates, version):
+    """
+    Return the serialized XML for a list of CaseSyncUpdate objects, in the same
+    order, reusing the XML of cases that have not been modified since they were
+    last serialized for any restore.
+    """
+    keys = [_get_case_xml_cache_key(update, version) for update in updates]
+    cached = cache.get_many([key for key in keys if key])
+    to_cache = {}
+    xml_fragments = []
+    for key, update in zip(keys, updates):
+        xml = cached.get(key) if key else None
+        if xml is None:
+            xml = get_case_xml(update.case, update.required_updates, version)
+            if key:
+                to_cache[key] = xml
+        xml_fragments.append(xml)
+
+    if to_cache:
+        cache.set_many(to_cache, CASE_XML_CACHE_TIMEOUT)
+    datadog_counter('commcare.restores.case_xml_cache', len(cached), tags=['result:hit'])
+    datadog_counter('commcare.restores.case_xml_cache', len(updates) - len(cached), tags=['result:miss'])
+    return xml_fragments
+
+
+def _get_case_xml_cache_key(update, version):
+    modified_on = update.case.server_modified_on
+    if not modified_on:
+        return None
+    return 'restore-case-xml-{}-{}-{}-{}'.format(
+        update.case.case_id, modified_on.isoformat(), version, '-'.join(update.required_updates)
+    )
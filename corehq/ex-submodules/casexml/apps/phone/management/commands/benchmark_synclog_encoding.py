@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from casexml.apps.phone.models import SimplifiedSyncLog, SyncLogSQL
+from casexml.apps.phone.synclog_encoding import (
+    decode_case_state,
+    encode_case_state,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the size and the time to load a sync log stored as JSON "
+        "with the compact encoding of its case state"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('synclog_id')
+        parser.add_argument('--iterations', type=int, default=5)
+
+    def handle(self, synclog_id, **options):
+        synclog = SyncLogSQL.objects.filter(synclog_id=synclog_id).first()
+        if not synclog:
+            raise CommandError("Sync log not found: {}".format(synclog_id))
+        doc = synclog.doc
+        if synclog.case_state is not None:
+            doc = decode_case_state(doc, synclog.case_state)
+
+        iterations = options['iterations']
+        doc_json = json.dumps(doc)
+        compact_doc, case_state = encode_case_state(doc)
+        if case_state is None:
+            raise CommandError("The case state of this sync log can't be encoded")
+        compact_doc_json = json.dumps(compact_doc)
+
+        print("Cases on phone: {}".format(len(doc.get('case_ids_on_phone') or [])))
+        print("JSON: {:,} bytes".format(len(doc_json)))
+        print("Compact: {:,} bytes ({:,} doc + {:,} case state)".format(
+            len(compact_doc_json) + len(case_state), len(compact_doc_json), len(case_state)
+        ))
+        print("\nms / iteration over {} iterations".format(iterations))
+        print("{:<10}{:>10.1f}".format('encode', _time(iterations, lambda: encode_case_state(doc))))
+        print("{:<10}{:>10.1f}".format('decode', _time(
+            iterations, lambda: decode_case_state(json.loads(compact_doc_json), case_state)
+        )))
+        print("{:<10}{:>10.1f}".format('load JSON', _time(
+            iterations, lambda: SimplifiedSyncLog.wrap(json.loads(doc_json))
+        )))
+        print("{:<10}{:>10.1f}".format('load', _time(
+            iterations,
+            lambda: SimplifiedSyncLog.wrap(decode_case_state(json.loads(compact_doc_json), case_state))
+        )))
+
+
+def _time(iterations, fn):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn()
+    return (time.perf_counter() - start) * 1000 / iterations
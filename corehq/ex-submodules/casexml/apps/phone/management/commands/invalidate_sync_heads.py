@@ -23,7 +23,8 @@ class Command(BaseCommand):
             log_format=LOG_FORMAT_SIMPLIFIED
         )
         for synclog in synclogs_sql:
-            doc = properly_wrap_sync_log(synclog.doc)
+            doc = properly_wrap_sync_log(synclog.doc, synclog)
             doc.case_ids_on_phone = {'broken to force 412'}
             synclog.doc = doc.to_json()
+            synclog.case_state = None
         bulk_update_helper(synclogs_sql)
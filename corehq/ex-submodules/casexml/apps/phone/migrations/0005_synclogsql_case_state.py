@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phone', '0004_auto_20191021_1308'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclogsql',
+            name='case_state',
+            field=models.BinaryField(null=True),
+        ),
+    ]
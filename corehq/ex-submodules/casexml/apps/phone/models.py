@@ -21,6 +21,10 @@ from casexml.apps.phone.exceptions import (
     IncompatibleSyncLogType,
     MissingSyncLog,
 )
+from casexml.apps.phone.synclog_encoding import (
+    decode_case_state,
+    encode_case_state,
+)
 from dimagi.ext.couchdbkit import (
     BooleanProperty,
     DateTimeProperty,
@@ -40,7 +44,11 @@ from dimagi.utils.couch import LooselyEqualDocumentSchema
 from dimagi.utils.logging import notify_exception
 
 from corehq.apps.domain.models import Domain
-from corehq.toggles import ENABLE_LOADTEST_USERS, LEGACY_SYNC_SUPPORT
+from corehq.toggles import (
+    COMPACT_SYNC_LOGS,
+    ENABLE_LOADTEST_USERS,
+    LEGACY_SYNC_SUPPORT,
+)
 from corehq.util.global_request import get_request_domain
 from corehq.util.soft_assert import soft_assert
 
@@ -412,7 +420,11 @@ def synclog_to_sql_object(synclog_json_object):
     ]
     for from_field, to_field in field_mapping:
         setattr(synclog, to_field, getattr(synclog_json_object, from_field, None))
-    synclog.doc = synclog_json_object.to_json()
+    doc = synclog_json_object.to_json()
+    if COMPACT_SYNC_LOGS.enabled(synclog_json_object.domain):
+        synclog.doc, synclog.case_state = encode_case_state(doc)
+    else:
+        synclog.doc, synclog.case_state = doc, None
     return synclog
 
 
@@ -425,6 +437,9 @@ class SyncLogSQL(models.Model):
     date = models.DateTimeField(db_index=True, null=True, blank=True)
     previous_synclog_id = models.UUIDField(max_length=255, default=None, null=True, blank=True)
     doc = JSONField()
+    # case state of the doc in the encoding from casexml.apps.phone.synclog_encoding,
+    # or None if it is in the doc
+    case_state = models.BinaryField(null=True)
     log_format = models.CharField(
         max_length=10,
         choices=[
@@ -1021,6 +1036,8 @@ def get_properly_wrapped_sync_log(doc_id):
 
 
 def properly_wrap_sync_log(doc, synclog_sql=None):
+    if synclog_sql is not None and synclog_sql.case_state is not None:
+        doc = decode_case_state(doc, synclog_sql.case_state)
     synclog = SimplifiedSyncLog.wrap(doc)
     if synclog_sql:
         synclog._synclog_sql = synclog_sql
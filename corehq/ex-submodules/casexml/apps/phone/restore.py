@@ -1,7 +1,9 @@
 import logging
 import os
+import queue
 import shutil
 import tempfile
+import threading
 import uuid
 from io import BytesIO
 from uuid import uuid4
@@ -12,6 +14,7 @@ from xml.etree import cElementTree as ElementTree
 
 from celery.exceptions import TimeoutError
 from celery.result import AsyncResult
+from django.db import connections
 from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 from django.utils.text import slugify
@@ -24,7 +27,16 @@ from casexml.apps.phone.exceptions import (
 from casexml.apps.phone.restore_caching import AsyncRestoreTaskIdCache, RestorePayloadPathCache
 from casexml.apps.phone.tasks import get_async_restore_payload, ASYNC_RESTORE_SENT
 from casexml.apps.phone.utils import get_cached_items_with_count
-from corehq.toggles import EXTENSION_CASES_SYNC_ENABLED, LIVEQUERY_SYNC
+from corehq.sql_db.routers import (
+    allow_read_from_plproxy_standby,
+    read_from_plproxy_standbys,
+)
+from corehq.toggles import (
+    EXTENSION_CASES_SYNC_ENABLED,
+    LIVEQUERY_SYNC,
+    STREAMING_RESTORES,
+)
+from corehq.util.global_request import get_request, set_request
 from corehq.util.datadog.utils import bucket_value, maybe_add_domain_tag
 from corehq.util.timer import TimingContext
 from corehq.util.datadog.gauges import datadog_counter
@@ -130,14 +142,25 @@ class RestoreContent(object):
         for element in iterable:
             self.append(element)
 
-    def _write_to_file(self, fileobj):
+    def append_file(self, fileobj, num_items):
+        """Append XML elements that were serialized to a file
+
+        :param num_items: The number of items in the file.
+        """
+        self.num_items += num_items
+        shutil.copyfileobj(fileobj, self.response_body)
+
+    def get_start_tag(self):
         # Add 1 to num_items to account for message element
         items = (self.items_template % ('%s' % (self.num_items + 1)).encode('utf-8')) if self.items else b''
-        fileobj.write(self.start_tag_template % {
+        return self.start_tag_template % {
             b"items": items,
             b"username": self.username.encode("utf8"),
             b"nature": ResponseNature.OTA_RESTORE_SUCCESS.encode("utf8"),
-        })
+        }
+
+    def _write_to_file(self, fileobj):
+        fileobj.write(self.get_start_tag())
 
         self.response_body.seek(0)
         shutil.copyfileobj(self.response_body, fileobj)
@@ -155,6 +178,117 @@ class RestoreContent(object):
             raise
 
 
+class StreamingRestoreContent(RestoreContent):
+    """Restore content that is passed to ``send`` in chunks as it is generated,
+    rather than being written to a file
+
+    Only the body of the response is sent. The item count isn't known until
+    the whole body has been generated, so it can't be included in the start tag.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, username, send):
+        super(StreamingRestoreContent, self).__init__(username, items=False)
+        self.send = send
+
+    def __enter__(self):
+        self.response_body = BytesIO()
+        return self
+
+    def append(self, xml_element):
+        super(StreamingRestoreContent, self).append(xml_element)
+        if self.response_body.tell() >= self.chunk_size:
+            self.flush()
+
+    def append_file(self, fileobj, num_items):
+        self.num_items += num_items
+        for chunk in iter(lambda: fileobj.read(self.chunk_size), b''):
+            self.response_body.write(chunk)
+            self.flush()
+
+    def flush(self):
+        chunk = self.response_body.getvalue()
+        if chunk:
+            self.response_body = BytesIO()
+            self.send(chunk)
+
+
+class RestoreStreamClosed(Exception):
+    pass
+
+
+class RestoreContentStream(object):
+    """Pass chunks of restore content from the thread that generates them to the
+    thread that sends them to the client
+
+    At most ``max_chunks`` chunks are held in memory. If the stream is closed,
+    for example because the client went away, the generating thread stops with
+    ``RestoreStreamClosed`` when it sends its next chunk.
+    """
+    max_chunks = 16
+
+    def __init__(self):
+        self._chunks = queue.Queue(maxsize=self.max_chunks)
+        self._closed = threading.Event()
+        self._done = object()
+        self._error = None
+        self._thread = None
+
+    def send(self, chunk):
+        while True:
+            if self._closed.is_set():
+                raise RestoreStreamClosed()
+            try:
+                self._chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def run_in_thread(self, generate_content):
+        """Call ``generate_content()``, which sends its content to this stream, in a new thread
+
+        The thread inherits the request and the plproxy standby setting of the
+        calling thread, and closes its database connections when it finishes.
+        """
+        request = get_request()
+        standbys = allow_read_from_plproxy_standby()
+
+        def run():
+            set_request(request)
+            try:
+                if standbys:
+                    with read_from_plproxy_standbys():
+                        generate_content()
+                else:
+                    generate_content()
+            except RestoreStreamClosed:
+                pass
+            except Exception as e:
+                self._error = e
+            finally:
+                connections.close_all()
+                try:
+                    self.send(self._done)
+                except RestoreStreamClosed:
+                    pass
+
+        self._thread = threading.Thread(target=run, name='restore-stream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is self._done:
+                break
+            yield chunk
+        if self._error is not None:
+            raise self._error
+
+
 class RestoreResponse(object):
 
     def __init__(self, fileobj):
@@ -214,6 +348,15 @@ class AsyncRestoreResponse(object):
         return response
 
 
+class StreamingRestoreResponse(object):
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def get_http_response(self):
+        return StreamingHttpResponse(self.chunks, content_type="text/xml; charset=utf-8")
+
+
 class CachedResponse(object):
 
     def __init__(self, name):
@@ -555,11 +698,17 @@ class RestoreConfig(object):
             device_id=self.params.device_id,
         )
 
-    def get_response(self):
+    def get_response(self, stream=False):
+        """
+        :param stream: Send the response while it is being generated, if the
+        domain has streaming restores enabled. See ``stream_payload``.
+        """
         is_async = self.is_async
+        is_streaming = False
         try:
             with self.timing_context:
-                payload = self.get_payload()
+                payload = self.get_payload(stream=stream)
+            is_streaming = isinstance(payload, StreamingRestoreResponse)
             response = payload.get_http_response()
         except RestoreException as e:
             logger.exception("%s error during restore submitted by %s: %s" %
@@ -571,11 +720,11 @@ class RestoreConfig(object):
             )
             response = HttpResponse(response, content_type="text/xml; charset=utf-8",
                                     status=412)  # precondition failed
-        if not is_async:
+        if not is_async and not is_streaming:
             self._record_timing(response.status_code)
         return response
 
-    def get_payload(self):
+    def get_payload(self, stream=False):
         self.validate()
         self.delete_initial_cached_payload_if_necessary()
         self.delete_cached_payload_if_necessary()
@@ -593,11 +742,16 @@ class RestoreConfig(object):
         # Start new sync
         if self.is_async:
             response = self._get_asynchronous_payload()
+        elif stream and self.can_stream():
+            response = StreamingRestoreResponse(self.stream_payload())
         else:
             response = self.generate_payload()
 
         return response
 
+    def can_stream(self):
+        return not self.params.include_item_count and STREAMING_RESTORES.enabled(self.domain)
+
     def validate(self):
         try:
             self.restore_state.validate_state()
@@ -636,6 +790,50 @@ class RestoreConfig(object):
             raise
         return response
 
+    def stream_payload(self):
+        """Generate the restore response in a background thread, and yield it
+        in chunks as it is generated
+
+        The response is also written to a temporary file, so that it can be
+        cached like a response that isn't streamed. The sync log is saved
+        before the closing tag is sent, so that a complete response always
+        refers to a saved sync log. If generating the response fails, the
+        client gets an incomplete response.
+
+        Restore timing is recorded when the response is complete, and only
+        covers generating the response.
+        """
+        self.timing_context = TimingContext(self.timing_context.root.name)
+        stream = RestoreContentStream()
+        with tempfile.TemporaryFile('w+b') as fileobj:
+            with self.timing_context:
+                self.restore_state.start_sync()
+                content = StreamingRestoreContent(self.restore_user.username, stream.send)
+                start_tag = content.get_start_tag()
+                fileobj.write(start_tag)
+                yield start_tag
+
+                stream.run_in_thread(lambda: self._stream_restore_content(content))
+                try:
+                    for chunk in stream:
+                        fileobj.write(chunk)
+                        yield chunk
+                finally:
+                    stream.close()
+
+                self.restore_state.finish_sync()
+                fileobj.write(content.closing_tag)
+            yield content.closing_tag
+
+            fileobj.seek(0)
+            self.set_cached_payload_if_necessary(fileobj, self.restore_state.duration, False)
+        self._record_timing(200)
+
+    def _stream_restore_content(self, content):
+        with content:
+            self._write_restore_content(content)
+            content.flush()
+
     def _get_asynchronous_payload(self):
         new_task = False
         # fetch the task from celery
@@ -690,15 +888,17 @@ class RestoreConfig(object):
         username = self.restore_user.username
         count_items = self.params.include_item_count
         with RestoreContent(username, count_items) as content:
-            for provider in get_element_providers(self.timing_context):
-                with self.timing_context(provider.__class__.__name__):
-                    content.extend(provider.get_elements(self.restore_state))
+            self._write_restore_content(content, async_task)
+            return content.get_fileobj()
 
-            for provider in get_async_providers(self.timing_context, async_task):
-                with self.timing_context(provider.__class__.__name__):
-                    provider.extend_response(self.restore_state, content)
+    def _write_restore_content(self, content, async_task=None):
+        for provider in get_element_providers(self.timing_context):
+            with self.timing_context(provider.__class__.__name__):
+                content.extend(provider.get_elements(self.restore_state))
 
-            return content.get_fileobj()
+        for provider in get_async_providers(self.timing_context, async_task):
+            with self.timing_context(provider.__class__.__name__):
+                provider.extend_response(self.restore_state, content)
 
     def set_cached_payload_if_necessary(self, fileobj, duration, is_async):
         # must cache if the duration was longer than the threshold
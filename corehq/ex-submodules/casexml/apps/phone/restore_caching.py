@@ -1,7 +1,12 @@
 import hashlib
 import logging
 import datetime
-from casexml.apps.phone.const import RESTORE_CACHE_KEY_PREFIX, ASYNC_RESTORE_CACHE_KEY_PREFIX
+from casexml.apps.phone.const import (
+    ASYNC_RESTORE_CACHE_KEY_PREFIX,
+    INITIAL_SYNC_CACHE_TIMEOUT,
+    RESTORE_CACHE_KEY_PREFIX,
+    RESTORE_SNAPSHOT_CACHE_KEY_PREFIX,
+)
 from corehq.toggles import ENABLE_LOADTEST_USERS
 from corehq.util.quickcache import quickcache
 from dimagi.utils.couch.cache.cache_core import get_redis_default_cache
@@ -97,3 +102,27 @@ class RestorePayloadPathCache(_RestoreCache):
 class AsyncRestoreTaskIdCache(_RestoreCache):
     timeout = 24 * 60 * 60
     prefix = ASYNC_RESTORE_CACHE_KEY_PREFIX
+
+
+class RestoreSnapshotCache(_CacheAccessor):
+    """Location of the shared case payload of initial restores for a set of owner ids
+
+    Not specific to a user: the owner ids are the ones users share, without the
+    restoring user's own id, so users with the same groups or location in the
+    domain get the same cache key.
+    """
+    timeout = INITIAL_SYNC_CACHE_TIMEOUT
+
+    def __init__(self, domain, owner_ids, version):
+        self.cache_key = self._make_cache_key(domain, owner_ids, version)
+        self.debug_info = (self.__class__.__name__, domain, len(owner_ids), version)
+
+    @classmethod
+    def _make_cache_key(cls, domain, owner_ids, version):
+        hashable_key = ','.join([str(part) for part in [
+            domain,
+            RESTORE_SNAPSHOT_CACHE_KEY_PREFIX,
+            version,
+            _get_domain_freshness_token(domain),
+        ] + sorted(owner_ids)])
+        return hashlib.md5(hashable_key.encode('utf-8')).hexdigest()
@@ -0,0 +1,168 @@
+"""
+Compact binary encoding of the case state of a ``SimplifiedSyncLog``
+
+The case id sets and index trees of a sync log hold the same case ids many
+times over, and for users with many cases they make up almost all of the sync
+log's JSON. The encoding stores each distinct case id once, in a sorted table
+where UUIDs are packed into 16 bytes, and refers to case ids by their position
+in the table. Sets of case ids are stored as the deltas between their sorted
+positions, which compress well.
+
+Layout (zlib compressed)::
+
+    4 byte big-endian length of the header | header JSON | packed UUIDs
+
+The header describes the table (the number of dashed and hex UUIDs, followed
+by any other case ids) and holds the encoded sets and index trees.
+"""
+import json
+import re
+import struct
+import zlib
+from itertools import accumulate
+
+ENCODING_VERSION = 1
+CASE_ID_SET_FIELDS = ('case_ids_on_phone', 'dependent_case_ids_on_phone', 'closed_cases')
+INDEX_TREE_FIELDS = ('index_tree', 'extension_index_tree')
+
+_HEADER_LENGTH = struct.Struct('>I')
+_DASHED = 'dashed'
+_HEX = 'hex'
+# UUIDs in their canonical (lower case) forms, which can be restored from their bytes
+_DASHED_UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\Z')
+_HEX_UUID_RE = re.compile(r'[0-9a-f]{32}\Z')
+# identifier position of a case in an index tree that has no indices
+_NO_INDICES = -1
+
+
+def encode_case_state(doc):
+    """Move the case state of a ``SimplifiedSyncLog`` JSON doc into the compact encoding
+
+    :returns: tuple of ``(doc, case_state)``: a copy of ``doc`` without the case state,
+    and the encoded case state. ``case_state`` is None, and ``doc`` is unchanged, if
+    the doc's case state can't be encoded.
+    """
+    sets = {field: doc.get(field) or [] for field in CASE_ID_SET_FIELDS}
+    trees = {field: (doc.get(field) or {}).get('indices') or {} for field in INDEX_TREE_FIELDS}
+    if not _is_encodable(sets, trees):
+        return doc, None
+
+    case_ids = set()
+    for case_id_set in sets.values():
+        case_ids.update(case_id_set)
+    for indices in trees.values():
+        for case_id, case_indices in indices.items():
+            case_ids.add(case_id)
+            case_ids.update(case_indices.values())
+
+    table, header = _build_table(case_ids)
+    position = {case_id: index for index, case_id in enumerate(table)}
+    header['version'] = ENCODING_VERSION
+    header['sets'] = {
+        field: _deltas(sorted(position[case_id] for case_id in case_id_set))
+        for field, case_id_set in sets.items()
+    }
+    header['trees'] = {field: _encode_tree(indices, position) for field, indices in trees.items()}
+
+    packed_uuids = bytes.fromhex(''.join(table[:header[_DASHED] + header[_HEX]]).replace('-', ''))
+    header_json = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    case_state = zlib.compress(_HEADER_LENGTH.pack(len(header_json)) + header_json + packed_uuids)
+
+    doc = {key: value for key, value in doc.items() if key not in CASE_ID_SET_FIELDS}
+    for field in INDEX_TREE_FIELDS:
+        if field in doc:
+            doc[field] = {key: value for key, value in doc[field].items() if key != 'indices'}
+    return doc, case_state
+
+
+def decode_case_state(doc, case_state):
+    """Inverse of ``encode_case_state``
+
+    :returns: a copy of ``doc`` with its case state decoded from ``case_state``
+    """
+    data = zlib.decompress(bytes(case_state))
+    header_length, = _HEADER_LENGTH.unpack_from(data)
+    header_end = _HEADER_LENGTH.size + header_length
+    header = json.loads(data[_HEADER_LENGTH.size:header_end].decode('utf-8'))
+    assert header['version'] == ENCODING_VERSION, header['version']
+
+    uuids_hex = data[header_end:].hex()
+    hex_uuids = [uuids_hex[start:start + 32] for start in range(0, len(uuids_hex), 32)]
+    table = (
+        ['-'.join((h[:8], h[8:12], h[12:16], h[16:20], h[20:])) for h in hex_uuids[:header[_DASHED]]]
+        + hex_uuids[header[_DASHED]:]
+        + header['others']
+    )
+
+    doc = dict(doc)
+    for field, deltas in header['sets'].items():
+        doc[field] = [table[index] for index in accumulate(deltas)]
+    for field, (identifiers, triples) in header['trees'].items():
+        indices = {}
+        case_positions = accumulate(triples[0::3])
+        for case_position, identifier, referenced_position in zip(case_positions, triples[1::3], triples[2::3]):
+            case_indices = indices.setdefault(table[case_position], {})
+            if identifier != _NO_INDICES:
+                case_indices[identifiers[identifier]] = table[referenced_position]
+        doc[field] = dict(doc.get(field) or {'doc_type': 'IndexTree'}, indices=indices)
+    return doc
+
+
+def _is_encodable(sets, trees):
+    return (
+        all(isinstance(case_id, str) for case_id_set in sets.values() for case_id in case_id_set)
+        and all(
+            isinstance(case_id, str) and isinstance(case_indices, dict)
+            and all(
+                isinstance(identifier, str) and isinstance(referenced_id, str)
+                for identifier, referenced_id in case_indices.items()
+            )
+            for indices in trees.values()
+            for case_id, case_indices in indices.items()
+        )
+    )
+
+
+def _build_table(case_ids):
+    """:returns: tuple of ``(table, header)``: the sorted table of case ids, dashed UUIDs
+    first then hex UUIDs then others, and the header fields that describe it
+    """
+    by_form = {_DASHED: [], _HEX: [], 'others': []}
+    for case_id in case_ids:
+        by_form[_get_uuid_form(case_id)].append(case_id)
+    for case_id_list in by_form.values():
+        case_id_list.sort()
+    table = by_form[_DASHED] + by_form[_HEX] + by_form['others']
+    return table, {_DASHED: len(by_form[_DASHED]), _HEX: len(by_form[_HEX]), 'others': by_form['others']}
+
+
+def _get_uuid_form(case_id):
+    if _DASHED_UUID_RE.match(case_id):
+        return _DASHED
+    if _HEX_UUID_RE.match(case_id):
+        return _HEX
+    return 'others'
+
+
+def _deltas(positions):
+    return [position - previous for previous, position in zip([0] + positions, positions)]
+
+
+def _encode_tree(indices, position):
+    """:returns: ``[identifiers, triples]`` where triples is a flat list of
+    ``(case position delta, identifier position, referenced case position)``
+    """
+    identifiers = sorted({identifier for case_indices in indices.values() for identifier in case_indices})
+    identifier_position = {identifier: index for index, identifier in enumerate(identifiers)}
+    triples = []
+    previous = 0
+    for case_position, case_id in sorted((position[case_id], case_id) for case_id in indices):
+        if not indices[case_id]:
+            triples.extend([case_position - previous, _NO_INDICES, 0])
+            previous = case_position
+        for identifier, referenced_id in sorted(indices[case_id].items()):
+            triples.extend([
+                case_position - previous, identifier_position[identifier], position[referenced_id]
+            ])
+            previous = case_position
+    return [identifiers, triples]
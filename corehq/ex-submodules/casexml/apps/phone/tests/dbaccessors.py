@@ -1,8 +1,12 @@
 from casexml.apps.phone.models import SyncLogSQL
+from casexml.apps.phone.synclog_encoding import decode_case_state
 from corehq.util.test_utils import unit_testing_only
 
 
 @unit_testing_only
 def get_all_sync_logs_docs():
     for synclog in SyncLogSQL.objects.all():
-        yield synclog.doc
+        if synclog.case_state is not None:
+            yield decode_case_state(synclog.doc, synclog.case_state)
+        else:
+            yield synclog.doc
@@ -1,12 +1,19 @@
+import threading
 import uuid
+from collections import namedtuple
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from jsonobject import JsonObject
+from mock import MagicMock, patch
 from six.moves import range
 
 from casexml.apps.case.mock import CaseFactory, CaseIndex, CaseStructure
 from casexml.apps.phone.const import CLEAN_OWNERS, LIVEQUERY
+from casexml.apps.phone.data_providers.case.livequery import (
+    do_livequery,
+    prefetch_batches,
+)
 from casexml.apps.phone.exceptions import RestoreException
 from casexml.apps.phone.models import SimplifiedSyncLog
 from casexml.apps.phone.restore import RestoreConfig
@@ -18,6 +25,10 @@ from casexml.apps.phone.utils import MockDevice
 
 from corehq.apps.domain.models import Domain
 from corehq.form_processor.tests.utils import use_sql_backend
+from corehq.sql_db.routers import (
+    allow_read_from_plproxy_standby,
+    read_from_plproxy_standbys,
+)
 from corehq.toggles import LEGACY_SYNC_SUPPORT
 from corehq.util.global_request.api import set_request
 
@@ -47,6 +58,94 @@ class TestLiveQuery(TestCase):
             device.sync(case_sync=CLEAN_OWNERS)
 
 
+class TestPrefetchBatches(SimpleTestCase):
+
+    def _batches(self, loaded):
+        for batch in [[1, 2], [3], [4, 5]]:
+            loaded.append((threading.get_ident(), allow_read_from_plproxy_standby()))
+            yield batch
+
+    def test_prefetch_batches(self):
+        loaded = []
+        self.assertEqual([[1, 2], [3], [4, 5]], list(prefetch_batches(self._batches(loaded))))
+        self.assertEqual(3, len(loaded))
+        self.assertNotIn(threading.get_ident(), {thread_id for thread_id, standbys in loaded})
+
+    def test_read_from_standbys(self):
+        loaded = []
+        with read_from_plproxy_standbys():
+            list(prefetch_batches(self._batches(loaded)))
+        self.assertEqual([True, True, True], [standbys for thread_id, standbys in loaded])
+
+
+FakeIndex = namedtuple('FakeIndex', 'case_id identifier referenced_id relationship')
+
+
+class FakeCaseAccessor(object):
+    """Case graph accessor for livequery without a database"""
+
+    domain = 'test-domain'
+
+    def __init__(self, owned_ids, indices, closed_ids=()):
+        self.owned_ids = owned_ids
+        self.indices = indices
+        self.closed_ids = set(closed_ids)
+
+    def get_case_ids_by_owners(self, owner_ids, closed=None):
+        return list(self.owned_ids)
+
+    def get_related_indices(self, case_ids, exclude_indices):
+        case_ids = set(case_ids)
+        return [
+            index for index in self.indices
+            if (index.case_id in case_ids or index.referenced_id in case_ids)
+            and '{} {}'.format(index.case_id, index.identifier) not in exclude_indices
+        ]
+
+    def get_closed_and_deleted_ids(self, case_ids):
+        return [(case_id, True, False) for case_id in case_ids if case_id in self.closed_ids]
+
+
+@patch('casexml.apps.phone.data_providers.case.livequery.compile_response')
+@patch('casexml.apps.phone.data_providers.case.livequery.LIVEQUERY_PREFETCH_CASES.enabled', return_value=False)
+@patch('casexml.apps.phone.data_providers.case.livequery.LIVEQUERY_READ_FROM_STANDBYS.enabled',
+       return_value=False)
+class TestLiveQueryCaseGraph(SimpleTestCase):
+
+    def _get_live_ids(self, accessor):
+        restore_state = MagicMock(owner_ids=['owner'], last_sync_log=None)
+        with patch('casexml.apps.phone.data_providers.case.livequery.CaseAccessors', return_value=accessor):
+            do_livequery(MagicMock(), restore_state, [])
+        return restore_state.current_sync_log.case_ids_on_phone
+
+    def test_deep_extension_chain(self, *args):
+        # c0 <--ext-- c1 <--ext-- ... <--ext-- cN(owned)
+        depth = 2000
+        case_ids = ['c{}'.format(i) for i in range(depth + 1)]
+        indices = [
+            FakeIndex(case_id, 'host', host_id, 'extension')
+            for host_id, case_id in zip(case_ids, case_ids[1:])
+        ]
+        self.assertEqual(set(case_ids), self._get_live_ids(FakeCaseAccessor([case_ids[-1]], indices)))
+
+    def test_closed_host(self, *args):
+        # a(closed) <--ext-- b <--ext-- c(owned)
+        indices = [
+            FakeIndex('b', 'host', 'a', 'extension'),
+            FakeIndex('c', 'host', 'b', 'extension'),
+        ]
+        self.assertEqual(set(), self._get_live_ids(FakeCaseAccessor(['c'], indices, closed_ids=['a'])))
+
+    def test_owned_child_and_extension(self, *args):
+        # b(closed) <--chi-- a(owned) <--ext-- c
+        indices = [
+            FakeIndex('a', 'parent', 'b', 'child'),
+            FakeIndex('c', 'host', 'a', 'extension'),
+        ]
+        live_ids = self._get_live_ids(FakeCaseAccessor(['a'], indices, closed_ids=['b']))
+        self.assertEqual({'a', 'b', 'c'}, live_ids)
+
+
 class TestNewSyncSpecifics(TestCase):
 
     @classmethod
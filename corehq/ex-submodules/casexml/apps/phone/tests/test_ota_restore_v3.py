@@ -9,7 +9,11 @@ from casexml.apps.case.tests.util import (
     delete_all_sync_logs,
 )
 from casexml.apps.case.mock import CaseBlock
-from casexml.apps.phone.restore import RestoreContent
+from casexml.apps.phone.restore import (
+    RestoreContent,
+    RestoreContentStream,
+    StreamingRestoreContent,
+)
 from casexml.apps.phone.tests.utils import create_restore_user
 from casexml.apps.phone.utils import MockDevice
 
@@ -75,3 +79,61 @@ class TestRestoreContent(SimpleTestCase):
             response.append(body.encode('utf-8'))
             with response.get_fileobj() as fileobj:
                 self.assertEqual(expected, fileobj.read().decode('utf-8'))
+
+
+class TestStreamingRestoreContent(SimpleTestCase):
+
+    def test_chunks(self):
+        chunks = []
+        body = ['<elem>data{}</elem>'.format(i) for i in range(10)]
+        content = StreamingRestoreContent('user1', chunks.append)
+        content.chunk_size = 40
+        with content:
+            content.extend(elem.encode('utf-8') for elem in body)
+            content.flush()
+        self.assertEqual(4, len(chunks))
+        self.assertEqual(''.join(body), b''.join(chunks).decode('utf-8'))
+        self.assertEqual(
+            TestRestoreContent()._expected('user1', ''),
+            (content.get_start_tag() + content.closing_tag).decode('utf-8'),
+        )
+
+    def test_stream(self):
+        stream = RestoreContentStream()
+
+        def generate():
+            for i in range(100):
+                stream.send(str(i).encode('utf-8'))
+
+        stream.run_in_thread(generate)
+        self.assertEqual([str(i).encode('utf-8') for i in range(100)], list(stream))
+
+    def test_stream_error(self):
+        stream = RestoreContentStream()
+
+        def generate():
+            stream.send(b'data')
+            raise ValueError('boom')
+
+        stream.run_in_thread(generate)
+        chunks = iter(stream)
+        self.assertEqual(b'data', next(chunks))
+        with self.assertRaises(ValueError):
+            next(chunks)
+
+    def test_stream_closed(self):
+        stream = RestoreContentStream()
+        sent = []
+
+        def generate():
+            for i in range(100):
+                stream.send(i)
+                sent.append(i)
+
+        stream.run_in_thread(generate)
+        chunks = iter(stream)
+        next(chunks)
+        stream.close()
+        stream._thread.join(5)
+        self.assertFalse(stream._thread.is_alive())
+        self.assertLess(len(sent), 100)
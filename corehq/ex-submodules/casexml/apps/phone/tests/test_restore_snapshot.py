@@ -0,0 +1,152 @@
+from datetime import datetime
+from io import BytesIO
+from xml.etree import cElementTree as ElementTree
+
+from django.test import SimpleTestCase
+
+from mock import MagicMock, patch
+
+from casexml.apps.phone.data_providers.case.snapshot import (
+    SnapshotRecorder,
+    _extend_response_from_snapshot,
+    _save_snapshot,
+    do_livequery_with_snapshot,
+)
+from casexml.apps.phone.restore import RestoreContent
+from casexml.apps.phone.restore_caching import RestoreSnapshotCache
+
+
+class FakeBlobDB(object):
+
+    def __init__(self):
+        self.blobs = {}
+
+    def put(self, content, key, **kw):
+        self.blobs[key] = content.read()
+
+    def get(self, key):
+        return ChunkedStream(self.blobs[key])
+
+
+class ChunkedStream(BytesIO):
+    # like a blob stream, reads return at most a few bytes
+
+    def read(self, size=-1):
+        return super(ChunkedStream, self).read(3 if size < 0 else min(size, 3))
+
+
+class SnapshotRecorderTest(SimpleTestCase):
+
+    def test_recorder(self):
+        fileobj = BytesIO()
+        with RestoreContent('user') as content:
+            recorder = SnapshotRecorder(content, fileobj)
+            recorder.extend([
+                ElementTree.Element('case'),
+                b'<!--items=2--><ledger/><ledger/>',
+                b'<case/>',
+            ])
+            self.assertEqual(4, recorder.num_items)
+            self.assertEqual(4, content.num_items)
+            self.assertEqual(b'<case /><ledger/><ledger/><case/>', fileobj.getvalue())
+            content.response_body.seek(0)
+            self.assertEqual(fileobj.getvalue(), content.response_body.read())
+
+
+@patch('casexml.apps.phone.restore_caching._get_domain_freshness_token', lambda domain: 'token')
+class RestoreSnapshotTest(SimpleTestCase):
+
+    def test_cache_key(self):
+        self.assertEqual(
+            RestoreSnapshotCache('domain', ['a', 'b'], '2.0').cache_key,
+            RestoreSnapshotCache('domain', {'b', 'a'}, '2.0').cache_key,
+        )
+        self.assertNotEqual(
+            RestoreSnapshotCache('domain', ['a', 'b'], '2.0').cache_key,
+            RestoreSnapshotCache('domain', ['a'], '2.0').cache_key,
+        )
+
+    def test_round_trip(self):
+        blob_db = FakeBlobDB()
+        restore_state = MagicMock()
+        cache = RestoreSnapshotCache('domain', ['a'], '2.0')
+        header = b'{"date": "2019-11-01T10:30:00.000000Z", "num_items": 2, "case_ids": ["c1", "c2"]}'
+        with patch('casexml.apps.phone.data_providers.case.snapshot.get_blob_db', return_value=blob_db):
+            name = _save_snapshot('domain', cache, header, BytesIO(b'<case/><case/>'))
+            with RestoreContent('user') as content:
+                self.assertTrue(_extend_response_from_snapshot(name, restore_state, content))
+                content.response_body.seek(0)
+                self.assertEqual(b'<case/><case/>', content.response_body.read())
+                self.assertEqual(2, content.num_items)
+        self.assertEqual(datetime(2019, 11, 1, 10, 30), restore_state.current_sync_log.date)
+        self.assertEqual({'c1', 'c2'}, restore_state.current_sync_log.case_ids_on_phone)
+
+    def test_missing_snapshot(self):
+        self.assertFalse(_extend_response_from_snapshot(None, MagicMock(), MagicMock()))
+
+
+def _fake_livequery(timing_context, restore_state, response, async_task=None,
+                    owner_ids=None, synced_case_ids=frozenset()):
+    if owner_ids is None:
+        owner_ids = restore_state.owner_ids
+    restore_state.livequery_owner_ids.append(sorted(owner_ids))
+    case_ids = {'case-{}'.format(owner_id) for owner_id in owner_ids}
+    response.extend(ElementTree.Element('case', {'id': case_id}) for case_id in sorted(case_ids - synced_case_ids))
+    restore_state.current_sync_log.case_ids_on_phone = case_ids | synced_case_ids
+
+
+@patch('casexml.apps.phone.restore_caching._get_domain_freshness_token', lambda domain: 'token')
+@patch('casexml.apps.phone.data_providers.case.snapshot.do_livequery', _fake_livequery)
+@patch('casexml.apps.phone.data_providers.case.snapshot.datadog_counter', MagicMock())
+class SharedSnapshotTest(SimpleTestCase):
+
+    def setUp(self):
+        self.snapshot_names = {}
+        for method, fake in [
+            ('get_value', lambda cache: self.snapshot_names.get(cache.cache_key)),
+            ('set_value', lambda cache, value: self.snapshot_names.__setitem__(cache.cache_key, value)),
+        ]:
+            patcher = patch.object(RestoreSnapshotCache, method, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('casexml.apps.phone.data_providers.case.snapshot.get_blob_db', return_value=FakeBlobDB())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _restore(self, user_id, owner_ids):
+        restore_state = MagicMock(
+            domain='domain',
+            version='2.0',
+            owner_ids={user_id} | set(owner_ids),
+            overwrite_cache=False,
+            livequery_owner_ids=[],
+        )
+        restore_state.restore_user.user_id = user_id
+        restore_state.current_sync_log.date = datetime(2019, 11, 1, 10, 30)
+        with RestoreContent(user_id) as content:
+            do_livequery_with_snapshot(MagicMock(), restore_state, content)
+            content.response_body.seek(0)
+            case_ids = [case.get('id') for case in ElementTree.fromstring(
+                b'<cases>' + content.response_body.read() + b'</cases>'
+            )]
+        return restore_state, case_ids
+
+    def test_users_in_same_groups_share_snapshot(self):
+        first, first_case_ids = self._restore('user1', ['group1', 'location1'])
+        self.assertEqual([['group1', 'location1'], ['user1']], first.livequery_owner_ids)
+        self.assertEqual(['case-group1', 'case-location1', 'case-user1'], first_case_ids)
+
+        second, second_case_ids = self._restore('user2', ['group1', 'location1'])
+        # only the user's own cases are generated
+        self.assertEqual([['user2']], second.livequery_owner_ids)
+        self.assertEqual(['case-group1', 'case-location1', 'case-user2'], second_case_ids)
+        self.assertEqual(
+            {'case-group1', 'case-location1', 'case-user2'},
+            second.current_sync_log.case_ids_on_phone,
+        )
+
+    def test_user_without_shared_owners(self):
+        restore_state, case_ids = self._restore('user1', [])
+        self.assertEqual([['user1']], restore_state.livequery_owner_ids)
+        self.assertEqual(['case-user1'], case_ids)
+        self.assertEqual({}, self.snapshot_names)
@@ -0,0 +1,72 @@
+import uuid
+
+from django.test import SimpleTestCase
+
+from casexml.apps.phone.models import SimplifiedSyncLog
+from casexml.apps.phone.synclog_encoding import (
+    decode_case_state,
+    encode_case_state,
+)
+
+
+class SyncLogEncodingTest(SimpleTestCase):
+
+    def _get_doc(self):
+        dashed = [str(uuid.uuid4()) for i in range(10)]
+        hexed = [uuid.uuid4().hex for i in range(5)]
+        others = ['case-1', 'CASE-2', dashed[0].upper(), ' ' + hexed[0]]
+        return SimplifiedSyncLog(
+            domain='test-domain',
+            user_id='user',
+            owner_ids_on_phone={'owner'},
+            case_ids_on_phone=set(dashed + hexed + others),
+            dependent_case_ids_on_phone={dashed[1], others[0]},
+            closed_cases={hexed[1]},
+            index_tree={'indices': {
+                dashed[2]: {'parent': dashed[3], 'grandparent': hexed[2]},
+                others[1]: {'parent': 'not-on-phone'},
+                hexed[3]: {},
+            }},
+            extension_index_tree={'indices': {
+                others[2]: {'host': dashed[4]},
+            }},
+        ).to_json()
+
+    def _normalize(self, doc):
+        return {
+            key: sorted(value) if isinstance(value, list) else value
+            for key, value in doc.items()
+        }
+
+    def test_round_trip(self):
+        doc = self._get_doc()
+        compact_doc, case_state = encode_case_state(doc)
+        self.assertIsInstance(case_state, bytes)
+        self.assertNotIn('case_ids_on_phone', compact_doc)
+        self.assertNotIn('indices', compact_doc['index_tree'])
+        self.assertEqual(doc['owner_ids_on_phone'], compact_doc['owner_ids_on_phone'])
+        self.assertEqual(self._normalize(doc), self._normalize(decode_case_state(compact_doc, case_state)))
+
+    def test_wrap(self):
+        doc = self._get_doc()
+        synclog = SimplifiedSyncLog.wrap(decode_case_state(*encode_case_state(doc)))
+        self.assertEqual(set(doc['case_ids_on_phone']), synclog.case_ids_on_phone)
+        self.assertEqual(doc['index_tree']['indices'], synclog.index_tree.indices)
+
+    def test_memoryview(self):
+        # BinaryField values are loaded from postgres as memoryview
+        compact_doc, case_state = encode_case_state(self._get_doc())
+        self.assertEqual(
+            decode_case_state(compact_doc, case_state),
+            decode_case_state(compact_doc, memoryview(case_state)),
+        )
+
+    def test_empty(self):
+        doc = SimplifiedSyncLog(domain='test-domain').to_json()
+        compact_doc, case_state = encode_case_state(doc)
+        self.assertEqual(self._normalize(doc), self._normalize(decode_case_state(compact_doc, case_state)))
+
+    def test_not_encodable(self):
+        doc = self._get_doc()
+        doc['case_ids_on_phone'].append(1)
+        self.assertEqual((doc, None), encode_case_state(doc))
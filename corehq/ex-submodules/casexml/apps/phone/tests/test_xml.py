@@ -1,10 +1,19 @@
 import datetime
 import os.path
+from django.core.cache.backends.locmem import LocMemCache
 from django.test import SimpleTestCase
 
+from mock import patch
+
 import casexml.apps.phone.xml as xml
+from casexml.apps.case import const
 from casexml.apps.case.models import CommCareCase
 from casexml.apps.case.sharedmodels import CommCareCaseIndex
+from casexml.apps.case.xml import V1, V2
+from casexml.apps.phone.data_providers.case.utils import (
+    CaseSyncUpdate,
+    get_cached_case_xml,
+)
 
 from corehq.apps.app_manager.tests.util import TestXmlMixin
 
@@ -38,3 +47,43 @@ class TestCaseDBElement(TestXmlMixin, SimpleTestCase):
     def test_generate_xml(self):
         casedb_xml = xml.tostring(xml.get_casedb_element(self.case))
         self.assertXmlEqual(casedb_xml, self.get_xml('case_db_block'))
+
+
+class TestCachedCaseXML(SimpleTestCase):
+
+    def setUp(self):
+        cache_patch = patch('casexml.apps.phone.data_providers.case.utils.cache', LocMemCache('case-xml', {}))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.case = CommCareCase(
+            _id='case-id',
+            domain='winterfell',
+            type='priestess',
+            name='melisandre',
+            owner_id='lordoflight',
+            server_modified_on=datetime.datetime(2016, 5, 31),
+        )
+
+    def _get_xml(self, updates=(const.CASE_ACTION_CREATE, const.CASE_ACTION_UPDATE), version=V2):
+        return get_cached_case_xml([CaseSyncUpdate(self.case, None, list(updates))], version)
+
+    def test_cached_until_modified(self):
+        expected = xml.get_case_xml(self.case, [const.CASE_ACTION_CREATE, const.CASE_ACTION_UPDATE], V2)
+        with patch('casexml.apps.phone.data_providers.case.utils.get_case_xml',
+                   wraps=xml.get_case_xml) as get_case_xml:
+            self.assertEqual([expected], self._get_xml())
+            self.assertEqual([expected], self._get_xml())
+            self.assertEqual(1, get_case_xml.call_count)
+
+            self.case.name = 'the red woman'
+            self.case.server_modified_on = datetime.datetime(2016, 6, 1)
+            self.assertIn(b'the red woman', self._get_xml()[0])
+            self.assertEqual(2, get_case_xml.call_count)
+
+    def test_keyed_by_updates_and_version(self):
+        with patch('casexml.apps.phone.data_providers.case.utils.get_case_xml',
+                   wraps=xml.get_case_xml) as get_case_xml:
+            self._get_xml()
+            self._get_xml(updates=[const.CASE_ACTION_UPDATE])
+            self._get_xml(version=V1)
+            self.assertEqual(3, get_case_xml.call_count)
@@ -7,8 +7,15 @@ from couchexport.models import Format
 from couchexport import writers
 
 
-def get_writer(format, use_formatted_cells=False):
+def get_writer(format, use_formatted_cells=False, streaming=False):
+    """
+    :param streaming: Write XLS_2007 files with StreamingExcel2007ExportWriter,
+        for exports that only write rows. Callers that use the openpyxl workbook
+        (`writer.book`) need the default Excel2007ExportWriter.
+    """
     if format == Format.XLS_2007:
+        if streaming:
+            return writers.StreamingExcel2007ExportWriter(use_formatted_cells=use_formatted_cells)
         return writers.Excel2007ExportWriter(use_formatted_cells=use_formatted_cells)
     try:
         return {
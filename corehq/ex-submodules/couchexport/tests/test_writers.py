@@ -1,18 +1,22 @@
 from codecs import BOM_UTF8
 from contextlib import closing
+import datetime
 import io
 import os
 
 from django.test import SimpleTestCase
 from lxml import html, etree
 from mock import patch, Mock
+import openpyxl
 
-from couchexport.export import export_from_tables
+from couchexport.export import FormattedRow, export_from_tables, get_writer
 from couchexport.models import Format
 from couchexport.writers import (
     MAX_XLS_COLUMNS,
     CsvFileWriter,
+    Excel2007ExportWriter,
     PythonDictWriter,
+    StreamingExcel2007ExportWriter,
     XlsLengthException,
     ZippedExportWriter,
 )
@@ -121,6 +125,60 @@ class Excel2007ExportWriterTests(SimpleTestCase):
         export_from_tables(tables, file_, format_)
 
 
+class StreamingExcel2007ExportWriterTests(SimpleTestCase):
+    rows = [
+        ['text', 'b & <c>', 'ünï', 'bad\x01char'],
+        FormattedRow(
+            ['1', 2.5, 'http://example.com/a?b=1&c=2', datetime.datetime(2019, 11, 1, 10, 30)],
+            hyperlink_column_indices=[2],
+        ),
+        FormattedRow([True, None, '', datetime.date(2019, 1, 2)], skip_excel_formatting=[0]),
+        ['2019-11-01T10:30:00.000000Z', '---', 12, '50%'],
+    ]
+
+    def _get_cells(self, writer):
+        file_ = io.BytesIO()
+        writer.open([('table', [['h1', 'h2', 'h3', 'h4']]), ('other', [['h1']])], file_, table_titles={
+            'table': 'Table & 1',
+        })
+        for row in self.rows:
+            writer.write_row('table', row)
+        writer.write_row('other', ['value'])
+        writer.close()
+        file_.seek(0)
+        workbook = openpyxl.load_workbook(file_)
+        return [
+            (worksheet.title, [
+                [
+                    (cell.value, cell.number_format, cell.hyperlink.target if cell.hyperlink else None)
+                    for cell in row
+                ]
+                for row in worksheet.iter_rows()
+            ])
+            for worksheet in workbook.worksheets
+        ]
+
+    def test_same_as_openpyxl(self):
+        for options in [{}, {'use_formatted_cells': True}, {'format_as_text': True}]:
+            self.assertEqual(
+                self._get_cells(StreamingExcel2007ExportWriter(**options)),
+                self._get_cells(Excel2007ExportWriter(**options)),
+                options,
+            )
+
+    def test_workbook_properties(self):
+        file_ = io.BytesIO()
+        writer = StreamingExcel2007ExportWriter()
+        writer.open([('table', [['h1']])], file_)
+        writer.close()
+        file_.seek(0)
+        self.assertIsNotNone(openpyxl.load_workbook(file_).properties.created)
+
+    def test_get_writer(self):
+        self.assertIsInstance(get_writer(Format.XLS_2007), Excel2007ExportWriter)
+        self.assertIsInstance(get_writer(Format.XLS_2007, streaming=True), StreamingExcel2007ExportWriter)
+
+
 class Excel2003ExportWriterTests(SimpleTestCase):
 
     def test_data_length(self):
@@ -1,14 +1,18 @@
 import io
 from base64 import b64decode
 from codecs import BOM_UTF8
+import datetime
+import math
 import os
 import re
+import shutil
 import tempfile
 import zipfile
 import csv
 import json
 import bz2
 from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
 import openpyxl
 
 from django.template.loader import render_to_string, get_template
@@ -18,6 +22,7 @@ import xlwt
 from couchexport.models import Format
 from openpyxl.styles import numbers
 from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 
 from couchexport.util import get_excel_format_value, get_legacy_excel_safe_value
 
@@ -416,6 +421,344 @@ class Excel2007ExportWriter(ExportWriter):
         self.book.save(self.file)
 
 
+class StreamingExcel2007ExportWriter(ExportWriter):
+    """
+    Writes the same workbooks as Excel2007ExportWriter, but writes the XML of
+    each sheet as its rows are written, rather than through openpyxl objects,
+    so memory use doesn't grow with the number of rows. Strings are written
+    inline rather than to a shared strings table.
+
+    Each sheet is written to a temporary file, because the rows of different
+    sheets are interleaved, and the sheets are copied into the workbook's zip
+    file when the writer is closed.
+    """
+    format = Format.XLS_2007
+    max_table_name_size = 31
+
+    def __init__(self, format_as_text=False, use_formatted_cells=False):
+        super(StreamingExcel2007ExportWriter, self).__init__()
+        self.format_as_text = format_as_text
+        self.use_formatted_cells = use_formatted_cells
+
+    def _init(self):
+        self.tables = OrderedDict()
+        self.styles = XlsxStyles()
+        self.text_style = self.styles.get_style_index(numbers.FORMAT_TEXT)
+        self.hyperlink_style = self.styles.get_style_index(numbers.FORMAT_GENERAL, hyperlink=True)
+
+    def _init_table(self, table_index, table_title):
+        self.tables[table_index] = XlsxSheetWriter(table_title)
+
+    def _write_row(self, sheet_index, row):
+        from couchexport.export import FormattedRow
+        sheet = self.tables[sheet_index]
+        is_formatted_row = isinstance(row, FormattedRow)
+
+        cells = []
+        for col_ind, val in enumerate(row):
+            skip_formatting_on_row = is_formatted_row and col_ind in row.skip_excel_formatting
+            if (self.use_formatted_cells
+                    and not skip_formatting_on_row
+                    and not self.format_as_text):
+                excel_format, val = get_excel_format_value(val)
+                style = self.styles.get_style_index(excel_format)
+            else:
+                val = get_legacy_excel_safe_value(val)
+                style = self.text_style if self.format_as_text else 0
+            cells.append((val, style))
+
+        if is_formatted_row:
+            for hyperlink_column_index in row.hyperlink_column_indices:
+                val = cells[hyperlink_column_index][0]
+                # like openpyxl's Hyperlink style, which has the General number format
+                cells[hyperlink_column_index] = (val, self.hyperlink_style)
+                sheet.add_hyperlink(hyperlink_column_index, val)
+
+        sheet.write_row(cells)
+
+    def _close(self):
+        with zipfile.ZipFile(self.file, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+            sheets = list(self.tables.values())
+            archive.writestr('[Content_Types].xml', _get_xlsx_content_types(len(sheets)))
+            archive.writestr('_rels/.rels', _XLSX_RELS)
+            archive.writestr('docProps/core.xml', _get_xlsx_core_properties(datetime.datetime.utcnow()))
+            archive.writestr('xl/workbook.xml', _get_xlsx_workbook(sheets))
+            archive.writestr('xl/_rels/workbook.xml.rels', _get_xlsx_workbook_rels(len(sheets)))
+            archive.writestr('xl/styles.xml', self.styles.get_xml())
+            for number, sheet in enumerate(sheets, start=1):
+                sheet.write_to_archive(archive, number)
+                sheet.close()
+
+
+_XLSX_MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_XLSX_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/{}'
+_XLSX_XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_XLSX_RELS = (
+    _XLSX_XML_DECLARATION
+    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    + '<Relationship Id="rId1" Type="{}" Target="xl/workbook.xml"/>'.format(
+        _XLSX_REL_TYPE.format('officeDocument'))
+    + '<Relationship Id="rId2" '
+    + 'Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" '
+    + 'Target="docProps/core.xml"/>'
+    + '</Relationships>'
+)
+# characters that aren't allowed in XML 1.0
+_xml_illegal_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+# the day before Excel's first date, since it treats 1900 as a leap year
+_EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+def _get_xlsx_content_types(num_sheets):
+    sheet_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml'
+    return (
+        _XLSX_XML_DECLARATION
+        + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        + '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        + '<Default Extension="xml" ContentType="application/xml"/>'
+        + '<Override PartName="/docProps/core.xml" '
+        + 'ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+        + '<Override PartName="/xl/workbook.xml" '
+        + 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + '<Override PartName="/xl/styles.xml" '
+        + 'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + ''.join(
+            '<Override PartName="/xl/worksheets/sheet{}.xml" ContentType="{}"/>'.format(number, sheet_type)
+            for number in range(1, num_sheets + 1)
+        )
+        + '</Types>'
+    )
+
+
+def _get_xlsx_core_properties(created):
+    timestamp = created.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return (
+        _XLSX_XML_DECLARATION
+        + '<cp:coreProperties '
+        + 'xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+        + 'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+        + 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+        + '<dcterms:created xsi:type="dcterms:W3CDTF">{}</dcterms:created>'.format(timestamp)
+        + '<dcterms:modified xsi:type="dcterms:W3CDTF">{}</dcterms:modified>'.format(timestamp)
+        + '</cp:coreProperties>'
+    )
+
+
+def _get_xlsx_workbook(sheets):
+    return (
+        _XLSX_XML_DECLARATION
+        + '<workbook xmlns="{}" xmlns:r="{}"><sheets>'.format(_XLSX_MAIN_NS, _XLSX_REL_NS)
+        + ''.join(
+            '<sheet name={} sheetId="{}" r:id="rId{}"/>'.format(quoteattr(sheet.title), number, number)
+            for number, sheet in enumerate(sheets, start=1)
+        )
+        + '</sheets></workbook>'
+    )
+
+
+def _get_xlsx_workbook_rels(num_sheets):
+    return (
+        _XLSX_XML_DECLARATION
+        + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + ''.join(
+            '<Relationship Id="rId{0}" Type="{1}" Target="worksheets/sheet{0}.xml"/>'.format(
+                number, _XLSX_REL_TYPE.format('worksheet'))
+            for number in range(1, num_sheets + 1)
+        )
+        + '<Relationship Id="rId{}" Type="{}" Target="styles.xml"/>'.format(
+            num_sheets + 1, _XLSX_REL_TYPE.format('styles'))
+        + '</Relationships>'
+    )
+
+
+class XlsxStyles(object):
+    """
+    The cell styles of a workbook written by StreamingExcel2007ExportWriter:
+    a number format, and whether the cell is a hyperlink
+    """
+
+    def __init__(self):
+        self.styles = [(numbers.FORMAT_GENERAL, False)]
+        self.style_indices = {self.styles[0]: 0}
+        self.custom_formats = OrderedDict()
+
+    def get_style_index(self, number_format, hyperlink=False):
+        key = (number_format, hyperlink)
+        try:
+            return self.style_indices[key]
+        except KeyError:
+            self.style_indices[key] = len(self.styles)
+            self.styles.append(key)
+            if (number_format not in numbers.BUILTIN_FORMATS_REVERSE
+                    and number_format not in self.custom_formats):
+                # ids below 164 are reserved for built in formats
+                self.custom_formats[number_format] = 164 + len(self.custom_formats)
+            return self.style_indices[key]
+
+    def _get_format_id(self, number_format):
+        if number_format in numbers.BUILTIN_FORMATS_REVERSE:
+            return numbers.BUILTIN_FORMATS_REVERSE[number_format]
+        return self.custom_formats[number_format]
+
+    def get_xml(self):
+        num_fmts = ''.join(
+            '<numFmt numFmtId="{}" formatCode={}/>'.format(format_id, quoteattr(number_format))
+            for number_format, format_id in self.custom_formats.items()
+        )
+        xfs = ''.join(
+            '<xf numFmtId="{}" fontId="{}" fillId="0" borderId="0" xfId="{}"{}{}/>'.format(
+                self._get_format_id(number_format),
+                1 if hyperlink else 0,
+                1 if hyperlink else 0,
+                ' applyNumberFormat="1"' if number_format != numbers.FORMAT_GENERAL else '',
+                ' applyFont="1"' if hyperlink else '',
+            )
+            for number_format, hyperlink in self.styles
+        )
+        return (
+            _XLSX_XML_DECLARATION
+            + '<styleSheet xmlns="{}">'.format(_XLSX_MAIN_NS)
+            + ('<numFmts count="{}">{}</numFmts>'.format(len(self.custom_formats), num_fmts)
+               if self.custom_formats else '')
+            + '<fonts count="2">'
+            + '<font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+            + '<font><u/><sz val="11"/><color rgb="FF0563C1"/><name val="Calibri"/><family val="2"/></font>'
+            + '</fonts>'
+            + '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            + '<fill><patternFill patternType="gray125"/></fill></fills>'
+            + '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            + '<cellStyleXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'
+            + '<xf numFmtId="0" fontId="1" fillId="0" borderId="0"/></cellStyleXfs>'
+            + '<cellXfs count="{}">{}</cellXfs>'.format(len(self.styles), xfs)
+            + '<cellStyles count="2"><cellStyle name="Normal" xfId="0" builtinId="0"/>'
+            + '<cellStyle name="Hyperlink" xfId="1" builtinId="8"/></cellStyles>'
+            + '</styleSheet>'
+        )
+
+
+class XlsxSheetWriter(object):
+    """
+    Writes the XML of a worksheet to a temporary file, a row at a time
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.file = tempfile.TemporaryFile('w+b')
+        self.row_number = 0
+        self.column_letters = []
+        # hyperlinks are written to their own temporary files, since they
+        # come after the sheet data in the sheet, and in its relationships
+        self.hyperlinks_file = None
+        self.hyperlink_rels_file = None
+        self.num_hyperlinks = 0
+
+    def write_row(self, cells):
+        """
+        :param cells: list of ``(value, style index)`` tuples
+        """
+        self.row_number += 1
+        row_number = str(self.row_number)
+        if len(cells) > len(self.column_letters):
+            self.column_letters.extend(
+                get_column_letter(index + 1) for index in range(len(self.column_letters), len(cells))
+            )
+        parts = ['<row r="', row_number, '">']
+        for letter, (value, style) in zip(self.column_letters, cells):
+            if value is None or value == '':
+                if style:
+                    parts.extend(('<c r="', letter, row_number, '" s="', str(style), '"/>'))
+                continue
+            parts.extend(('<c r="', letter, row_number))
+            if style:
+                parts.extend(('" s="', str(style)))
+            parts.append(_get_cell_xml(value))
+        parts.append('</row>')
+        self.file.write(''.join(parts).encode('utf-8'))
+
+    def add_hyperlink(self, column_index, url):
+        if not url or not isinstance(url, str):
+            return
+        if self.hyperlinks_file is None:
+            self.hyperlinks_file = tempfile.TemporaryFile('w+b')
+            self.hyperlink_rels_file = tempfile.TemporaryFile('w+b')
+        self.num_hyperlinks += 1
+        ref = '{}{}'.format(get_column_letter(column_index + 1), self.row_number + 1)
+        self.hyperlinks_file.write('<hyperlink ref="{}" r:id="rId{}"/>'.format(
+            ref, self.num_hyperlinks
+        ).encode('utf-8'))
+        self.hyperlink_rels_file.write(
+            '<Relationship Id="rId{}" Type="{}" Target={} TargetMode="External"/>'.format(
+                self.num_hyperlinks, _XLSX_REL_TYPE.format('hyperlink'), quoteattr(_clean_xml_text(url))
+            ).encode('utf-8')
+        )
+
+    def write_to_archive(self, archive, number):
+        with archive.open('xl/worksheets/sheet{}.xml'.format(number), 'w', force_zip64=True) as sheet:
+            sheet.write((
+                _XLSX_XML_DECLARATION
+                + '<worksheet xmlns="{}" xmlns:r="{}"><sheetData>'.format(_XLSX_MAIN_NS, _XLSX_REL_NS)
+            ).encode('utf-8'))
+            self.file.seek(0)
+            shutil.copyfileobj(self.file, sheet)
+            sheet.write(b'</sheetData>')
+            if self.hyperlinks_file is not None:
+                sheet.write(b'<hyperlinks>')
+                self.hyperlinks_file.seek(0)
+                shutil.copyfileobj(self.hyperlinks_file, sheet)
+                sheet.write(b'</hyperlinks>')
+            sheet.write(b'</worksheet>')
+
+        if self.hyperlinks_file is not None:
+            with archive.open('xl/worksheets/_rels/sheet{}.xml.rels'.format(number), 'w') as rels:
+                rels.write((
+                    _XLSX_XML_DECLARATION
+                    + '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                ).encode('utf-8'))
+                self.hyperlink_rels_file.seek(0)
+                shutil.copyfileobj(self.hyperlink_rels_file, rels)
+                rels.write(b'</Relationships>')
+
+    def close(self):
+        self.file.close()
+        if self.hyperlinks_file is not None:
+            self.hyperlinks_file.close()
+            self.hyperlink_rels_file.close()
+
+
+def _get_cell_xml(value):
+    """
+    :returns: The end of the opening tag of a cell with the given value, and
+        the rest of the cell
+    """
+    if isinstance(value, bool):
+        return '" t="b"><v>{}</v></c>'.format(int(value))
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        return '"><v>{}</v></c>'.format(repr(value))
+    if isinstance(value, datetime.datetime):
+        value = value.replace(tzinfo=None) - _EXCEL_EPOCH
+        return '"><v>{}</v></c>'.format(_get_excel_serial(value.days, value.seconds, value.microseconds))
+    if isinstance(value, datetime.date):
+        return '"><v>{}</v></c>'.format(_get_excel_serial((value - _EXCEL_EPOCH.date()).days))
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return '" t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'.format(
+        escape(_clean_xml_text(str(value)))
+    )
+
+
+def _get_excel_serial(days, seconds=0, microseconds=0):
+    if days < 61:
+        # dates before 1 March 1900 are a day earlier, because 29 February 1900 doesn't exist
+        days -= 1
+    serial = days + (seconds + microseconds / 1000000) / 86400
+    return repr(serial) if seconds or microseconds else str(days)
+
+
+def _clean_xml_text(value):
+    return _xml_illegal_chars.sub('', value)
+
+
 class Excel2003ExportWriter(ExportWriter):
     format = Format.XLS
     max_table_name_size = 31
@@ -2,3 +2,10 @@
 CHECKPOINT_FREQUENCY = 100
 CHECKPOINT_MIN_WAIT = 300
 DEFAULT_PROCESSOR_CHUNK_SIZE = 10
+
+# longest time a change waits in a pillow's chunk before the chunk is processed
+CHUNK_MAX_WAIT_SECONDS = 5
+# adaptive chunk sizes are reduced if processing a chunk takes longer than this
+CHUNK_TARGET_SECONDS = 10
+# adaptive chunk sizes are increased if changes are this far behind when processed
+CHUNK_BACKLOG_SECONDS = 30
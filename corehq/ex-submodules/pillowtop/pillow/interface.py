@@ -1,5 +1,6 @@
 from abc import ABCMeta, abstractproperty, abstractmethod
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from django.conf import settings
@@ -13,9 +14,14 @@ from corehq.util.datadog.gauges import datadog_counter, datadog_gauge, datadog_h
 from corehq.util.timer import TimingContext
 from dimagi.utils.logging import notify_exception
 from kafka.common import TopicPartition
-from pillowtop.const import CHECKPOINT_MIN_WAIT
+from pillowtop.const import (
+    CHECKPOINT_MIN_WAIT,
+    CHUNK_BACKLOG_SECONDS,
+    CHUNK_MAX_WAIT_SECONDS,
+    CHUNK_TARGET_SECONDS,
+)
 from pillowtop.dao.exceptions import DocumentMissingError
-from pillowtop.utils import force_seq_int
+from pillowtop.utils import force_seq_int, prefetch_changes_docs
 from pillowtop.exceptions import PillowtopCheckpointReset
 from pillowtop.logger import pillow_logging
 
@@ -38,11 +44,129 @@ class PillowRuntimeContext(object):
 
     def __init__(self, changes_seen=0):
         self.changes_seen = changes_seen
+        # offsets to checkpoint, if not the change feed's current offsets
+        self.processed_offsets = None
 
     def reset(self):
         self.changes_seen = 0
 
 
+class ChunkController(object):
+    """
+    Decides when a pillow processes the changes it has queued for its batch processors:
+    when the chunk is full or its oldest change has waited ``max_wait_seconds``.
+
+    If ``max_chunk_size`` is greater than ``chunk_size`` the chunk size is adapted
+    after each chunk, from the time it took to process and how far behind the feed
+    the pillow is (the time since its newest change was published):
+
+    - if processing took longer than ``target_seconds`` it is reduced so that the next
+      chunk should take about ``target_seconds``
+    - if the chunk was full and the pillow is more than ``backlog_seconds`` behind it is
+      doubled, up to ``max_chunk_size``
+    - if the chunk wasn't full the pillow is keeping up, so it returns to ``chunk_size``
+    """
+
+    def __init__(self, chunk_size, max_chunk_size=0, max_wait_seconds=CHUNK_MAX_WAIT_SECONDS,
+                 target_seconds=CHUNK_TARGET_SECONDS, backlog_seconds=CHUNK_BACKLOG_SECONDS):
+        self.initial_chunk_size = chunk_size
+        self.max_chunk_size = max(chunk_size, max_chunk_size)
+        self.max_wait_seconds = max_wait_seconds
+        self.target_seconds = target_seconds
+        self.backlog_seconds = backlog_seconds
+        self.chunk_size = chunk_size
+
+    @property
+    def adaptive(self):
+        return self.max_chunk_size > self.initial_chunk_size
+
+    def is_full(self, changes_chunk):
+        return len(changes_chunk) >= self.chunk_size
+
+    def should_process(self, changes_chunk, chunk_started):
+        if not changes_chunk:
+            return False
+        if self.is_full(changes_chunk):
+            return True
+        return (datetime.utcnow() - chunk_started).total_seconds() >= self.max_wait_seconds
+
+    def chunk_processed(self, changes_chunk, processing_time):
+        """Adapt the chunk size after processing ``changes_chunk``
+
+        :returns: the reason for the new chunk size, or None if it is unchanged
+        """
+        if not self.adaptive or not changes_chunk:
+            return None
+
+        reason = None
+        chunk_size = self.chunk_size
+        if processing_time > self.target_seconds:
+            per_change = processing_time / len(changes_chunk)
+            chunk_size = min(chunk_size, int(self.target_seconds / per_change))
+            reason = 'slow'
+        elif self.is_full(changes_chunk):
+            publish_timestamp = changes_chunk[-1].metadata.publish_timestamp
+            if (datetime.utcnow() - publish_timestamp).total_seconds() > self.backlog_seconds:
+                chunk_size = chunk_size * 2
+                reason = 'backlog'
+        else:
+            chunk_size = self.initial_chunk_size
+            reason = 'caught_up'
+
+        chunk_size = max(1, min(chunk_size, self.max_chunk_size))
+        if chunk_size == self.chunk_size:
+            return None
+        self.chunk_size = chunk_size
+        return reason
+
+
+class ChunkPipeline(object):
+    """
+    Processes a pillow's chunks of changes in the order they are read from the feed,
+    while the documents for up to ``depth`` later chunks are fetched in a background
+    thread, so that reading from the feed, fetching documents and processing
+    (transforming and loading) overlap.
+
+    The checkpoint is only updated to the feed offsets at the end of a chunk once
+    the chunk has been processed.
+    """
+
+    def __init__(self, pillow, context, chunk_controller, depth):
+        self.pillow = pillow
+        self.context = context
+        self.chunk_controller = chunk_controller
+        self.depth = depth
+        self.pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, changes_chunk):
+        processed_offsets = self.pillow.get_change_feed().get_processed_offsets()
+        future = self._executor.submit(prefetch_changes_docs, changes_chunk)
+        self.pending.append((changes_chunk, processed_offsets, future))
+        while len(self.pending) > self.depth:
+            self._process_next()
+
+    def drain(self):
+        while self.pending:
+            self._process_next()
+
+    def close(self):
+        self._executor.shutdown()
+
+    def _process_next(self):
+        changes_chunk, processed_offsets, future = self.pending.popleft()
+        try:
+            future.result()
+        except Exception:
+            # the processors will fetch the documents themselves
+            notify_exception(None, "{} Error prefetching documents".format(self.pillow.get_name()))
+        self.context.processed_offsets = processed_offsets
+        try:
+            self.pillow._process_chunk(changes_chunk, self.context, self.chunk_controller)
+        finally:
+            self.context.processed_offsets = None
+
+
 class PillowBase(metaclass=ABCMeta):
     """
     This defines the external pillowtop API. Everything else should be considered a specialization
@@ -53,6 +177,10 @@ class PillowBase(metaclass=ABCMeta):
     retry_errors = True
     # this will be the batch size for processors that support batch processing
     processor_chunk_size = 0
+    # if greater than processor_chunk_size, the batch size is adapted up to this size
+    max_processor_chunk_size = 0
+    # number of chunks whose documents are fetched ahead of processing (see ChunkPipeline)
+    prefetch_chunks = 0
 
     @abstractproperty
     def pillow_id(self):
@@ -138,19 +266,31 @@ class PillowBase(metaclass=ABCMeta):
             Processes changes serially on serial processors, and in batches on
             batch processors. If there are batch processors, checkpoint is updated
             at the end of the batch, otherwise is updated for every change.
+
+            Batches are processed when they are full, or when their oldest change
+            has waited long enough (see ``ChunkController``).
         """
         context = PillowRuntimeContext(changes_seen=0)
-        min_wait_seconds = 30
+        chunk_controller = self.chunk_controller
+        pipeline = None
+        if self.batch_processors and self.prefetch_chunks:
+            pipeline = ChunkPipeline(self, context, chunk_controller, self.prefetch_chunks)
+
+        def process_chunk(chunk):
+            if pipeline:
+                pipeline.submit(chunk)
+            else:
+                self._process_chunk(chunk, context, chunk_controller)
 
         def process_offset_chunk(chunk, context):
-            if not chunk:
-                return
-            self._batch_process_with_error_handling(chunk)
-            self._update_checkpoint(chunk[-1], context)
+            if chunk:
+                process_chunk(chunk)
+            if pipeline:
+                pipeline.drain()
 
         # keep track of chunk for batch processors
         changes_chunk = []
-        last_process_time = datetime.utcnow()
+        chunk_started = None
 
         try:
             for change in self.get_change_feed().iter_changes(since=since or None, forever=forever):
@@ -159,27 +299,51 @@ class PillowBase(metaclass=ABCMeta):
                     if self.batch_processors:
                         # Queue and process in chunks for both batch
                         #   and serial processors
+                        if not changes_chunk:
+                            chunk_started = datetime.utcnow()
                         changes_chunk.append(change)
-                        chunk_full = len(changes_chunk) == self.processor_chunk_size
-                        time_elapsed = (datetime.utcnow() - last_process_time).seconds > min_wait_seconds
-                        if chunk_full or time_elapsed:
-                            last_process_time = datetime.utcnow()
-                            self._batch_process_with_error_handling(changes_chunk)
-                            # update checkpoint for just the latest change
-                            self._update_checkpoint(changes_chunk[-1], context)
-                            # reset for next chunk
-                            changes_chunk = []
                     else:
                         # process all changes one by one
                         processing_time = self.process_with_error_handling(change)
                         self._record_change_in_datadog(change, processing_time)
                         self._update_checkpoint(change, context)
                 else:
+                    # the feed is idle
+                    if pipeline:
+                        pipeline.drain()
                     self._update_checkpoint(None, None)
+                if chunk_controller.should_process(changes_chunk, chunk_started):
+                    process_chunk(changes_chunk)
+                    # reset for next chunk
+                    changes_chunk = []
             process_offset_chunk(changes_chunk, context)
         except PillowtopCheckpointReset:
             process_offset_chunk(changes_chunk, context)
             self.process_changes(since=self.get_last_checkpoint_sequence(), forever=forever)
+        finally:
+            if pipeline:
+                pipeline.close()
+
+    @property
+    def chunk_controller(self):
+        return ChunkController(self.processor_chunk_size, self.max_processor_chunk_size)
+
+    def _process_chunk(self, changes_chunk, context, chunk_controller):
+        full = chunk_controller.is_full(changes_chunk)
+        with TimingContext() as timer:
+            self._batch_process_with_error_handling(changes_chunk)
+        # update checkpoint for just the latest change
+        self._update_checkpoint(changes_chunk[-1], context)
+
+        tags = ['pillow_name:{}'.format(self.get_name())]
+        datadog_counter('commcare.change_feed.chunked.flush', tags=tags + [
+            'reason:{}'.format('full' if full else 'timeout'),
+        ])
+        reason = chunk_controller.chunk_processed(changes_chunk, timer.duration)
+        if reason:
+            datadog_counter('commcare.change_feed.chunked.resize', tags=tags + ['reason:{}'.format(reason)])
+        if chunk_controller.adaptive:
+            datadog_gauge('commcare.change_feed.chunked.chunk_size', chunk_controller.chunk_size, tags=tags)
 
     def _batch_process_with_error_handling(self, changes_chunk):
         """
@@ -402,7 +566,7 @@ class ChangeEventHandler(metaclass=ABCMeta):
         pass
 
     @abstractmethod
-    def get_new_seq(self, change):
+    def get_new_seq(self, change, context=None):
         """
         :return: appropriate sequence value to update the checkpoint to
         """
@@ -416,11 +580,14 @@ class ConstructedPillow(PillowBase):
     """
 
     def __init__(self, name, checkpoint, change_feed, processor,
-                 change_processed_event_handler=None, processor_chunk_size=0):
+                 change_processed_event_handler=None, processor_chunk_size=0, max_processor_chunk_size=0,
+                 prefetch_chunks=0):
         self._name = name
         self._checkpoint = checkpoint
         self._change_feed = change_feed
         self.processor_chunk_size = processor_chunk_size
+        self.max_processor_chunk_size = max_processor_chunk_size
+        self.prefetch_chunks = prefetch_chunks
         if isinstance(processor, list):
             self.processors = processor
         else:
@@ -125,15 +125,19 @@ class BulkElasticProcessor(ElasticProcessor, BulkPillowProcessor):
     """
 
     def process_changes_chunk(self, changes_chunk):
+        # deleted changes are sent as blind deletes, so their documents don't need to be fetched
+        deleted_changes = [change for change in changes_chunk if change.deleted and change.id]
+        changes_chunk = [change for change in changes_chunk if not (change.deleted and change.id)]
         with self._datadog_timing('bulk_extract'):
             bad_changes, docs = bulk_fetch_changes_docs(changes_chunk)
 
         with self._datadog_timing('bulk_transform'):
-            changes_to_process = {
+            changes_to_process = {change.id: change for change in deleted_changes}
+            changes_to_process.update({
                 change.id: change
                 for change in changes_chunk
                 if change.document and not self.doc_filter_fn(change.document)
-            }
+            })
             retry_changes = list(bad_changes)
 
             error_collector = ErrorCollector()
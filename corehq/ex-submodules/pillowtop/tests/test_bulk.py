@@ -1,4 +1,5 @@
 import uuid
+from datetime import datetime, timedelta
 
 from django.test import SimpleTestCase, TestCase
 
@@ -9,10 +10,19 @@ from casexml.apps.case.signals import case_post_save
 from corehq.util.es.interface import ElasticsearchInterface
 from pillowtop.es_utils import initialize_index_and_mapping
 from pillowtop.feed.interface import Change, ChangeMeta
-from pillowtop.pillow.interface import PillowBase
+from pillowtop.pillow.interface import (
+    ChunkController,
+    ChunkPipeline,
+    PillowBase,
+    PillowRuntimeContext,
+)
 from pillowtop.processors.elastic import BulkElasticProcessor
 from pillowtop.tests.utils import TEST_INDEX_INFO
-from pillowtop.utils import bulk_fetch_changes_docs, get_errors_with_ids
+from pillowtop.utils import (
+    bulk_fetch_changes_docs,
+    get_errors_with_ids,
+    prefetch_changes_docs,
+)
 
 from corehq.elastic import get_es_new
 from corehq.form_processor.document_stores import CaseDocumentStore
@@ -51,6 +61,144 @@ class BulkTest(SimpleTestCase):
         ])
         self.assertEqual([(1, 'e1'), (2, 'e2')], errors)
 
+    def test_get_errors_with_ids_ignores_missing_deletes(self):
+        errors = get_errors_with_ids([
+            {'delete': {'_id': 1, 'status': 404, 'found': False}},
+            {'delete': {'_id': 2, 'status': 500, 'error': 'e2'}}
+        ])
+        self.assertEqual([(2, 'e2')], errors)
+
+    def test_process_changes_chunk_deletes_without_fetching(self):
+        document_store = Mock()
+        document_store.iter_documents.return_value = [{'_id': '1', 'doc_type': 'CommCareCase'}]
+        changes = [
+            Change('1', 1, document_store=document_store, metadata=ChangeMeta(
+                document_id='1', data_source_type='couch', data_source_name='test')),
+            Change('2', 2, deleted=True, document_store=document_store, metadata=ChangeMeta(
+                document_id='2', data_source_type='couch', data_source_name='test', is_deletion=True)),
+        ]
+        processor = BulkElasticProcessor(Mock(), TEST_INDEX_INFO)
+        with patch.object(ElasticsearchInterface, 'bulk_ops', return_value=(2, [])) as bulk_ops:
+            retry, errors = processor.process_changes_chunk(changes)
+        self.assertEqual(([], []), (retry, errors))
+        document_store.iter_documents.assert_called_once_with(['1'])
+        actions = bulk_ops.call_args[0][0]
+        self.assertEqual(
+            [('delete', '2'), ('index', '1')],
+            [(action['_op_type'], action['_id']) for action in actions]
+        )
+
+
+def _changes(count, lag_seconds=0):
+    publish_timestamp = datetime.utcnow() - timedelta(seconds=lag_seconds)
+    return [
+        Change(str(i), i, metadata=ChangeMeta(
+            document_id=str(i), data_source_type='couch', data_source_name='test',
+            publish_timestamp=publish_timestamp,
+        ))
+        for i in range(count)
+    ]
+
+
+class ChunkControllerTest(SimpleTestCase):
+
+    def test_should_process(self):
+        controller = ChunkController(10)
+        now = datetime.utcnow()
+        self.assertFalse(controller.should_process([], now))
+        self.assertFalse(controller.should_process(_changes(9), now))
+        self.assertTrue(controller.should_process(_changes(10), now))
+        self.assertTrue(controller.should_process(_changes(1), now - timedelta(seconds=6)))
+
+    def test_not_adaptive(self):
+        controller = ChunkController(10)
+        self.assertIsNone(controller.chunk_processed(_changes(10, lag_seconds=60), 0.1))
+        self.assertIsNone(controller.chunk_processed(_changes(10), 60))
+        self.assertEqual(10, controller.chunk_size)
+
+    def test_grow_with_backlog(self):
+        controller = ChunkController(10, max_chunk_size=30)
+        self.assertEqual('backlog', controller.chunk_processed(_changes(10, lag_seconds=60), 0.1))
+        self.assertEqual(20, controller.chunk_size)
+        controller.chunk_processed(_changes(20, lag_seconds=60), 0.1)
+        self.assertEqual(30, controller.chunk_size)
+        self.assertIsNone(controller.chunk_processed(_changes(30, lag_seconds=60), 0.1))
+        self.assertEqual(30, controller.chunk_size)
+
+    def test_no_backlog(self):
+        controller = ChunkController(10, max_chunk_size=30)
+        self.assertIsNone(controller.chunk_processed(_changes(10), 0.1))
+        self.assertEqual(10, controller.chunk_size)
+
+    def test_shrink_when_slow(self):
+        controller = ChunkController(10, max_chunk_size=100)
+        controller.chunk_size = 100
+        self.assertEqual('slow', controller.chunk_processed(_changes(100), 20))
+        self.assertEqual(50, controller.chunk_size)
+
+    def test_reset_when_caught_up(self):
+        controller = ChunkController(10, max_chunk_size=100)
+        controller.chunk_size = 100
+        self.assertEqual('caught_up', controller.chunk_processed(_changes(5), 0.1))
+        self.assertEqual(10, controller.chunk_size)
+
+
+class PrefetchChangesDocsTest(SimpleTestCase):
+
+    def test_prefetch(self):
+        document_store = Mock()
+        document_store.iter_documents.return_value = [{'_id': '1'}, {'_id': '2'}]
+        changes = _changes(3)
+        deleted = Change('2', 2, deleted=True, document_store=document_store, metadata=changes[1].metadata)
+        fetched = Change('1', 4, document={'_id': '1', 'fetched': True}, document_store=document_store,
+                         metadata=changes[0].metadata)
+        for change in changes:
+            change.document_store = document_store
+        prefetch_changes_docs(changes + [deleted, fetched])
+
+        document_store.iter_documents.assert_called_once_with(['0', '1', '2'])
+        self.assertEqual([None, {'_id': '1'}, {'_id': '2'}], [change.document for change in changes])
+        self.assertIsNone(deleted.document)
+        self.assertEqual({'_id': '1', 'fetched': True}, fetched.document)
+
+
+class ChunkPipelineTest(SimpleTestCase):
+
+    def _get_pipeline(self, depth):
+        pillow = Mock()
+        offsets = iter(range(100))
+        pillow.get_change_feed.return_value.get_processed_offsets.side_effect = lambda: next(offsets)
+        processed = []
+
+        def _process_chunk(chunk, context, controller):
+            processed.append((chunk, context.processed_offsets))
+
+        pillow._process_chunk.side_effect = _process_chunk
+        context = PillowRuntimeContext()
+        return ChunkPipeline(pillow, context, ChunkController(10), depth), context, processed
+
+    @patch('pillowtop.pillow.interface.prefetch_changes_docs')
+    def test_process_in_order(self, prefetch):
+        pipeline, context, processed = self._get_pipeline(depth=2)
+        for chunk in ['a', 'b', 'c', 'd']:
+            pipeline.submit(chunk)
+        # the last two chunks are still pending
+        self.assertEqual([('a', 0), ('b', 1)], processed)
+        pipeline.drain()
+        pipeline.close()
+        self.assertEqual([('a', 0), ('b', 1), ('c', 2), ('d', 3)], processed)
+        self.assertEqual(4, prefetch.call_count)
+        self.assertIsNone(context.processed_offsets)
+
+    @patch('pillowtop.pillow.interface.notify_exception')
+    @patch('pillowtop.pillow.interface.prefetch_changes_docs', side_effect=Exception)
+    def test_prefetch_error(self, prefetch, notify_exception):
+        pipeline, context, processed = self._get_pipeline(depth=0)
+        pipeline.submit('a')
+        pipeline.close()
+        self.assertEqual([('a', 0)], processed)
+        self.assertEqual(1, notify_exception.call_count)
+
 
 @use_sql_backend
 class TestBulkDocOperations(TestCase):
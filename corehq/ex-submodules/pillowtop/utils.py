@@ -352,10 +352,33 @@ def bulk_fetch_changes_docs(changes, domain=None):
     return bad_changes, docs
 
 
+def prefetch_changes_docs(changes):
+    """Populate changes with their documents in bulk, ahead of processing.
+
+    Unlike ``bulk_fetch_changes_docs`` this doesn't check for missing or out of
+    date documents: changes without a document are fetched again when processed.
+    """
+    changes_by_doctype = defaultdict(list)
+    for change in changes:
+        if not change.deleted and change.metadata and change.should_fetch_document():
+            changes_by_doctype[change.metadata.data_source_name].append(change)
+
+    for _changes in changes_by_doctype.values():
+        changes_by_id = defaultdict(list)
+        for change in _changes:
+            changes_by_id[change.id].append(change)
+        doc_store = _changes[0].document_store
+        for doc in doc_store.iter_documents(list(changes_by_id)):
+            for change in changes_by_id.get(doc['_id'], []):
+                change.set_document(doc)
+
+
 def get_errors_with_ids(es_action_errors):
     return [
         (item['_id'], item['error'])
         for op_type, item in _changes_to_list(es_action_errors)
+        # deleting a doc that isn't in the index is not an error
+        if not (op_type == 'delete' and item.get('status') == 404)
     ]
 
 
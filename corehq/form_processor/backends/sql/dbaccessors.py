@@ -61,6 +61,8 @@ from corehq.sql_db.config import plproxy_config
 from corehq.sql_db.util import (
     estimate_row_count,
     get_db_aliases_for_partitioned_query,
+    iter_across_db_aliases,
+    map_across_db_aliases,
     split_list_by_db_partition,
 )
 from corehq.util.datadog.utils import form_load_counter
@@ -80,9 +82,10 @@ state_to_doc_type = {v: k for k, v in doc_type_to_state.items()}
 
 def iter_all_rows(reindex_accessor):
     """Returns a generator that will iterate over all rows provided by the
-    reindex accessor
+    reindex accessor. The databases are queried concurrently, so the rows of
+    different databases are interleaved.
     """
-    for db_alias in reindex_accessor.sql_db_aliases:
+    def _iter_rows(db_alias):
         docs = reindex_accessor.get_docs(db_alias)
         while docs:
             for doc in docs:
@@ -91,6 +94,12 @@ def iter_all_rows(reindex_accessor):
             last_id = getattr(doc, reindex_accessor.primary_key_field_name)
             docs = reindex_accessor.get_docs(db_alias, last_doc_pk=last_id)
 
+    return iter_across_db_aliases(
+        _iter_rows,
+        reindex_accessor.sql_db_aliases,
+        query_name='iter_all_rows_{}'.format(reindex_accessor.model_class.__name__),
+    )
+
 
 def iter_all_ids(reindex_accessor):
     return itertools.chain.from_iterable(iter_all_ids_chunked(reindex_accessor))
@@ -424,19 +433,28 @@ class FormAccessorSQL(AbstractFormAccessor):
             XFormInstanceSQL,
             Q(last_modified__gt=start_datetime, last_modified__lte=end_datetime),
             annotate=annotate,
-            load_source='forms_by_last_modified'
+            load_source='forms_by_last_modified',
+            parallel=True,
         )
 
     @staticmethod
-    def iter_form_ids_by_xmlns(domain, xmlns=None):
-        from corehq.sql_db.util import paginate_query_across_partitioned_databases
+    def iter_form_ids_by_xmlns(domain, xmlns=None, db_alias=None):
+        """
+        :param db_alias: (optional) Only iterate over the forms in this database
+        """
+        from corehq.sql_db.util import paginate_query, paginate_query_across_partitioned_databases
 
         q_expr = Q(domain=domain) & Q(state=XFormInstanceSQL.NORMAL)
         if xmlns:
             q_expr &= Q(xmlns=xmlns)
 
-        for form_id in paginate_query_across_partitioned_databases(
-                XFormInstanceSQL, q_expr, values=['form_id'], load_source='formids_by_xmlns'):
+        if db_alias:
+            form_ids = paginate_query(
+                db_alias, XFormInstanceSQL, q_expr, values=['form_id'], load_source='formids_by_xmlns')
+        else:
+            form_ids = paginate_query_across_partitioned_databases(
+                XFormInstanceSQL, q_expr, values=['form_id'], load_source='formids_by_xmlns', parallel=True)
+        for form_id in form_ids:
             yield form_id[0]
 
     @staticmethod
@@ -1187,13 +1205,10 @@ class CaseAccessorSQL(AbstractCaseAccessor):
 
     @staticmethod
     def get_case_owner_ids(domain):
-        from corehq.sql_db.util import get_db_aliases_for_partitioned_query
-        db_aliases = get_db_aliases_for_partitioned_query()
-        owner_ids = set()
-        for db_alias in db_aliases:
-            owner_ids.update(fast_distinct_in_domain(CommCareCaseSQL, 'owner_id', domain, using=db_alias))
+        def _get_case_owner_ids(db_alias):
+            return set(fast_distinct_in_domain(CommCareCaseSQL, 'owner_id', domain, using=db_alias))
 
-        return owner_ids
+        return set().union(*map_across_db_aliases(_get_case_owner_ids))
 
     @staticmethod
     def get_case_transactions_for_form(form_id, limit_to_cases):
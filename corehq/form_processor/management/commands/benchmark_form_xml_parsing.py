@@ -0,0 +1,178 @@
+import multiprocessing
+import resource
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from lxml import etree
+
+from casexml.apps.case.xform import get_case_updates
+from casexml.apps.stock.const import COMMTRACK_REPORT_XMLNS
+
+from corehq.form_processor.parsers.form_xml import (
+    _iter_ledger_elements,
+    get_ledger_elements,
+    parse_form_xml,
+)
+from corehq.form_processor.utils import convert_xform_to_json
+from xml2json.lib import convert_xml_to_json
+
+
+class _SubmittedForm(object):
+    """Like a form processed by process_xform_xml, which keeps the form's ParsedFormXml"""
+
+    def __init__(self, parsed_xml):
+        self.form_data = parsed_xml.form_data
+        self._parsed_xml = parsed_xml
+
+
+def _parse_with_xml2json(xml):
+    form_data = convert_xform_to_json(xml)
+    case_updates = get_case_updates(form_data)
+    # the ledger processing parses the form XML again to find its ledger blocks
+    ledger_elements = list(_iter_ledger_elements(etree.fromstring(xml)))
+    return form_data, case_updates, ledger_elements
+
+
+def _parse_in_single_pass(xml):
+    form = _SubmittedForm(parse_form_xml(xml))
+    # the case and ledger processing get the blocks collected while parsing
+    return form.form_data, get_case_updates(form), get_ledger_elements(form)
+
+
+PARSERS = {
+    'xml2json': _parse_with_xml2json,
+    'single-pass': _parse_in_single_pass,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the CPU time and memory per submission of converting form XML to JSON and getting "
+        "its case updates and ledger blocks the way form processing does, with xml2json and with the "
+        "single-pass parser. Each parser runs in its own process, and the memory is the peak of the "
+        "Python objects allocated for a form, and the growth of the process's max RSS, which includes "
+        "the parsed XML trees. The corpus is generated, or read from the XML files of real submissions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('xml_files', nargs='*', help="Use the XML of these submissions as the corpus")
+        parser.add_argument('--forms', type=int, default=100, help="Number of forms to generate")
+        parser.add_argument('--repeats', type=int, default=500, help="Repeat items in each generated form")
+        parser.add_argument('--case-blocks', type=int, default=50, help="Case blocks in each generated form")
+        parser.add_argument('--ledgers', type=int, default=5, help="Ledger blocks in each generated form")
+
+    def handle(self, xml_files, **options):
+        if xml_files:
+            corpus = []
+            for path in xml_files:
+                with open(path, 'rb') as f:
+                    corpus.append(f.read())
+        else:
+            corpus = [
+                _generate_form_xml(options['repeats'], options['case_blocks'], options['ledgers'])
+                for _ in range(options['forms'])
+            ]
+        print("{} forms, {:.1f} KB / form".format(
+            len(corpus), sum(len(xml) for xml in corpus) / len(corpus) / 1024
+        ))
+
+        mismatches = sum(
+            1 for xml in corpus
+            if _comparable(_parse_with_xml2json(xml)) != _comparable(_parse_in_single_pass(xml))
+        )
+        print("Forms with different results: {}".format(mismatches))
+
+        for name in PARSERS:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=_run_parser, args=(queue, name, corpus))
+            process.start()
+            cpu_ms, python_kb, rss_kb = queue.get()
+            process.join()
+            print("{:<12} {:>8.2f} ms CPU {:>10.1f} KB Python memory {:>10.1f} KB max RSS growth".format(
+                name, cpu_ms, python_kb, rss_kb
+            ))
+        print("(per form)")
+
+
+def _run_parser(queue, name, corpus):
+    parse = PARSERS[name]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.process_time()
+    for xml in corpus:
+        parse(xml)
+    cpu_seconds = time.process_time() - start
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+
+    python_peak = 0
+    for xml in corpus:
+        tracemalloc.start()
+        parse(xml)
+        python_peak += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    queue.put((cpu_seconds * 1000 / len(corpus), python_peak / 1024 / len(corpus), rss_growth))
+
+
+def _comparable(result):
+    form_data, case_updates, ledger_elements = result
+    case_blocks = [update.raw_block for update in case_updates]
+    ledgers = [convert_xml_to_json(element, last_xmlns=COMMTRACK_REPORT_XMLNS) for element in ledger_elements]
+    return form_data, case_blocks, ledgers
+
+
+def _generate_form_xml(num_repeats, num_case_blocks, num_ledgers):
+    items = ''.join(
+        """
+        <item index="{index}">
+            <name>Item {index}</name>
+            <quantity>{index}</quantity>
+            <checked>yes</checked>
+            <notes></notes>
+        </item>""".format(index=index)
+        for index in range(num_repeats)
+    )
+    case_blocks = ''.join(
+        """
+        <case_update>
+            <n0:case case_id="{case_id}" date_modified="2019-11-01T10:00:00.000000Z"
+                     user_id="{user_id}" xmlns:n0="http://commcarehq.org/case/transaction/v2">
+                <n0:update>
+                    <n0:visit_count>{index}</n0:visit_count>
+                    <n0:last_visit>2019-11-01</n0:last_visit>
+                </n0:update>
+            </n0:case>
+        </case_update>""".format(case_id=uuid.uuid4().hex, user_id=uuid.uuid4().hex, index=index)
+        for index in range(num_case_blocks)
+    )
+    ledgers = ''.join(
+        """
+        <n1:balance xmlns:n1="{xmlns}" entity-id="{case_id}" date="2019-11-01" section-id="stock">
+            <n1:entry id="{product_id}" quantity="{index}"/>
+        </n1:balance>""".format(
+            xmlns=COMMTRACK_REPORT_XMLNS, case_id=uuid.uuid4().hex, product_id=uuid.uuid4().hex, index=index
+        )
+        for index in range(num_ledgers)
+    )
+    return """<?xml version="1.0" ?>
+<data xmlns="http://openrosa.org/formdesigner/benchmark" uiVersion="1" version="1" name="Benchmark">
+    <items>{items}
+    </items>
+    <case_updates>{case_blocks}
+    </case_updates>
+    <ledgers>{ledgers}
+    </ledgers>
+    <n2:meta xmlns:n2="http://openrosa.org/jr/xforms">
+        <n2:deviceID>benchmark</n2:deviceID>
+        <n2:timeStart>2019-11-01T09:55:00.000000Z</n2:timeStart>
+        <n2:timeEnd>2019-11-01T10:00:00.000000Z</n2:timeEnd>
+        <n2:username>benchmark</n2:username>
+        <n2:userID>{user_id}</n2:userID>
+        <n2:instanceID>{form_id}</n2:instanceID>
+        <n3:appVersion xmlns:n3="http://commcarehq.org/xforms">Formplayer Version: 2.47</n3:appVersion>
+    </n2:meta>
+</data>""".format(
+        items=items, case_blocks=case_blocks, ledgers=ledgers,
+        user_id=uuid.uuid4().hex, form_id=uuid.uuid4().hex,
+    ).encode('utf-8')
@@ -9,7 +9,9 @@ from corehq.form_processor.exceptions import MissingFormXml, NotAllowed
 from corehq.form_processor.interfaces.dbaccessors import FormAccessors
 from corehq.form_processor.interfaces.processor import FormProcessorInterface
 from corehq.form_processor.models import Attachment
+from corehq.form_processor.parsers.form_xml import parse_form_xml
 from corehq.form_processor.utils import convert_xform_to_json, adjust_datetimes
+from corehq.toggles import FAST_FORM_XML_PARSING
 from corehq.util.soft_assert.api import soft_assert
 from couchforms import XMLSyntaxError
 from couchforms.exceptions import MissingXMLNSError
@@ -97,7 +99,12 @@ def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None)
     interface = FormProcessorInterface(domain)
 
     assert attachments is not None
-    form_data = convert_xform_to_json(instance_xml)
+    if FAST_FORM_XML_PARSING.enabled(domain):
+        parsed_xml = parse_form_xml(instance_xml)
+        form_data = parsed_xml.form_data
+    else:
+        parsed_xml = None
+        form_data = convert_xform_to_json(instance_xml)
     if not form_data.get('@xmlns'):
         raise MissingXMLNSError("Form is missing a required field: XMLNS")
 
@@ -106,6 +113,9 @@ def _create_new_xform(domain, instance_xml, attachments=None, auth_context=None)
     xform = interface.new_xform(form_data)
     xform.domain = domain
     xform.auth_context = auth_context
+    if parsed_xml is not None:
+        # lets the ledger processing use the ledger elements instead of parsing the XML again
+        xform._parsed_xml = parsed_xml
 
     # Maps all attachments to uniform format and adds form.xml to list before storing
     attachments = [Attachment(name=a[0], raw_content=a[1], content_type=a[1].content_type) for a in attachments.items()]
@@ -0,0 +1,272 @@
+"""
+Single-pass parsing of form submission XML
+
+``parse_form_xml`` streams through a submission with lxml's ``iterparse`` and
+builds the form JSON in the same shape as ``convert_xform_to_json``, while
+collecting the form's case blocks and ledger elements as it goes, so they don't
+have to be found again by walking the form JSON or re-parsing the XML.
+
+The shape of the form JSON follows xml2json's conventions:
+
+- an element with no attributes, children or change of namespace is its text,
+  or ``''`` if it has none
+- otherwise it is a dict with its attributes as ``@<name>``, its namespace as
+  ``@xmlns`` if it differs from its parent's, its text as ``#text`` if it has
+  no children, and its children by tag name; repeated children are a list
+
+XML that falls outside these conventions (comments and processing instructions
+inside the form, namespaced attributes, mixed content, ...) is rare in
+submissions, and is converted by xml2json instead.
+"""
+from io import BytesIO
+
+from lxml import etree
+from memoized import memoized
+
+from casexml.apps.case import const
+from casexml.apps.case.util import validate_phone_datetime
+from casexml.apps.case.xform import CaseBlockWithPath, extract_case_blocks, has_case_id
+from casexml.apps.stock.const import COMMTRACK_REPORT_XMLNS
+from couchforms.const import DEVICE_LOG_XMLNS
+
+from corehq.form_processor.utils import convert_xform_to_json, extract_meta_instance_id
+from corehq.util.datadog.gauges import datadog_counter
+
+LEDGER_TAGS = frozenset([
+    '{%s}balance' % COMMTRACK_REPORT_XMLNS,
+    '{%s}transfer' % COMMTRACK_REPORT_XMLNS,
+])
+
+
+class ParsedFormXml(object):
+
+    def __init__(self, form_data, case_blocks=None, ledger_elements=None):
+        """
+        :param form_data: The form JSON, as returned by ``convert_xform_to_json``
+        :param case_blocks: List of ``CaseBlockWithPath`` for the case blocks in
+            ``form_data``, or ``None`` if they weren't collected while parsing
+        :param ledger_elements: List of the form's ledger balance and transfer
+            elements, or ``None`` if they weren't collected while parsing
+        """
+        self.form_data = form_data
+        self._case_blocks = case_blocks
+        self.ledger_elements = ledger_elements
+
+    @property
+    def meta(self):
+        return self.form_data.get('meta')
+
+    @property
+    @memoized
+    def case_blocks(self):
+        """
+        The same as ``extract_case_blocks(self.form_data, include_path=True)``
+        """
+        if self._case_blocks is None:
+            return extract_case_blocks(self.form_data, include_path=True)
+        form_id = extract_meta_instance_id(self.form_data)
+        for case_block in self._case_blocks:
+            validate_phone_datetime(case_block.caseblock.get('@date_modified'), none_ok=True, form_id=form_id)
+        return self._case_blocks
+
+
+class UnsupportedFormXml(Exception):
+    """The XML can't be converted without falling back to xml2json"""
+
+
+def parse_form_xml(xml_string):
+    """
+    Parse a form submission's XML in a single pass
+
+    :returns: ParsedFormXml
+    :raises: couchforms.XMLSyntaxError if the XML is invalid
+    """
+    if isinstance(xml_string, bytes):
+        try:
+            return _FormXmlParser().parse(xml_string)
+        except (UnsupportedFormXml, etree.XMLSyntaxError):
+            # let xml2json convert it, or raise its error for the invalid XML
+            datadog_counter('commcare.form_processor.form_xml_parser.fallback')
+
+    return ParsedFormXml(convert_xform_to_json(xml_string))
+
+
+def get_ledger_elements(xform):
+    """
+    :returns: The ledger balance and transfer elements in the form's XML,
+        reusing the ones collected when the form was parsed if it was parsed
+        by ``parse_form_xml``
+    """
+    parsed_xml = getattr(xform, '_parsed_xml', None)
+    if parsed_xml is not None and parsed_xml.ledger_elements is not None:
+        return parsed_xml.ledger_elements
+    return list(_iter_ledger_elements(xform.get_xml_element()))
+
+
+def _iter_ledger_elements(node):
+    for child in node:
+        if child.tag in LEDGER_TAGS:
+            yield child
+        else:
+            for element in _iter_ledger_elements(child):
+                yield element
+
+
+class _Frame(object):
+    """The state of an element whose end hasn't been parsed yet"""
+    __slots__ = ['name', 'xmlns', 'value', 'has_children', 'find_cases', 'in_ledger']
+
+    def __init__(self, name, xmlns, value, find_cases, in_ledger):
+        self.name = name
+        self.xmlns = xmlns
+        # dict of the element's attributes and children, or None if it has neither
+        self.value = value
+        self.has_children = False
+        # whether case blocks are extracted from the element's children
+        self.find_cases = find_cases
+        self.in_ledger = in_ledger
+
+
+class _FormXmlParser(object):
+
+    def __init__(self):
+        self.stack = []
+        self.case_blocks = []
+        self.ledger_elements = []
+        # (xmlns, name) by tag, since repeats have many elements with the same tags
+        self.split_tags = {}
+
+    def parse(self, xml_string):
+        root_name = form_data = None
+        events = etree.iterparse(BytesIO(xml_string), events=('start', 'end', 'comment', 'pi'))
+        for event, element in events:
+            if event == 'start':
+                self._start(element)
+            elif event == 'end':
+                frame = self.stack.pop()
+                value = self._end(element, frame)
+                if self.stack:
+                    self._add_child(self.stack[-1], frame.name, value)
+                else:
+                    root_name, form_data = frame.name, value
+            elif self.stack:
+                # a comment or processing instruction inside the root element
+                raise UnsupportedFormXml(event)
+
+        if not isinstance(form_data, dict):
+            raise UnsupportedFormXml('root element without attributes or children')
+        form_data['#type'] = root_name
+        return ParsedFormXml(form_data, self._get_case_blocks(), self.ledger_elements)
+
+    def _start(self, element):
+        tag = element.tag
+        try:
+            xmlns, name = self.split_tags[tag]
+        except KeyError:
+            xmlns, name = self.split_tags[tag] = _split_tag(tag)
+        parent = self.stack[-1] if self.stack else None
+        new_xmlns = parent is None or xmlns != parent.xmlns
+        if new_xmlns and xmlns is None and parent is not None:
+            raise UnsupportedFormXml('element without a namespace in a namespace')
+
+        value = None
+        if element.attrib or (new_xmlns and xmlns):
+            value = {}
+            for key, attr_value in element.attrib.items():
+                if key[0] == '{':
+                    raise UnsupportedFormXml('namespaced attribute {}'.format(key))
+                value['@' + key] = attr_value
+            if new_xmlns and xmlns:
+                value['@xmlns'] = xmlns
+
+        if parent is None:
+            find_cases = xmlns != DEVICE_LOG_XMLNS
+            in_ledger = False
+        else:
+            find_cases = (
+                parent.find_cases
+                and name != const.CASE_TAG
+                and not (new_xmlns and xmlns == DEVICE_LOG_XMLNS)
+            )
+            in_ledger = parent.in_ledger
+            if not in_ledger and tag in LEDGER_TAGS:
+                self.ledger_elements.append(element)
+                in_ledger = True
+        self.stack.append(_Frame(name, xmlns, value, find_cases, in_ledger))
+
+    def _end(self, element, frame):
+        text = element.text
+        if frame.has_children:
+            if text and text.strip():
+                raise UnsupportedFormXml('mixed content in {}'.format(frame.name))
+            for child in element:
+                if child.tail and child.tail.strip():
+                    raise UnsupportedFormXml('mixed content in {}'.format(frame.name))
+            value = frame.value
+        elif frame.value is None:
+            value = text or ''
+        else:
+            value = frame.value
+            if text:
+                if not text.strip():
+                    raise UnsupportedFormXml('whitespace text in {}'.format(frame.name))
+                value['#text'] = text
+
+        if not frame.in_ledger:
+            # the element's children have been converted, so free them
+            del element[:]
+
+        if (
+            frame.name == const.CASE_TAG
+            and self.stack
+            and self.stack[-1].find_cases
+            and has_case_id(value)
+        ):
+            self.case_blocks.append((
+                self._get_dict_order(),
+                CaseBlockWithPath(caseblock=value, path=[f.name for f in self.stack[1:]]),
+            ))
+        return value
+
+    @staticmethod
+    def _add_child(parent, name, value):
+        if parent.value is None:
+            parent.value = {}
+        parent.has_children = True
+        siblings = parent.value
+        if name not in siblings:
+            siblings[name] = value
+        elif isinstance(siblings[name], list):
+            siblings[name].append(value)
+        else:
+            siblings[name] = [siblings[name], value]
+
+    def _get_dict_order(self):
+        """
+        The position of the case block being ended in a walk of the form JSON,
+        as a tuple of ``(key position, repeat index)`` for the block and each
+        of its ancestors in their parent's dict. The dicts of open elements
+        only have the keys of the children before the one being parsed.
+        """
+        keys = [(parent.value, frame.name) for parent, frame in zip(self.stack, self.stack[1:])]
+        keys.append((self.stack[-1].value, const.CASE_TAG))
+        return tuple(_get_key_order(siblings or {}, name) for siblings, name in keys)
+
+    def _get_case_blocks(self):
+        # extract_case_blocks walks the form JSON, so blocks under a repeated
+        # node come before the ones under nodes that follow its first repeat
+        return [case_block for order, case_block in sorted(self.case_blocks, key=lambda item: item[0])]
+
+
+def _get_key_order(siblings, name):
+    if name not in siblings:
+        return len(siblings), 0
+    existing = siblings[name]
+    return list(siblings).index(name), len(existing) if isinstance(existing, list) else 1
+
+
+def _split_tag(tag):
+    if tag[0] == '{':
+        xmlns, name = tag[1:].split('}', 1)
+        return xmlns, name
+    return None, tag
@@ -15,6 +15,7 @@ from casexml.apps.stock import const as stockconst
 from casexml.apps.stock.const import COMMTRACK_REPORT_XMLNS
 from corehq.apps.commtrack import const
 from corehq.apps.commtrack.exceptions import InvalidDate
+from corehq.form_processor.parsers.form_xml import get_ledger_elements
 from corehq.form_processor.parsers.ledgers.helpers import StockTransactionHelper, StockReportHelper, \
     UniqueLedgerReference
 from corehq.form_processor.utils.xform import adjust_text_to_datetime
@@ -125,22 +126,7 @@ def get_all_stock_report_helpers_from_form(xform):
     Given an instance of an AbstractXFormInstance, extract the ledger actions and convert
     them to StockReportHelper objects.
     """
-    form_xml = xform.get_xml_element()
-    commtrack_node_names = ('{%s}balance' % COMMTRACK_REPORT_XMLNS,
-                            '{%s}transfer' % COMMTRACK_REPORT_XMLNS)
-
-    def _extract_ledger_nodes_from_xml(node):
-        """
-        Goes through a parsed XML document and recursively pulls out any ledger XML blocks.
-        """
-        for child in node:
-            if child.tag in commtrack_node_names:
-                yield child
-            else:
-                for e in _extract_ledger_nodes_from_xml(child):
-                    yield e
-
-    for elem in _extract_ledger_nodes_from_xml(form_xml):
+    for elem in get_ledger_elements(xform):
         report_type, ledger_json = convert_xml_to_json(elem, last_xmlns=COMMTRACK_REPORT_XMLNS)
         if ledger_json.get('@date'):
             try:
@@ -13,13 +13,14 @@ from django.conf import settings
 from django.urls import reverse
 from django.utils.translation import ugettext as _
 import sys
+import time
 
 from casexml.apps.case.xform import close_extension_cases
 from casexml.apps.phone.restore_caching import AsyncRestoreTaskIdCache, RestorePayloadPathCache
 import couchforms
 from casexml.apps.case.exceptions import PhoneDateValueError, IllegalCaseId, UsesReferrals, InvalidCaseIndex, \
     CaseValueError
-from corehq.apps.receiverwrapper.rate_limiter import report_submission_usage
+from corehq.apps.receiverwrapper.rate_limiter import rate_limit_submission, report_submission_usage
 from corehq.const import OPENROSA_VERSION_3
 from corehq.middleware import OPENROSA_VERSION_HEADER
 from corehq.toggles import ASYNC_RESTORE, SUMOLOGIC_LOGS, NAMESPACE_OTHER
@@ -48,6 +49,13 @@ from phonelog.utils import process_device_log, SumoLogicLog
 
 from celery.task.control import revoke as revoke_celery_task
 
+# The most forms that can be submitted in one bulk submission request
+BULK_SUBMISSION_MAX_FORMS = 100
+# No more forms of a bulk submission are processed after this many seconds.
+# This is well under the 120 second timeout of the case locks held for the
+# batch, so that they don't expire while a form is being processed.
+BULK_SUBMISSION_TIME_LIMIT = 60
+
 CaseStockProcessingResult = namedtuple(
     'CaseStockProcessingResult',
     'case_result, case_models, stock_result'
@@ -535,6 +543,104 @@ class SubmissionPost(object):
         return FormProcessingResult(response, device_log_form, [], [], 'device-log')
 
 
+class BulkSubmissionPost(object):
+    """
+    Process a sequence of forms that a user submitted together, in order
+
+    The forms share one locked case DB cache, so each case that the forms
+    update is loaded and locked once for the whole sequence rather than once
+    for each form. Each form is still saved in its own transaction and gets its
+    own result.
+
+    The forms after BULK_SUBMISSION_TIME_LIMIT seconds, or after the project's
+    submission rate limit is reached, are not processed. ``stopped`` is then
+    TIME_LIMIT or RATE_LIMITED.
+    """
+    TIME_LIMIT = 'time_limit'
+    RATE_LIMITED = 'rate_limited'
+
+    def __init__(self, instances, domain, **submission_kwargs):
+        assert domain, "'domain' is required"
+        self.instances = instances
+        self.domain = domain
+        self.submission_kwargs = submission_kwargs
+        self.interface = FormProcessorInterface(domain)
+        self.stopped = None
+
+    def iter_results(self):
+        """
+        Process the forms in order, yielding a FormProcessingResult for each.
+
+        An error raised while processing a form is raised once the results of
+        the forms before it have been yielded, and the forms after it are not
+        processed so that they can be resubmitted in order.
+        """
+        start = time.time()
+        case_db_cache = self.interface.casedb_cache(
+            domain=self.domain, lock=True, deleted_ok=True, load_src="bulk_form_submission",
+        )
+        with case_db_cache as case_db:
+            self._load_cases(case_db)
+            batch_case_ids = set(case_db.cache)
+            for index, instance in enumerate(self.instances):
+                # the caller checks the rate limit before the first form
+                if index and time.time() - start > BULK_SUBMISSION_TIME_LIMIT:
+                    self.stopped = self.TIME_LIMIT
+                    return
+                if index and rate_limit_submission(self.domain):
+                    self.stopped = self.RATE_LIMITED
+                    return
+                result = SubmissionPost(
+                    instance=instance,
+                    domain=self.domain,
+                    case_db=case_db,
+                    **self.submission_kwargs
+                ).run()
+                # The locks on cases that were first loaded for this form were
+                # released when it finished, so later forms load them again.
+                _remove_cached_cases(case_db, set(case_db.cache) - batch_case_ids)
+                if result.submission_type != 'normal':
+                    # the form's changes to the cached cases may not have been saved
+                    _reload_cached_cases(case_db)
+                yield result
+
+    @tracer.wrap(name='submission.bulk_load_cases')
+    def _load_cases(self, case_db):
+        """Load and lock the cases that the forms update, in a consistent order"""
+        from casexml.apps.case.xml.parser import case_update_from_block
+        from corehq.form_processor.parsers.form_xml import parse_form_xml
+
+        case_ids = set()
+        for instance in self.instances:
+            try:
+                case_ids.update(
+                    case_update_from_block(case_block.caseblock).id
+                    for case_block in parse_form_xml(instance).case_blocks
+                )
+            except Exception:
+                # errors are handled when the form is processed
+                pass
+        for case_id in sorted(filter(None, case_ids)):
+            try:
+                case_db.get(case_id)
+            except IllegalCaseId:
+                pass
+
+
+def _remove_cached_cases(case_db, case_ids):
+    for case_id in case_ids:
+        del case_db.cache[case_id]
+
+
+def _reload_cached_cases(case_db):
+    case_ids = list(case_db.cache)
+    case_db.cache = {}
+    case_db.clear_changed()
+    if case_ids:
+        # the cases are still locked by the case DB, so they are loaded without locking them again
+        case_db.populate(case_ids)
+
+
 def _transform_instance_to_error(interface, exception, instance):
     error_message = '{}: {}'.format(type(exception).__name__, str(exception))
     return interface.xformerror_from_xform_instance(instance, error_message)
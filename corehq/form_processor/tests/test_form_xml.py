@@ -0,0 +1,120 @@
+import os
+
+from django.test import SimpleTestCase
+
+from mock import Mock, patch
+
+import couchforms
+from casexml.apps.case.xform import extract_case_blocks, get_case_updates
+from couchforms import XMLSyntaxError
+
+from corehq.form_processor.parsers.form_xml import parse_form_xml
+from corehq.form_processor.utils import convert_xform_to_json
+from corehq.util.test_utils import TestFileMixin
+
+FORM_XML = b"""<?xml version="1.0" ?>
+<data xmlns="http://openrosa.org/formdesigner/form-xml" uiVersion="1" version="1">
+    <visit>
+        <n0:case case_id="case-1" date_modified="2019-11-01T10:00:00.000000Z"
+                 xmlns:n0="http://commcarehq.org/case/transaction/v2">
+            <n0:update><n0:visited>yes</n0:visited></n0:update>
+        </n0:case>
+    </visit>
+    <child>
+        <n0:case case_id="case-2" xmlns:n0="http://commcarehq.org/case/transaction/v2">
+            <n0:update><n0:visited>yes</n0:visited></n0:update>
+        </n0:case>
+    </child>
+    <visit>
+        <n0:case case_id="case-3" xmlns:n0="http://commcarehq.org/case/transaction/v2">
+            <n0:close/>
+        </n0:case>
+    </visit>
+    <case>not a case block</case>
+    <log xmlns="http://code.javarosa.org/devicereport">
+        <case case_id="case-4"/>
+    </log>
+    <products>
+        <n1:balance xmlns:n1="http://commcarehq.org/ledger/v1" entity-id="case-1" date="2019-11-01"
+                    section-id="stock">
+            <n1:entry id="product-1" quantity="10"/>
+            <n1:entry id="product-2" quantity="20"/>
+        </n1:balance>
+    </products>
+    <empty/>
+    <blank>
+    </blank>
+    <n2:meta xmlns:n2="http://openrosa.org/jr/xforms">
+        <n2:instanceID>form-1</n2:instanceID>
+        <n3:appVersion xmlns:n3="http://commcarehq.org/xforms">2.0</n3:appVersion>
+    </n2:meta>
+</data>"""
+
+
+class ParseFormXmlTest(SimpleTestCase, TestFileMixin):
+    file_path = ('tests', 'data', 'posts')
+    root = os.path.dirname(couchforms.__file__)
+
+    def _assert_same_as_xml2json(self, xml):
+        parsed_xml = parse_form_xml(xml)
+        form_data = convert_xform_to_json(xml)
+        self.assertEqual(parsed_xml.form_data, form_data)
+        self.assertEqual(parsed_xml.case_blocks, extract_case_blocks(form_data, include_path=True))
+        return parsed_xml
+
+    def test_form_data(self):
+        parsed_xml = self._assert_same_as_xml2json(FORM_XML)
+        self.assertEqual(parsed_xml.form_data['#type'], 'data')
+        self.assertEqual(parsed_xml.form_data['empty'], '')
+        self.assertEqual(parsed_xml.form_data['blank'], '\n    ')
+        self.assertEqual(parsed_xml.meta['appVersion'], {
+            '@xmlns': 'http://commcarehq.org/xforms',
+            '#text': '2.0',
+        })
+
+    def test_posts(self):
+        for name in ['cloudant-template', 'decimalmeta', 'duplicate', 'meta', 'meta_bad_username',
+                     'meta_dict_appversion', 'namespaces', 'unicode']:
+            self._assert_same_as_xml2json(self.get_xml(name))
+
+    def test_case_blocks(self):
+        parsed_xml = parse_form_xml(FORM_XML)
+        # in the order of a walk of the form JSON, which visits both visits before the child
+        self.assertEqual(
+            [(case_block.caseblock['@case_id'], case_block.path) for case_block in parsed_xml.case_blocks],
+            [('case-1', ['visit']), ('case-3', ['visit']), ('case-2', ['child'])],
+        )
+
+    def test_case_updates_from_parsed_case_blocks(self):
+        parsed_xml = parse_form_xml(FORM_XML)
+        xform = Mock(form_data=parsed_xml.form_data, _parsed_xml=parsed_xml)
+        with patch('casexml.apps.case.xform._extract_case_blocks') as extract:
+            case_updates = get_case_updates(xform)
+        extract.assert_not_called()
+        self.assertEqual([update.id for update in case_updates], ['case-1', 'case-2', 'case-3'])
+
+    def test_ledger_elements(self):
+        parsed_xml = parse_form_xml(FORM_XML)
+        self.assertEqual(
+            [element.get('entity-id') for element in parsed_xml.ledger_elements],
+            ['case-1'],
+        )
+        self.assertEqual(len(parsed_xml.ledger_elements[0]), 2)
+
+    def test_fallback(self):
+        xml = FORM_XML.replace(b'<empty/>', b'<!-- a comment --><empty/>')
+        with patch('corehq.form_processor.parsers.form_xml.datadog_counter') as datadog_counter:
+            parsed_xml = self._assert_same_as_xml2json(xml)
+        datadog_counter.assert_called_once()
+        self.assertIsNone(parsed_xml.ledger_elements)
+
+    def test_namespaced_attribute(self):
+        xml = FORM_XML.replace(b'<empty/>', b'<empty xmlns:jr="http://openrosa.org/javarosa" jr:template=""/>')
+        self._assert_same_as_xml2json(xml)
+
+    def test_text(self):
+        self._assert_same_as_xml2json(FORM_XML.decode('utf-8'))
+
+    def test_invalid_xml(self):
+        with self.assertRaises(XMLSyntaxError):
+            parse_form_xml(b'<data xmlns="http://openrosa.org/formdesigner/form-xml"><unclosed></data>')
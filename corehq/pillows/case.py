@@ -77,7 +77,7 @@ def get_case_pillow(
         pillow_id='case-pillow', ucr_division=None,
         include_ucrs=None, exclude_ucrs=None,
         num_processes=1, process_num=0, ucr_configs=None, skip_ucr=False,
-        processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, topics=None, **kwargs):
+        processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE, topics=None, prefetch_chunks=0, **kwargs):
     """Return a pillow that processes cases. The processors include, UCR and elastic processors
 
     Processors:
@@ -129,7 +129,8 @@ def get_case_pillow(
         checkpoint=checkpoint,
         change_processed_event_handler=event_handler,
         processor=processors,
-        processor_chunk_size=processor_chunk_size
+        processor_chunk_size=processor_chunk_size,
+        prefetch_chunks=prefetch_chunks,
     )
 
 
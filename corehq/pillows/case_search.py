@@ -41,10 +41,11 @@ from dimagi.utils.parsing import json_format_datetime
 from pillowtop.checkpoints.manager import (
     get_checkpoint_for_elasticsearch_pillow,
 )
+from pillowtop.const import DEFAULT_PROCESSOR_CHUNK_SIZE
 from pillowtop.es_utils import initialize_index_and_mapping
 from pillowtop.feed.interface import Change
 from pillowtop.pillow.interface import ConstructedPillow
-from pillowtop.processors.elastic import ElasticProcessor
+from pillowtop.processors.elastic import BulkElasticProcessor
 from pillowtop.reindexer.change_providers.case import (
     get_domain_case_change_provider,
 )
@@ -96,9 +97,26 @@ def _get_case_properties(doc_dict):
     return base_case_properties + dynamic_mapping
 
 
-class CaseSearchPillowProcessor(ElasticProcessor):
+class CaseSearchPillowProcessor(BulkElasticProcessor):
+    """Processor to index cases of the domains that need the case search index
+
+    When the pillow processes changes in chunks, each chunk is sent to ES in a
+    single bulk request that indexes and deletes cases without first checking
+    whether they are already in the index.
+    """
 
     def process_change(self, change):
+        if self._needs_search_index(change):
+            super(CaseSearchPillowProcessor, self).process_change(change)
+
+    def process_changes_chunk(self, changes_chunk):
+        changes_chunk = [change for change in changes_chunk if self._needs_search_index(change)]
+        if not changes_chunk:
+            return [], []
+        return super(CaseSearchPillowProcessor, self).process_changes_chunk(changes_chunk)
+
+    @staticmethod
+    def _needs_search_index(change):
         assert isinstance(change, Change)
         if change.metadata is not None:
             # Comes from KafkaChangeFeed (i.e. running pillowtop)
@@ -107,8 +125,7 @@ class CaseSearchPillowProcessor(ElasticProcessor):
             # comes from ChangeProvider (i.e reindexing)
             domain = change.get_document()['domain']
 
-        if domain and domain_needs_search_index(domain):
-            super(CaseSearchPillowProcessor, self).process_change(change)
+        return bool(domain and domain_needs_search_index(domain))
 
 
 def get_case_search_processor():
@@ -186,7 +203,8 @@ class CaseSearchReindexerFactory(ReindexerFactory):
 
 
 def get_case_search_to_elasticsearch_pillow(pillow_id='CaseSearchToElasticsearchPillow', num_processes=1,
-                                            process_num=0, **kwargs):
+                                            process_num=0, processor_chunk_size=DEFAULT_PROCESSOR_CHUNK_SIZE,
+                                            **kwargs):
     # todo; To remove after full rollout of https://github.com/dimagi/commcare-hq/pull/21329/
     assert pillow_id == 'CaseSearchToElasticsearchPillow', 'Pillow ID is not allowed to change'
     checkpoint = get_checkpoint_for_elasticsearch_pillow(pillow_id, CASE_SEARCH_INDEX_INFO, topics.CASE_TOPICS)
@@ -206,6 +224,7 @@ def get_case_search_to_elasticsearch_pillow(pillow_id='CaseSearchToElasticsearch
         change_processed_event_handler=KafkaCheckpointEventHandler(
             checkpoint=checkpoint, checkpoint_frequency=100, change_feed=change_feed,
         ),
+        processor_chunk_size=processor_chunk_size,
     )
 
 
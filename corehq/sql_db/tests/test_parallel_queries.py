@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase
+
+from mock import MagicMock, patch
+
+from corehq.sql_db.util import iter_across_db_aliases, map_across_db_aliases
+
+DB_ALIASES = ['p1', 'p2', 'p3']
+ROWS = {
+    'p1': list(range(0, 3000, 3)),
+    'p2': list(range(1, 3000, 3)),
+    'p3': list(range(2, 3000, 3)),
+}
+
+
+def _get_rows(db_alias):
+    return iter(ROWS[db_alias])
+
+
+@patch('corehq.sql_db.util.datadog_histogram', new=MagicMock())
+class ParallelQueriesTest(SimpleTestCase):
+
+    def setUp(self):
+        self.connections = MagicMock()
+        self.connections.__getitem__.return_value.in_atomic_block = False
+        patcher = patch('corehq.sql_db.util.connections', self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_map(self):
+        self.assertEqual(
+            map_across_db_aliases(lambda db_alias: len(ROWS[db_alias]), DB_ALIASES),
+            [1000, 1000, 1000],
+        )
+
+    def test_map_error(self):
+        def get_count(db_alias):
+            if db_alias == 'p2':
+                raise ValueError(db_alias)
+            return 1
+
+        with self.assertRaises(ValueError):
+            map_across_db_aliases(get_count, DB_ALIASES)
+
+    def test_iter_unordered(self):
+        rows = list(iter_across_db_aliases(_get_rows, DB_ALIASES, chunk_size=10))
+        self.assertEqual(sorted(rows), list(range(3000)))
+        for db_alias, db_rows in ROWS.items():
+            self.assertEqual([row for row in rows if row % 3 == DB_ALIASES.index(db_alias)], db_rows)
+
+    def test_iter_merged(self):
+        rows = iter_across_db_aliases(_get_rows, DB_ALIASES, key=lambda row: row, chunk_size=10)
+        self.assertEqual(list(rows), list(range(3000)))
+
+    def test_iter_error(self):
+        def get_rows(db_alias):
+            yield 1
+            if db_alias == 'p2':
+                raise ValueError(db_alias)
+
+        with self.assertRaises(ValueError):
+            list(iter_across_db_aliases(get_rows, DB_ALIASES, chunk_size=1))
+
+    def test_iter_stop_early(self):
+        rows = iter_across_db_aliases(lambda db_alias: iter(range(100000)), DB_ALIASES, chunk_size=10)
+        self.assertEqual(len([next(rows) for _ in range(5)]), 5)
+        rows.close()
+
+    def test_serial_in_transaction(self):
+        self.connections.__getitem__.return_value.in_atomic_block = True
+        with patch('corehq.sql_db.util.ThreadPoolExecutor') as executor:
+            rows = list(iter_across_db_aliases(_get_rows, DB_ALIASES, key=lambda row: row))
+            counts = map_across_db_aliases(lambda db_alias: len(ROWS[db_alias]), DB_ALIASES)
+        executor.assert_not_called()
+        self.assertEqual(rows, list(range(3000)))
+        self.assertEqual(counts, [1000, 1000, 1000])
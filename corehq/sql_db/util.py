@@ -1,7 +1,12 @@
+import heapq
+import queue
 import random
 import re
+import threading
+import time
 import uuid
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from distutils.version import LooseVersion
 from functools import wraps
 
@@ -11,8 +16,10 @@ from django.db.utils import DEFAULT_DB_ALIAS, DatabaseError
 from django.db.utils import InterfaceError as DjangoInterfaceError
 
 from corehq.sql_db.config import plproxy_config, plproxy_standby_config
+from corehq.util.datadog.gauges import datadog_histogram
 from corehq.util.datadog.utils import load_counter_for_model
 from corehq.util.quickcache import quickcache
+from dimagi.utils.chunked import chunked
 from memoized import memoized
 from psycopg2._psycopg import InterfaceError as Psycopg2InterfaceError
 
@@ -43,7 +50,7 @@ REPLICATION_SQL_9_6 = """
 
 
 def paginate_query_across_partitioned_databases(model_class, q_expression, annotate=None, query_size=5000,
-                                                values=None, load_source=None):
+                                                values=None, load_source=None, parallel=False):
     """
     Runs a query across all partitioned databases in small chunks and produces a generator
     with the results.
@@ -59,9 +66,21 @@ def paginate_query_across_partitioned_databases(model_class, q_expression, annot
     :param values: (optional) If specified, should be a list of values to retrieve rather
     than retrieving entire objects.
 
+    :param parallel: (optional) If True, query the databases concurrently and
+    yield the results in the order they arrive rather than database by database.
+
     :return: A generator with the results
     """
     db_names = get_db_aliases_for_partitioned_query()
+    if parallel:
+        def _paginate_query(db_name):
+            return paginate_query(db_name, model_class, q_expression, annotate, query_size, values, load_source)
+
+        yield from iter_across_db_aliases(
+            _paginate_query, db_names, query_name=load_source or model_class.__name__
+        )
+        return
+
     for db_name in db_names:
         for row in paginate_query(db_name, model_class, q_expression, annotate, query_size, values, load_source):
             yield row
@@ -123,6 +142,155 @@ def paginate_query(db_name, model_class, q_expression, annotate=None, query_size
         filter_expression = {'{}__gt'.format(sort_col): value}
 
 
+def map_across_db_aliases(fn, db_aliases=None, query_name=None):
+    """
+    Calls ``fn(db_alias)`` for each database concurrently, e.g. to aggregate
+    the results of a query on each partitioned database:
+
+        total = sum(map_across_db_aliases(count_forms, query_name='count_forms'))
+
+    Each call starts a thread and opens a connection for each database, so
+    this is for queries that take much longer than that, like scans of a
+    domain's rows. Small indexed lookups are faster run serially.
+
+    :param fn: A function that takes a database alias
+    :param db_aliases: (optional) The aliases of the databases. Defaults to the
+    partitioned databases.
+    :param query_name: (optional) Name of the query in the per-database timing metric
+    :return: A list of the results, in the order of the database aliases
+    """
+    if db_aliases is None:
+        db_aliases = get_db_aliases_for_partitioned_query()
+    query_name = query_name or fn.__name__
+    if not _can_query_in_parallel(db_aliases):
+        return [_call_timed(fn, db_alias, query_name) for db_alias in db_aliases]
+
+    def _call_in_thread(db_alias):
+        try:
+            return _call_timed(fn, db_alias, query_name)
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(db_aliases)) as executor:
+        futures = [executor.submit(_call_in_thread, db_alias) for db_alias in db_aliases]
+        return [future.result() for future in futures]
+
+
+def iter_across_db_aliases(fn, db_aliases=None, key=None, query_name=None, chunk_size=1000):
+    """
+    Iterates over the rows of ``fn(db_alias)`` for each database, querying the
+    databases concurrently. Like ``map_across_db_aliases``, this is for long
+    queries.
+
+    :param fn: A function that takes a database alias and returns an iterable of rows
+    :param db_aliases: (optional) The aliases of the databases. Defaults to the
+    partitioned databases.
+    :param key: (optional) If specified, the rows of each database must be sorted
+    by ``key(row)``, and the rows of all the databases are merged in that order.
+    Otherwise the rows are yielded in the order they arrive.
+    :param query_name: (optional) Name of the query in the per-database timing metric
+    :param chunk_size: The number of rows each database's thread passes on at a time
+    :return: A generator with the rows. The first error raised by a database's
+    query is raised by the generator.
+    """
+    if db_aliases is None:
+        db_aliases = get_db_aliases_for_partitioned_query()
+    query_name = query_name or fn.__name__
+    if not _can_query_in_parallel(db_aliases):
+        row_iterables = [_iter_timed(fn, db_alias, query_name) for db_alias in db_aliases]
+        if key is not None:
+            yield from heapq.merge(*row_iterables, key=key)
+        else:
+            for rows in row_iterables:
+                yield from rows
+        return
+
+    stopped = threading.Event()
+    if key is not None:
+        chunk_queues = [queue.Queue(maxsize=2) for _ in db_aliases]
+    else:
+        chunk_queues = [queue.Queue(maxsize=2 * len(db_aliases))] * len(db_aliases)
+
+    def _put(chunks, item):
+        # gives up if the rows are no longer being consumed
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _query_in_thread(db_alias, chunks):
+        try:
+            for chunk in chunked(_iter_timed(fn, db_alias, query_name), chunk_size):
+                if not _put(chunks, chunk):
+                    return
+        except Exception as e:
+            _put(chunks, _QueryError(e))
+        finally:
+            connections.close_all()
+            _put(chunks, _QUERY_DONE)
+
+    def _iter_rows(chunks, num_threads):
+        while num_threads:
+            chunk = chunks.get()
+            if chunk is _QUERY_DONE:
+                num_threads -= 1
+            elif isinstance(chunk, _QueryError):
+                raise chunk.error
+            else:
+                yield from chunk
+
+    executor = ThreadPoolExecutor(max_workers=len(db_aliases))
+    try:
+        for db_alias, chunks in zip(db_aliases, chunk_queues):
+            executor.submit(_query_in_thread, db_alias, chunks)
+        if key is not None:
+            yield from heapq.merge(*[_iter_rows(chunks, 1) for chunks in chunk_queues], key=key)
+        else:
+            yield from _iter_rows(chunk_queues[0], len(db_aliases))
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False)
+
+
+_QUERY_DONE = object()
+
+
+class _QueryError(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _can_query_in_parallel(db_aliases):
+    # a thread has its own connections, which can't see the changes of a
+    # transaction that is open in this thread
+    return len(db_aliases) > 1 and not any(connections[db_alias].in_atomic_block for db_alias in db_aliases)
+
+
+def _call_timed(fn, db_alias, query_name):
+    start = time.time()
+    try:
+        return fn(db_alias)
+    finally:
+        _record_query_time(db_alias, query_name, time.time() - start)
+
+
+def _iter_timed(fn, db_alias, query_name):
+    start = time.time()
+    yield from fn(db_alias)
+    _record_query_time(db_alias, query_name, time.time() - start)
+
+
+def _record_query_time(db_alias, query_name, seconds):
+    datadog_histogram('commcare.sql.partitioned_query.duration', seconds, tags=[
+        'db:{}'.format(db_alias),
+        'query:{}'.format(query_name),
+    ])
+
+
 def estimate_partitioned_row_count(model_class, q_expression):
     """Estimate query row count summed across all partitions"""
     db_names = get_db_aliases_for_partitioned_query()
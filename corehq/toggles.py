@@ -618,6 +618,17 @@ UCR_SUM_WHEN_TEMPLATES = StaticToggle(
     help_link='https://commcare-hq.readthedocs.io/ucr.html#sumwhencolumn-and-sumwhentemplatecolumn',
 )
 
+UCR_COMPILED_EXPRESSIONS = StaticToggle(
+    'ucr_compiled_expressions',
+    'Evaluate UCR data source expressions and filters with the expression compiler',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Data sources in this domain compile their expressions and filters into python "
+        "functions instead of interpreting the specs for every document."
+    ),
+)
+
 ASYNC_RESTORE = StaticToggle(
     'async_restore',
     'Generate restore response in an asynchronous task to prevent timeouts',
@@ -1807,6 +1818,28 @@ LIVEQUERY_READ_FROM_STANDBYS = DynamicallyPredictablyRandomToggle(
     """
 )
 
+LIVEQUERY_PREFETCH_CASES = StaticToggle(
+    'livequery_prefetch_cases',
+    'Load the next batch of cases for a livequery restore while serializing the current one',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Restores in this domain load cases from the database in a background thread, "
+        "using one additional database connection per restore."
+    ),
+)
+
+CACHED_RESTORE_CASE_XML = StaticToggle(
+    'cached_restore_case_xml',
+    'Reuse the serialized XML of cases that have not changed between restores',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Livequery restores in this domain cache the XML of each case they serialize, "
+        "and reuse it for other restores until the case is modified."
+    ),
+)
+
 
 EXCEL_EXPORT_DATA_TYPING = StaticToggle(
     'excel_export_data_typing',
@@ -1815,3 +1848,69 @@ EXCEL_EXPORT_DATA_TYPING = StaticToggle(
     TAG_PRODUCT,
     [NAMESPACE_DOMAIN],
 )
+
+STREAMING_RESTORES = StaticToggle(
+    'streaming_restores',
+    'Send restores to the device while they are being generated',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Restores in this domain that don't request an item count are sent to the device as "
+        "they are generated, rather than after the whole restore has been written to disk."
+    ),
+)
+
+SHARED_RESTORE_SNAPSHOTS = StaticToggle(
+    'shared_restore_snapshots',
+    'Share the case payload of initial restores between users with the same owner ids',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Initial livequery restores in this domain reuse the cases of a recent initial restore "
+        "for the same owner ids. Cases modified since then are sent on the next sync."
+    ),
+)
+
+INCREMENTAL_SAVED_EXPORTS = StaticToggle(
+    'incremental_saved_exports',
+    'Rebuild daily saved exports from the rows of their previous build',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Daily saved form and case exports in this domain keep the rows generated for each "
+        "document, and only generate rows for documents that have changed since the last build."
+    ),
+)
+
+BULK_FORM_SUBMISSIONS = StaticToggle(
+    'bulk_form_submissions',
+    'Accept many forms in a single submission request',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Mobile workers in this domain can submit a queue of forms to the bulk receiver URL in one "
+        "request. The forms are processed in order and the cases they update are locked once."
+    ),
+)
+
+FAST_FORM_XML_PARSING = StaticToggle(
+    'fast_form_xml_parsing',
+    'Parse form submissions in a single pass over their XML',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Form submissions in this domain are converted to JSON by a streaming parser that also "
+        "collects their case blocks and ledger blocks, instead of by xml2json."
+    ),
+)
+
+COMPACT_SYNC_LOGS = StaticToggle(
+    'compact_sync_logs',
+    'Store the case state of sync logs in a compact binary encoding',
+    TAG_INTERNAL,
+    [NAMESPACE_DOMAIN],
+    description=(
+        "Sync logs saved in this domain store their case ids and index trees in a compressed "
+        "binary column rather than in the JSON document. Existing sync logs are still read."
+    ),
+)
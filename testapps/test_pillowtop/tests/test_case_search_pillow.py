@@ -1,7 +1,7 @@
 import uuid
 
-from django.test import override_settings, TestCase
-from mock import MagicMock, patch
+from django.test import override_settings, SimpleTestCase, TestCase
+from mock import MagicMock, Mock, patch
 
 from corehq.apps.case_search.const import SPECIAL_CASE_PROPERTIES_MAP
 from corehq.apps.case_search.exceptions import CaseSearchNotEnabledException
@@ -19,6 +19,7 @@ from corehq.elastic import get_es_new
 from corehq.form_processor.tests.utils import FormProcessorTestUtils
 from corehq.pillows.case import get_case_pillow
 from corehq.pillows.case_search import (
+    CaseSearchPillowProcessor,
     CaseSearchReindexerFactory,
     delete_case_search_cases,
     domains_needing_search_index,
@@ -28,8 +29,10 @@ from corehq.pillows.mappings.case_search_mapping import (
     CASE_SEARCH_INDEX_INFO,
 )
 from corehq.util.elastic import ensure_index_deleted
+from corehq.util.es.interface import ElasticsearchInterface
 from corehq.util.test_utils import create_and_save_a_case
 from pillowtop.es_utils import initialize_index_and_mapping
+from pillowtop.feed.interface import Change, ChangeMeta
 
 
 class CaseSearchPillowTest(TestCase):
@@ -183,3 +186,45 @@ class CaseSearchPillowTest(TestCase):
                    MagicMock(return_value=[domain])):
             CaseSearchReindexerFactory(domain=domain).build().reindex()
         return case
+
+
+class CaseSearchPillowProcessorTest(SimpleTestCase):
+
+    def _change(self, case_id, domain, deleted=False):
+        return Change(
+            case_id, case_id,
+            document={'_id': case_id, 'domain': domain, 'doc_type': 'CommCareCase'},
+            deleted=deleted,
+            document_store=Mock(),
+            metadata=ChangeMeta(
+                document_id=case_id, data_source_type='sql', data_source_name='case-sql',
+                domain=domain, is_deletion=deleted,
+            ),
+        )
+
+    @patch('corehq.pillows.case_search.domains_needing_search_index', MagicMock(return_value={'enabled'}))
+    def test_process_changes_chunk(self):
+        elasticsearch = Mock()
+        processor = CaseSearchPillowProcessor(elasticsearch, CASE_SEARCH_INDEX_INFO)
+        changes = [
+            self._change('1', 'enabled'),
+            self._change('2', 'disabled'),
+            self._change('3', 'enabled', deleted=True),
+        ]
+        with patch.object(ElasticsearchInterface, 'bulk_ops', return_value=(2, [])) as bulk_ops:
+            self.assertEqual(([], []), processor.process_changes_chunk(changes))
+
+        self.assertEqual(bulk_ops.call_count, 1)
+        self.assertEqual(
+            {(action['_op_type'], action['_id']) for action in bulk_ops.call_args[0][0]},
+            {('index', '1'), ('delete', '3')},
+        )
+        # cases are indexed and deleted without checking whether they are in the index
+        self.assertFalse(elasticsearch.exists.called)
+
+    @patch('corehq.pillows.case_search.domains_needing_search_index', MagicMock(return_value=set()))
+    def test_process_changes_chunk_no_enabled_domains(self):
+        processor = CaseSearchPillowProcessor(Mock(), CASE_SEARCH_INDEX_INFO)
+        with patch.object(ElasticsearchInterface, 'bulk_ops') as bulk_ops:
+            self.assertEqual(([], []), processor.process_changes_chunk([self._change('1', 'disabled')]))
+        self.assertFalse(bulk_ops.called)